@@ -1,7 +1,29 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g
 from flask_cors import CORS
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import traceback
+import asyncio
+import gc
+import json
+import logging
+import math
 import os
+import threading
+
+from cache_janitor import CacheJanitor
+from circuit_breaker import breaker_metrics
+from deadline import Deadline
+from hot_reload import SnapshotReloader
+from profile_warmup import ProfileWarmer
+from result_pages import PageStore
+from scoring import resolve_weights
+from pool_artifact import PoolArtifact, resolve_artifact_dir
+from logging_setup import configure_logging, set_request_id, reset_request_id, request_id_var
+
+# 服务端默认安静模式（WARNING 以上，JSON 输出），可用 OPENRANK_LOG_MODE=cli 切换为详细模式
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # 直接导入用户提供的推荐器模块
 try:
@@ -12,11 +34,184 @@ except Exception:
 app = Flask(__name__, static_folder='.')
 CORS(app)
 
+# 候选池产物目录（pool_artifact.py build 的输出，可为含 LATEST 的根目录）
+POOL_ARTIFACT = os.environ.get('OPENRANK_POOL_ARTIFACT', 'artifacts')
+_recommender = None
+_recommender_lock = threading.Lock()
+# 快照版本号：每次热加载切换 +1
+_snapshot_version = 0
+# 各快照异步 HTTP 客户端上进行中的异步请求数；热加载换下的旧客户端在其请求全部完成后
+# 由事件循环关闭（aiohttp 会话只能在创建它的事件循环中关闭）
+_http_client_lock = threading.Lock()
+_http_clients_inflight = Counter()
+_retired_http_clients = []
+
+
+def _build_recommender(verify=False):
+    """
+    构建推荐器快照：优先只读加载离线产物（LATEST 指向的最新版本）；产物不存在时联网构建。
+    verify=True 时先逐文件校验产物哈希（热加载切换前），worker 启动时只核对清单
+    """
+    if os.path.exists(POOL_ARTIFACT):
+        return SmartRepoRecommender(pool_artifact=PoolArtifact.load(POOL_ARTIFACT, verify=verify))
+    logger.warning("[服务] 未找到候选池产物 %s，改为联网构建（建议先运行 pool_artifact.py build）", POOL_ARTIFACT)
+    return SmartRepoRecommender()
+
+
+def _install_recommender(recommender):
+    # 调用方持有 _recommender_lock；一次赋值完成切换
+    global _recommender, _snapshot_version
+    with _http_client_lock:
+        if _recommender is not None and _recommender.http_client is not recommender.http_client:
+            _retired_http_clients.append(_recommender.http_client)
+        _recommender = recommender
+    _snapshot_version += 1
+    return _snapshot_version
+
+
+def _swap_recommender(recommender):
+    """原子切换共享推荐器：新请求立即使用新快照，已取得旧快照的请求在旧快照上完成"""
+    with _recommender_lock:
+        return _install_recommender(recommender)
+
+
+def get_recommender():
+    """进程内共享的推荐器（首次调用时构建）"""
+    if _recommender is None:
+        with _recommender_lock:
+            if _recommender is None:
+                _install_recommender(_build_recommender())
+                _reloader.mark_current()
+    return _recommender
+
+
+def _data_fingerprint():
+    """热加载监视的数据源指纹：产物模式为 LATEST 指向的产物目录，联网模式为 top_300 导出的最新修改时间"""
+    if os.path.exists(POOL_ARTIFACT):
+        return resolve_artifact_dir(POOL_ARTIFACT)
+    if _recommender is not None:
+        return _recommender.top300_data_mtime()
+    return None
+
+
+_reloader = SnapshotReloader(lambda: _build_recommender(verify=True), _swap_recommender, fingerprint=_data_fingerprint)
+
+
+def preload():
+    """
+    在 master 进程 fork 出 worker 之前加载候选池产物（gunicorn --preload 时导入即执行）：
+    产物数组为只读内存映射，worker 共享页缓存；gc.freeze() 把已加载对象移出 GC 跟踪，
+    避免 worker 中的垃圾回收触碰这些对象导致写时复制
+    """
+    if SmartRepoRecommender is None or not os.path.exists(POOL_ARTIFACT):
+        return
+    get_recommender()
+    gc.freeze()
+
+
+# OPENRANK_PRELOAD=0 时改为首个请求时再加载
+if os.environ.get('OPENRANK_PRELOAD', '1') != '0':
+    preload()
+
+
+# 后台任务：每个 worker 进程首个请求时启动（fork 前启动的线程不会被子进程继承）
+# - 缓存清理：多进程间由锁文件互斥；OPENRANK_CACHE_GC_INTERVAL=0 关闭
+# - 热加载监视：轮询产物 LATEST / top_300 导出，变化时后台重载并切换快照；OPENRANK_RELOAD_INTERVAL=0 关闭
+CACHE_DIR = os.path.abspath('cache')  # 与 SmartRepoRecommender.cache_dir 一致
+CACHE_GC_INTERVAL = float(os.environ.get('OPENRANK_CACHE_GC_INTERVAL') or 3600)
+RELOAD_INTERVAL = float(os.environ.get('OPENRANK_RELOAD_INTERVAL') or 60)
+_cache_janitor = None
+_background_pid = None
+
+
+def ensure_background_tasks():
+    global _cache_janitor, _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _recommender_lock:
+        if _background_pid != os.getpid():
+            if CACHE_GC_INTERVAL > 0:
+                _cache_janitor = CacheJanitor.from_env(CACHE_DIR)
+                _cache_janitor.start(CACHE_GC_INTERVAL)
+            if RELOAD_INTERVAL > 0:
+                _reloader.watch(RELOAD_INTERVAL)
+            _background_pid = os.getpid()
+
+
+@app.before_request
+def _start_background_tasks():
+    ensure_background_tasks()
+
+
+@app.before_request
+def _bind_request_id():
+    # 每个请求绑定一个请求ID（优先沿用上游传入的 X-Request-ID），日志记录自动携带
+    g.request_id_token = set_request_id(request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def _expose_request_id(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+
+@app.teardown_request
+def _unbind_request_id(exc=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        reset_request_id(token)
+
 @app.route('/')
 def index():
     return send_from_directory('.', '前端设计.html')
 
 
+# 单个 /recommend 请求的时间预算（秒），请求体中的 budget_ms 可覆盖；预算耗尽时返回部分结果
+REQUEST_BUDGET = float(os.environ.get('OPENRANK_REQUEST_BUDGET') or 10)
+
+
+def _valid_budget(budget_ms):
+    """budget_ms 缺省，或为正的有限数（毫秒，允许数字字符串）"""
+    if budget_ms is None:
+        return True
+    if isinstance(budget_ms, bool) or not isinstance(budget_ms, (int, float, str)):
+        return False
+    try:
+        value = float(budget_ms)
+    except ValueError:
+        return False
+    return math.isfinite(value) and value > 0
+
+
+def _request_deadline(data):
+    # budget_ms 已由 _recommend_precheck 校验
+    budget_ms = data.get('budget_ms')
+    return Deadline(float(budget_ms) / 1000 if budget_ms is not None else REQUEST_BUDGET)
+
+
+# 分页：/recommend 的排名结果在服务端保留 OPENRANK_PAGE_TTL 秒，响应中的 next_cursor 交给 /recommend/next 取下一页；
+# 每个多样性分组保留 OPENRANK_PAGE_LIMIT 页（默认 5）所需的候选
+PAGE_LIMIT = int(os.environ.get('OPENRANK_PAGE_LIMIT') or 5)
+_page_store = PageStore.from_env()
+
+
+def _first_page(pages, username, snapshot_id):
+    """保存排名结果，返回首页响应字段"""
+    session_id = _page_store.save(pages, {'username': username, 'snapshot': snapshot_id})
+    return {'results': pages.page(0), 'page': 0, 'next_cursor': _page_store.cursor(session_id, pages, 1)}
+
+
+def _recommend_precheck(username, budget_ms=None):
+    """/recommend 参数与环境检查，返回 (错误响应体, 状态码)，通过时返回 None"""
+    if SmartRepoRecommender is None:
+        return {'ok': False, 'error': '无法导入 advanced_backup.SmartRepoRecommender，请检查文件是否存在且可导入。'}, 500
+    if not username:
+        return {'ok': False, 'error': '缺少 username 参数'}, 400
+    if not _valid_budget(budget_ms):
+        return {'ok': False, 'error': 'budget_ms 必须为正数（毫秒）'}, 400
+    return None
+
+
 @app.route('/recommend', methods=['POST'])
 def recommend():
     data = request.json or {}
@@ -25,20 +220,164 @@ def recommend():
     username = data.get('username')
     top_n = int(data.get('top_n') or 8)
 
-    if SmartRepoRecommender is None:
-        return jsonify({'ok': False, 'error': '无法导入 advanced_backup.SmartRepoRecommender，请检查文件是否存在且可导入。'}), 500
+    error = _recommend_precheck(username, data.get('budget_ms'))
+    if error is not None:
+        return jsonify(error[0]), error[1]
 
-    if not username:
-        return jsonify({'ok': False, 'error': '缺少 username 参数'}), 400
+    try:
+        deadline = _request_deadline(data)
+        recommender = get_recommender().with_credentials(github_token=token, opendigger_api_key=opendigger)
+        pages = recommender.generate_ranked_pages(username, page_size=top_n, max_pages=PAGE_LIMIT, deadline=deadline)
+        return jsonify({'ok': True, **_first_page(pages, username, recommender.snapshot_id),
+                        'snapshot': recommender.snapshot_id, **deadline.report()})
+    except Exception as e:
+        logger.exception("[recommend] 推荐失败 username=%s", username)
+        return jsonify({'ok': False, 'error': str(e), 'trace': traceback.format_exc()}), 500
+
+
+@app.route('/recommend/next', methods=['POST'])
+def recommend_next():
+    # 凭游标取下一页：直接读取保存的排名结果，不重新分析画像与打分
+    data = request.json or {}
+    cursor = data.get('cursor')
+    if not isinstance(cursor, str) or not cursor:
+        return jsonify({'ok': False, 'error': 'cursor 必须为非空字符串'}), 400
+    resolved = _page_store.resolve(cursor)
+    if resolved is None:
+        return jsonify({'ok': False, 'error': '游标无效或已过期，请重新调用 /recommend'}), 404
+    session_id, pages, meta, index = resolved
+    return jsonify({'ok': True, 'results': pages.page(index), 'page': index,
+                    'next_cursor': _page_store.cursor(session_id, pages, index + 1),
+                    'username': meta.get('username'), 'snapshot': meta.get('snapshot')})
+
+
+@app.route('/rerank', methods=['POST'])
+def rerank():
+    """
+    按自定义权重重排（调参 / A/B 权重试验），各打分分量按用户缓存，每组权重只需一次加权求和：
+    {"username": ..., "weights": {"skill": 0.5, ...}} 或 {"username": ..., "variants": {"A": {...}, "B": {...}}}
+    """
+    data = request.json or {}
+    username = data.get('username')
+    top_n = int(data.get('top_n') or 8)
+    error = _recommend_precheck(username)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    variants = data.get('variants')
+    if variants is not None and not isinstance(variants, dict):
+        return jsonify({'ok': False, 'error': 'variants 必须是 {名称: 权重} 对象'}), 400
+    weight_sets = [data.get('weights')] if variants is None else list(variants.values())
+    if any(weights is not None and not isinstance(weights, dict) for weights in weight_sets):
+        return jsonify({'ok': False, 'error': 'weights 必须是 {分量: 权重} 对象'}), 400
 
     try:
-        recommender = SmartRepoRecommender(github_token=token, opendigger_api_key=opendigger)
-        results = recommender.generate_recommendation(username, top_n=top_n)
-        return jsonify({'ok': True, 'results': results})
+        recommender = get_recommender().with_credentials(github_token=data.get('token'),
+                                                         opendigger_api_key=data.get('opendigger'))
+        if variants is None:
+            results = recommender.rerank(username, data.get('weights'), top_n=top_n)
+            return jsonify({'ok': True, 'weights': resolve_weights(data.get('weights')), 'results': results,
+                            'snapshot': recommender.snapshot_id})
+        payload = {name: {'weights': resolve_weights(weights), 'results': recommender.rerank(username, weights, top_n=top_n)}
+                   for name, weights in variants.items()}
+        return jsonify({'ok': True, 'variants': payload, 'snapshot': recommender.snapshot_id})
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
     except Exception as e:
+        logger.exception("[rerank] 重排失败 username=%s", username)
         return jsonify({'ok': False, 'error': str(e), 'trace': traceback.format_exc()}), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 各上游（GitHub / OpenDigger）熔断器的状态与计数
+    return jsonify(_metrics_payload())
+
+
+def _metrics_payload():
+    return {
+        'ok': True,
+        'upstreams': breaker_metrics(),
+        'snapshot': {'version': _snapshot_version,
+                     'id': _recommender.snapshot_id if _recommender is not None else None,
+                     'reload': _reloader.status()},
+    }
+
+
+def _admin_allowed():
+    """管理接口鉴权：设置 OPENRANK_ADMIN_TOKEN 时校验 X-Admin-Token，否则只允许本机访问"""
+    admin_token = os.environ.get('OPENRANK_ADMIN_TOKEN')
+    if admin_token:
+        return request.headers.get('X-Admin-Token') == admin_token
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    # 后台重新加载候选池快照（产物模式加载 LATEST 指向的产物，联网模式重新读取 top_300 导出并构建），完成后原子切换
+    if not _admin_allowed():
+        return jsonify({'ok': False, 'error': '无权访问'}), 403
+    if SmartRepoRecommender is None:
+        return jsonify({'ok': False, 'error': '推荐器不可用'}), 500
+    started, status = _reloader.reload(reason='管理接口')
+    return jsonify({'ok': True, 'started': started, 'reload': status, 'version': _snapshot_version}), 202
+
+
+@app.route('/admin/reload', methods=['GET'])
+def admin_reload_status():
+    if not _admin_allowed():
+        return jsonify({'ok': False, 'error': '无权访问'}), 403
+    return jsonify(_metrics_payload()['snapshot'])
+
+
+# 画像预热任务（每个进程同一时刻只运行一个；画像缓存在磁盘上，所有 worker 共享预热结果）
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+@app.route('/warmup', methods=['POST'])
+def start_warmup():
+    # 预热会以服务端凭据在后台持续访问 GitHub，与 /admin/reload 同样需要管理权限
+    global _warmer
+    if not _admin_allowed():
+        return jsonify({'ok': False, 'error': '无权访问'}), 403
+    data = request.json or {}
+    if SmartRepoRecommender is None:
+        return jsonify({'ok': False, 'error': '推荐器不可用'}), 500
+    usernames = data.get('usernames') or []
+    if not isinstance(usernames, list) or not all(isinstance(name, str) for name in usernames):
+        return jsonify({'ok': False, 'error': 'usernames 需为用户名列表'}), 400
+    orgs = data.get('org') or []
+    if isinstance(orgs, str):
+        orgs = [orgs]
+    if not isinstance(orgs, list) or not all(isinstance(org, str) for org in orgs):
+        return jsonify({'ok': False, 'error': 'org 需为组织名或组织名列表'}), 400
+    if not usernames and not orgs:
+        return jsonify({'ok': False, 'error': '缺少 usernames 或 org 参数'}), 400
+    rate = data.get('requests_per_hour')
+    try:
+        rate = float(rate) if rate else None
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'requests_per_hour 需为数值'}), 400
+    recommender = get_recommender().with_credentials(github_token=data.get('token'))
+    with _warmer_lock:
+        if _warmer is not None and _warmer.running:
+            return jsonify({'ok': False, 'error': '已有预热任务在运行', 'progress': _warmer.progress()}), 409
+        # 组织成员在预热线程中展开，请求立即返回
+        _warmer = ProfileWarmer(recommender, usernames, requests_per_hour=rate, orgs=orgs)
+        _warmer.start()
+        progress = _warmer.progress()
+    return jsonify({'ok': True, 'progress': progress}), 202
+
+
+@app.route('/warmup', methods=['GET'])
+def warmup_progress():
+    if not _admin_allowed():
+        return jsonify({'ok': False, 'error': '无权访问'}), 403
+    if _warmer is None:
+        return jsonify({'ok': True, 'progress': None})
+    return jsonify({'ok': True, 'progress': _warmer.progress()})
+
+
 @app.route('/mock_recommend', methods=['GET'])
 def mock_recommend():
     # 返回示例数据，便于前端调试特效与链接
@@ -65,6 +404,134 @@ def mock_recommend():
     return jsonify({'ok': True, 'results': sample})
 
 
+# ---- ASGI 入口（异步）----
+# uvicorn app:asgi_app 运行：POST /recommend 为原生异步处理，等待 GitHub 响应期间不占用线程
+# （需安装 aiohttp，见 async_http.py），画像分析与打分在独立线程池中执行；
+# 其余路由经 asgiref 转交上面的 Flask 应用。可选依赖：pip install uvicorn aiohttp asgiref
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # 可选依赖
+    WsgiToAsgi = None
+
+_wsgi_fallback = WsgiToAsgi(app) if WsgiToAsgi is not None else None
+_scoring_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('OPENRANK_SCORING_THREADS') or os.cpu_count() or 4),
+    thread_name_prefix='scoring')
+
+
+async def _close_retired_http_clients(force=False):
+    """关闭热加载换下的旧快照的异步 HTTP 会话（已没有进行中的请求的；force 时全部关闭）"""
+    with _http_client_lock:
+        idle = [client for client in _retired_http_clients if force or not _http_clients_inflight[client]]
+        _retired_http_clients[:] = [client for client in _retired_http_clients if client not in idle]
+    for client in idle:
+        await client.close()
+
+
+async def recommend_async(data):
+    """/recommend 的异步实现，返回 (响应体, 状态码)"""
+    ensure_background_tasks()
+    username = data.get('username')
+    error = _recommend_precheck(username, data.get('budget_ms'))
+    if error is not None:
+        return error
+    client = None
+    try:
+        top_n = int(data.get('top_n') or 8)
+        deadline = _request_deadline(data)
+        # 首次加载候选池较慢，放到线程中执行（to_thread 会传递请求ID上下文）
+        if _recommender is None:
+            await asyncio.to_thread(get_recommender)
+        # 取快照与登记在途请求在同一把锁内完成，切换不会在两者之间关闭该快照的会话
+        with _http_client_lock:
+            shared = _recommender
+            client = shared.http_client
+            _http_clients_inflight[client] += 1
+        recommender = shared.with_credentials(github_token=data.get('token'), opendigger_api_key=data.get('opendigger'))
+        pages = await recommender.generate_ranked_pages_async(
+            username, page_size=top_n, max_pages=PAGE_LIMIT, executor=_scoring_executor, deadline=deadline)
+        return {'ok': True, **_first_page(pages, username, recommender.snapshot_id),
+                'snapshot': recommender.snapshot_id, **deadline.report()}, 200
+    except Exception as e:
+        logger.exception("[recommend] 推荐失败 username=%s", username)
+        return {'ok': False, 'error': str(e), 'trace': traceback.format_exc()}, 500
+    finally:
+        if client is not None:
+            with _http_client_lock:
+                _http_clients_inflight[client] -= 1
+                if not _http_clients_inflight[client]:
+                    del _http_clients_inflight[client]
+        if _retired_http_clients:
+            await _close_retired_http_clients()
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _send_json(send, payload, status, request_id=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii')),
+               (b'access-control-allow-origin', b'*')]
+    if request_id:
+        headers.append((b'x-request-id', request_id.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            ensure_background_tasks()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _recommender is not None:
+                await _recommender.http_client.close()
+            await _close_retired_http_clients(force=True)
+            _scoring_executor.shutdown(wait=False)
+            if _cache_janitor is not None:
+                _cache_janitor.stop(timeout=1)
+            _reloader.stop(timeout=1)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI 入口：POST /recommend 原生异步处理，其余请求转交 Flask"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and scope['path'] == '/recommend' and scope['method'] == 'POST':
+        headers = dict(scope.get('headers') or [])
+        token = set_request_id(headers.get(b'x-request-id', b'').decode('latin-1') or None)
+        try:
+            try:
+                data = json.loads(await _read_body(receive) or b'{}')
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                payload, status = await recommend_async(data)
+            else:
+                payload, status = {'ok': False, 'error': '请求体不是合法的 JSON 对象'}, 400
+            await _send_json(send, payload, status, request_id_var.get())
+        finally:
+            reset_request_id(token)
+        return
+    if scope['type'] == 'http' and scope['path'] == '/metrics' and scope['method'] == 'GET':
+        await _send_json(send, _metrics_payload(), 200)
+        return
+    if _wsgi_fallback is None:
+        await _send_json(send, {'ok': False, 'error': '该路由需要安装 asgiref 才能在 ASGI 模式下访问'}, 404)
+        return
+    await _wsgi_fallback(scope, receive, send)
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting frontend+wrapper on http://127.0.0.1:{port}/")
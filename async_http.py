@@ -0,0 +1,55 @@
+"""
+异步 HTTP 客户端（服务端异步路径使用）
+- 安装 aiohttp 时使用原生异步连接池：等待上游响应期间不占用任何线程，
+  单进程可同时挂起大量请求
+- 未安装时退化为在默认线程池中调用 requests（行为一致，但每个在途请求占用一个线程）
+可选依赖：pip install aiohttp
+"""
+import asyncio
+import logging
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpClient:
+    """异步 GET 客户端，返回 (状态码, JSON 数据, 响应头)；非 200 响应的数据为 None"""
+
+    def __init__(self, max_connections=100):
+        self.max_connections = max_connections
+        self._session = None
+        self._session_loop = None
+
+    @property
+    def native(self):
+        """是否使用原生异步实现（aiohttp）"""
+        return aiohttp is not None
+
+    async def _get_session(self):
+        # aiohttp 会话绑定创建它的事件循环，循环变化时重新创建
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def get_json(self, url, headers=None, timeout=30):
+        if aiohttp is None:
+            response = await asyncio.to_thread(requests.get, url, headers=headers, timeout=timeout)
+            return response.status_code, (response.json() if response.status_code == 200 else None), response.headers
+        session = await self._get_session()
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            data = await response.json(content_type=None) if response.status == 200 else None
+            return response.status, data, response.headers
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,255 @@
+"""
+离线批量推荐
+读取用户名单，用线程池并发为每个用户生成推荐，逐行写入 JSON Lines（每行一个用户）。
+需要联网的用户（画像与仓库列表均未缓存）按速率预算排队，预算与画像预热相同
+（profile_warmup.RateBudget，默认 GitHub 限额的一半，所有 worker 共享）；已缓存的用户不受限。
+
+断点续跑：输出文件本身即检查点——每个用户写完一行立即 flush，每次进度输出时 fsync。
+重新运行同一命令时先读取已有输出，跳过已完成的用户（末尾写了一半的行会被截掉），从中断处继续；
+Ctrl+C 时不再派发新用户，等进行中的用户写完后退出。
+失败的用户（含仓库列表获取失败、只能给出默认偏好的用户）记入 <输出>.errors.jsonl，不算完成，下次运行时重试。
+
+进度：每隔 --interval 秒输出已完成数、本次运行的吞吐（用户/秒）与按该吞吐估算的剩余时间。
+
+用法：
+    python batch_recommend.py users.txt -o recommendations.jsonl [--workers 4] [--top-n 8] [--rate 1000]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from logging_setup import set_request_id, reset_request_id
+from profile_warmup import RateBudget, _dedupe, load_usernames, user_repos_cached
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+
+
+def _json_default(value):
+    # 候选中可能残留 numpy 标量 / 数组
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def load_checkpoint(path):
+    """
+    读取已有输出，返回已完成的用户名（小写）集合；
+    末尾不完整的行（上次写到一半被中断）直接截掉，中间损坏的行跳过
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+') as f:
+        lines = f.readlines()
+        valid = 0
+        for i, line in enumerate(lines):
+            try:
+                record = json.loads(line) if line.endswith(b'\n') else None
+            except ValueError:
+                record = None
+            if record is None or 'username' not in record:
+                if i == len(lines) - 1:
+                    logger.warning("[批量推荐] 截掉输出末尾不完整的行（%d 字节）", len(line))
+                    f.truncate(valid)
+                    break
+                logger.warning("[批量推荐] 跳过输出中损坏的第 %d 行", i + 1)
+            else:
+                done.add(record['username'].lower())
+            valid += len(line)
+    return done
+
+
+class BatchRecommender:
+    """线程池批量推荐 + 速率预算 + 逐行输出（输出即检查点）"""
+
+    def __init__(self, recommender, usernames, output, workers=DEFAULT_WORKERS, top_n=8,
+                 requests_per_hour=None, clock=time.monotonic):
+        """
+        recommender: SmartRepoRecommender（各 worker 共享）
+        output: 输出 JSON Lines 路径；已存在时在其后追加，跳过其中已完成的用户
+        requests_per_hour: 需联网用户每小时的上限，None 时取限额的一半
+        """
+        self.recommender = recommender
+        self.usernames = _dedupe(usernames)
+        self.output = output
+        self.errors_path = output + '.errors.jsonl'
+        self.workers = max(1, int(workers))
+        self.top_n = top_n
+        self._clock = clock
+        self._stop = threading.Event()
+        self._budget = RateBudget(recommender, requests_per_hour, stop=self._stop, clock=clock)
+        self._lock = threading.Lock()
+        self._progress = {
+            'state': 'pending', 'total': len(self.usernames), 'resumed': 0, 'done': 0,
+            'failed': 0, 'cached': 0, 'fetched': 0, 'requests': 0,
+            'users_per_second': None, 'eta_seconds': None, 'elapsed_seconds': 0.0,
+        }
+        self._started = None
+
+    def progress(self):
+        with self._lock:
+            progress = dict(self._progress)
+        progress['requests'] = self._budget.requests
+        if self._started is not None:
+            elapsed = self._clock() - self._started
+            processed = progress['done'] + progress['failed'] - progress['resumed']
+            remaining = progress['total'] - progress['done']
+            progress['elapsed_seconds'] = round(elapsed, 1)
+            if processed > 0 and elapsed > 0:
+                rate = processed / elapsed
+                progress['users_per_second'] = round(rate, 3)
+                progress['eta_seconds'] = round(remaining / rate)
+        return progress
+
+    def _count(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._progress[key] += 1
+
+    def _recommend_one(self, username):
+        """为一个用户生成推荐，返回 (是否成功, 输出记录)；停止时返回 None"""
+        token = set_request_id('batch')
+        started = time.perf_counter()
+        try:
+            recommender = self.recommender
+            cached = recommender._load_cached_profile(username) is not None
+            if not cached:
+                cached = user_repos_cached(recommender, username)
+                if not cached and not self._budget.acquire():
+                    return None
+                # 与画像预热一致：仓库列表获取失败（不存在、限流或网络故障）记为失败，
+                # 不写默认偏好的推荐，下次运行重试；成功时画像已写入缓存，下面直接命中
+                user_repos = recommender._get_user_repos(username)
+                if user_repos is None:
+                    logger.warning("[批量推荐] 无法获取仓库列表，记为失败: %s", username)
+                    return False, {'username': username, 'error': '无法获取仓库列表（用户不存在、限流或网络故障）',
+                                   'at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+                recommender._build_user_profile(username, user_repos)
+            results = recommender.generate_recommendation(username, top_n=self.top_n)
+            self._count('cached' if cached else 'fetched')
+            return True, {'username': username, 'results': results,
+                          'snapshot': getattr(recommender, 'snapshot_id', None),
+                          'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+                          'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        except Exception as e:
+            logger.warning("[批量推荐] 生成推荐失败 %s: %s", username, e)
+            return False, {'username': username, 'error': str(e), 'at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        finally:
+            reset_request_id(token)
+
+    def stop(self):
+        """不再派发新用户，正在排队等待速率预算的用户立即放弃（下次运行重试）"""
+        self._stop.set()
+
+    def run(self, report=None, interval=5.0):
+        """
+        阻塞执行直到完成、stop() 或 Ctrl+C；report(progress) 每 interval 秒调用一次。
+        返回最终进度
+        """
+        done = load_checkpoint(self.output)
+        pending_names = [name for name in self.usernames if name.lower() not in done]
+        resumed = len(self.usernames) - len(pending_names)
+        with self._lock:
+            self._progress.update(state='running', resumed=resumed, done=resumed)
+        self._started = self._clock()
+        if resumed:
+            logger.info("[批量推荐] 从检查点继续：已完成 %d，剩余 %d", resumed, len(pending_names))
+        names = iter(pending_names)
+        in_flight = set()
+        last_report = self._clock()
+        with open(self.output, 'a', encoding='utf-8', newline='\n') as out, \
+                open(self.errors_path, 'a', encoding='utf-8', newline='\n') as errors, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='batch') as pool:
+            try:
+                while True:
+                    # 只保持少量在途任务：名单很长时不一次性提交，中断时也能尽快停下
+                    while len(in_flight) < self.workers * 2 and not self._stop.is_set():
+                        name = next(names, None)
+                        if name is None:
+                            break
+                        in_flight.add(pool.submit(self._recommend_one, name))
+                    if not in_flight:
+                        break
+                    finished, in_flight = wait(in_flight, timeout=interval, return_when=FIRST_COMPLETED)
+                    self._write(finished, out, errors)
+                    if self._clock() - last_report >= interval:
+                        last_report = self._clock()
+                        self._sync(out, errors)
+                        if report:
+                            report(self.progress())
+            except KeyboardInterrupt:
+                logger.warning("[批量推荐] 收到中断，等待 %d 个进行中的用户完成后退出", len(in_flight))
+                self.stop()
+                self._write(wait(in_flight)[0], out, errors)
+            self._sync(out, errors)
+        with self._lock:
+            self._progress['state'] = 'stopped' if self._stop.is_set() else 'done'
+        progress = self.progress()
+        logger.info("[批量推荐] 结束：完成 %d/%d（本次 %d），失败 %d，%d 次速率预算请求",
+                    progress['done'], progress['total'], progress['done'] - progress['resumed'],
+                    progress['failed'], progress['requests'])
+        return progress
+
+    def _write(self, futures, out, errors):
+        for future in futures:
+            outcome = future.result()
+            if outcome is None:
+                continue
+            ok, record = outcome
+            target = out if ok else errors
+            target.write(json.dumps(record, ensure_ascii=False, default=_json_default) + '\n')
+            target.flush()
+            self._count('done' if ok else 'failed')
+
+    @staticmethod
+    def _sync(*files):
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _format_progress(progress):
+    line = f"进度 {progress['done']}/{progress['total']}（续跑跳过 {progress['resumed']}），失败 {progress['failed']}"
+    if progress['users_per_second']:
+        line += f"，吞吐 {progress['users_per_second']:.2f} 用户/秒，预计剩余 {progress['eta_seconds']} 秒"
+    return line
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='批量生成推荐（可中断续跑，输出 JSON Lines）')
+    parser.add_argument('users', help='名单文件（每行一个用户名）')
+    parser.add_argument('-o', '--output', required=True, help='输出 JSON Lines（已存在时跳过其中已完成的用户）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'并发数（默认 {DEFAULT_WORKERS}）')
+    parser.add_argument('--top-n', type=int, default=8, help='每个用户的推荐数（默认 8）')
+    parser.add_argument('--token', default=os.environ.get('GITHUB_TOKEN'), help='GitHub Token（默认取 GITHUB_TOKEN）')
+    parser.add_argument('--rate', type=float, default=None, help='需联网用户每小时上限（默认限额的一半）')
+    parser.add_argument('--artifact', default=os.environ.get('OPENRANK_POOL_ARTIFACT', 'artifacts'),
+                        help='候选池产物目录（存在时只读加载）')
+    parser.add_argument('--interval', type=float, default=5, help='进度输出间隔（秒）')
+    args = parser.parse_args(argv)
+
+    usernames = load_usernames(args.users)
+    if not usernames:
+        parser.error('名单中没有有效的用户名')
+
+    from smartreporecommend import SmartRepoRecommender
+    recommender = SmartRepoRecommender(github_token=args.token,
+                                       pool_artifact=args.artifact if os.path.exists(args.artifact) else None)
+    runner = BatchRecommender(recommender, usernames, args.output, workers=args.workers, top_n=args.top_n,
+                              requests_per_hour=args.rate)
+    progress = runner.run(report=lambda p: print(_format_progress(p), flush=True), interval=args.interval)
+    print(_format_progress(progress))
+    print(json.dumps(progress, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+批量导入 OpenDigger / GitHub 离线导出数据到候选池（流式、常量内存）
+
+支持的输入：
+- JSON Lines（.jsonl / .json，可为 .gz / .bz2 / .xz 压缩，或 - 表示标准输入），每行一个仓库：
+  {"repo": "owner/name", "metrics": {"openrank": {"2023-01": 1.2, ...}, "activity": {...}, ...},
+   "language": "Python", "tags": [...], "domain": "AI"}
+  （metrics 也可以直接平铺在顶层；language/tags/domain 缺省时按仓库名推断）
+- OpenDigger 指标文件归档（.tar / .tar.gz / .tgz / .tar.bz2 / .tar.xz / .zip），
+  成员路径形如 [github/]owner/repo/openrank.json；按成员顺序流式读取，
+  同一仓库的指标文件需连续存放（按目录打包的归档天然满足）
+
+用法：
+    python bulk_ingest.py dump.jsonl.gz opendigger.tar.gz -o cache/bulk_candidate_pool.json
+"""
+import argparse
+import bz2
+import gzip
+import json
+import logging
+import lzma
+import os
+import sys
+import tarfile
+import time
+import zipfile
+
+from smartreporecommend import SmartRepoRecommender
+
+logger = logging.getLogger(__name__)
+
+# 写入候选池的指标：候选池字段 -> OpenDigger 指标名
+POOL_METRICS = {
+    'activity': 'activity',
+    'openrank': 'openrank',
+    'stars': 'stars',
+    'forks': 'technical_fork',
+    'contributors': 'participants',
+}
+
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
+
+
+def _open_text(path):
+    """按扩展名打开（可能压缩的）文本文件"""
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_jsonl_records(path):
+    """逐行读取 JSON Lines，产出 (repo, metrics, attrs)"""
+    stream = _open_text(path)
+    try:
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("[批量导入] %s 第 %d 行不是合法 JSON，已跳过", path, line_no)
+                continue
+            repo = record.get('repo') or record.get('repo_name') or record.get('full_name') or record.get('name')
+            if not repo or '/' not in repo:
+                continue
+            metrics = record.get('metrics')
+            if not isinstance(metrics, dict):
+                metrics = {k: v for k, v in record.items() if isinstance(v, dict)}
+            yield repo, metrics, record
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _split_metric_member(name):
+    """归档成员路径 -> (repo, metric)，不是指标文件时返回 None"""
+    parts = name.replace('\\', '/').strip('/').split('/')
+    if len(parts) < 3 or not parts[-1].endswith('.json'):
+        return None
+    return f"{parts[-3]}/{parts[-2]}", parts[-1][:-len('.json')]
+
+
+def _iter_archive_members(path):
+    """流式遍历归档中的 (成员名, 读取函数)"""
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: zf.read(info)
+    else:
+        # 'r|*' 为纯流式读取（不回溯），适合大体积压缩归档
+        with tarfile.open(path, 'r|*') as tf:
+            for member in tf:
+                if member.isfile():
+                    yield member.name, lambda member=member: tf.extractfile(member).read()
+
+
+def iter_archive_records(path):
+    """读取 OpenDigger 指标归档，按仓库聚合连续的指标文件，产出 (repo, metrics, attrs)"""
+    current_repo, metrics = None, {}
+    for name, read in _iter_archive_members(path):
+        parsed = _split_metric_member(name)
+        if parsed is None:
+            continue
+        repo, metric = parsed
+        if repo != current_repo:
+            if current_repo is not None:
+                yield current_repo, metrics, {}
+            current_repo, metrics = repo, {}
+        # 只解析候选池需要的指标，其余文件直接跳过
+        if metric not in POOL_METRICS.values():
+            continue
+        try:
+            metrics[metric] = json.loads(read())
+        except ValueError:
+            logger.warning("[批量导入] 无法解析 %s", name)
+    if current_repo is not None:
+        yield current_repo, metrics, {}
+
+
+def iter_records(path):
+    if path.endswith(ARCHIVE_SUFFIXES):
+        return iter_archive_records(path)
+    return iter_jsonl_records(path)
+
+
+def build_candidate(repo, metrics, attrs):
+    """单条记录 -> 候选池条目（缺失的指标记为 0，与在线拉取失败时的默认值一致）"""
+    language, domain, tags = SmartRepoRecommender._infer_repo_attributes(repo)
+    entry = {
+        'repo': repo,
+        'language': attrs.get('language') or language,
+        'tags': attrs.get('tags') or tags,
+        'difficulty': attrs.get('difficulty') or 'intermediate',
+        'domain': attrs.get('domain') or domain,
+        'source': 'bulk',
+    }
+    for field, metric_name in POOL_METRICS.items():
+        series = metrics.get(metric_name)
+        value = SmartRepoRecommender._calculate_avg_from_time_series(series, metric_name) if series else None
+        if value is None:
+            value = 0
+        if field in ('forks', 'contributors'):
+            value = int(value)
+        entry[field] = value
+    return entry
+
+
+def ingest(paths, output_path, progress_every=10000):
+    """
+    流式导入并写出候选池快照（JSON 对象，每行一个条目，完成后原子替换；推荐器按行流式读取）
+    同一仓库出现多次时以最后一次为准（加载快照时后出现的键覆盖前者）
+    返回 (记录数, 耗时秒)
+    """
+    tmp_path = f"{output_path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    count = 0
+    started = time.monotonic()
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('{')
+        for path in paths:
+            logger.info("[批量导入] 读取 %s", path)
+            for repo, metrics, attrs in iter_records(path):
+                entry = build_candidate(repo, metrics, attrs)
+                out.write(',\n' if count else '\n')
+                out.write(json.dumps(repo, ensure_ascii=False))
+                out.write(': ')
+                out.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')))
+                count += 1
+                if progress_every and count % progress_every == 0:
+                    elapsed = time.monotonic() - started
+                    logger.info("[批量导入] 已处理 %d 条（%.0f 条/秒）", count, count / max(elapsed, 1e-9))
+        out.write('\n}\n')
+    os.replace(tmp_path, output_path)
+    elapsed = time.monotonic() - started
+    logger.info("[批量导入] 完成：%d 条，耗时 %.1f 秒（%.0f 条/秒），输出 %s",
+                count, elapsed, count / max(elapsed, 1e-9), output_path)
+    return count, elapsed
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='批量导入 OpenDigger/GitHub 离线导出到候选池快照')
+    parser.add_argument('inputs', nargs='+', help='JSON Lines 文件（可压缩）或 OpenDigger 指标归档')
+    parser.add_argument('-o', '--output', default=os.path.join('cache', 'bulk_candidate_pool.json'),
+                        help='输出的候选池快照路径（默认 cache/bulk_candidate_pool.json）')
+    parser.add_argument('--progress-every', type=int, default=10000, help='每处理多少条输出一次吞吐量')
+    args = parser.parse_args(argv)
+    ingest(args.inputs, args.output, progress_every=args.progress_every)
+
+
+if __name__ == '__main__':
+    main()
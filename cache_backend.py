@@ -0,0 +1,539 @@
+"""
+可插拔的缓存后端
+GitHub / OpenDigger 的 API 缓存、仓库指标缓存、负缓存标记、用户画像与候选池缓存都按「键 → 编码后的字节
++ 写入时间」存取；有效期由读取方决定（同一个键可被不同 TTL 读取，熔断时还会读取过期数据），
+后端只负责保存写入时间。
+
+- LocalBackend（默认）：cache/ 目录下的文件，键即相对路径，写入时间取 mtime（与原有文件布局一致，
+  cache_janitor.py 照常清理）
+- RedisBackend：任意兼容 Redis 协议（RESP）的共享存储，标准库 socket 实现，不依赖第三方客户端；
+  多节点共享同一份上游数据，同一 Token 的限额不再被每个节点各消耗一遍。
+  共享存储中的字节可能来自任何一个节点，不可信任：shared=True 的后端只配合 JSON 编解码使用
+  （marshal 不能用于解码不可信数据），见 SmartRepoRecommender 的缓存配置。
+  值为 8 字节写入时间 + 编码负载，按 retention（默认 14 天，需长于各读取方的 TTL 以便熔断时读取过期数据）过期。
+  共享存储不可用时经熔断器（circuit_breaker.py）快速降级为未命中，不影响推荐
+- MemoryBackend：进程内 LRU（条目数与字节数上限）
+- TieredBackend：进程内 LRU 在前、共享存储在后；进程内副本过期时再查共享存储（其他节点可能已刷新）
+
+配置：OPENRANK_CACHE_BACKEND 为空或 local 时使用本地目录；为 redis://[:密码@]主机:端口/库 时使用
+进程内 LRU + Redis 两级缓存，进程内容量由 OPENRANK_CACHE_MEMORY_ITEMS（默认 2048）/
+OPENRANK_CACHE_MEMORY_BYTES（默认 64M）配置，共享存储保留时长由 OPENRANK_CACHE_RETENTION（秒）配置。
+
+本地替身：python cache_backend.py serve [--port 6380] 启动一个最小的 RESP 服务
+（PING / GET / SET [EX|PX] / DEL / EXISTS / DBSIZE / FLUSHDB），用于开发与测试多节点共享。
+"""
+import argparse
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+from cache_codec import atomic_write_bytes
+from cache_janitor import mark_accessed, parse_size
+from circuit_breaker import get_breaker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION = 14 * 24 * 3600
+DEFAULT_MEMORY_ITEMS = 2048
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+# 共享存储中值的前缀：写入时间（Unix 时间戳，小端 double）
+STAMP = struct.Struct('<d')
+
+
+class CacheBackend:
+    """
+    缓存后端接口：值为字节串。get 返回 (数据, 写入时间戳) 或 None；
+    max_age 为 None 时不论是否过期，否则只返回写入时间在 max_age 秒以内的条目。
+    后端故障不向调用方抛出异常（视为未命中 / 写入失败）。
+    shared 为 True 表示内容可能由其他节点写入，读取方不应使用 marshal 等不安全的格式解码
+    """
+    name = 'base'
+    shared = False
+
+    def get(self, key, max_age=None):
+        raise NotImplementedError
+
+    def set(self, key, data, stored_at=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def stored_at(self, key):
+        """条目的写入时间戳，不存在时返回 None"""
+        entry = self.get(key)
+        return entry[1] if entry is not None else None
+
+    def touch(self, key):
+        """命中未过期条目时调用（用于本地 LRU 清理），默认不做任何事"""
+
+    def close(self):
+        pass
+
+
+def _fresh(stored_at, max_age):
+    return max_age is None or time.time() - stored_at < max_age
+
+
+class LocalBackend(CacheBackend):
+    """本地目录：键为相对路径（'/' 分隔），写入时间为文件 mtime，原子写入"""
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key, max_age=None):
+        path = self.path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if not _fresh(stored_at, max_age):
+                return None
+            with open(path, 'rb') as f:
+                return f.read(), stored_at
+        except OSError:
+            return None
+
+    def stored_at(self, key):
+        try:
+            return os.path.getmtime(self.path(key))
+        except OSError:
+            return None
+
+    def set(self, key, data, stored_at=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write_bytes(path, data)
+        if stored_at is not None:
+            os.utime(path, (stored_at, stored_at))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def touch(self, key):
+        mark_accessed(self.path(key))
+
+
+class MemoryBackend(CacheBackend):
+    """进程内 LRU：超过条目数或字节数上限时淘汰最久未用的条目；单个超过上限 1/8 的值不缓存"""
+    name = 'memory'
+
+    def __init__(self, max_items=DEFAULT_MEMORY_ITEMS, max_bytes=DEFAULT_MEMORY_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not _fresh(entry[1], max_age):
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, data, stored_at=None):
+        data = bytes(data)
+        with self._lock:
+            self._pop_locked(key)
+            if len(data) > self.max_bytes // 8:
+                return
+            self._entries[key] = (data, time.time() if stored_at is None else stored_at)
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+                self._pop_locked(next(iter(self._entries)))
+
+    def _pop_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def delete(self, key):
+        with self._lock:
+            self._pop_locked(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisError(Exception):
+    """服务端返回的 RESP 错误"""
+
+
+class _Connection:
+    """一条 RESP 连接（请求 / 响应严格交替）"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def command(self, *args):
+        self.sock.sendall(encode_command(*args))
+        return read_reply(self.reader)
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def encode_command(*args):
+    """RESP 请求：参数数组，每个参数为 bulk string"""
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+def read_reply(reader):
+    """读取一个 RESP 响应；错误响应抛出 RedisError，连接中断抛出 ConnectionError"""
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('连接已关闭')
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body.decode()
+    if kind == b'-':
+        raise RedisError(body.decode('utf-8', 'replace'))
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError('连接已关闭')
+        return data[:-2]
+    if kind == b'*':
+        count = int(body)
+        return None if count < 0 else [read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"无法解析的响应: {line[:32]!r}")
+
+
+class RedisBackend(CacheBackend):
+    """Redis 协议共享存储（连接池 + 熔断；键加 prefix，值带写入时间前缀，按 retention 过期）"""
+    name = 'redis'
+    shared = True
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, prefix='openrank:',
+                 retention=DEFAULT_RETENTION, timeout=2.0, max_connections=16):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.retention = retention
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(max_connections)
+        self._breaker = get_breaker(f"{host}:{port}")
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """redis://[:密码@]主机[:端口][/库]"""
+        parts = urlsplit(url)
+        if parts.scheme != 'redis':
+            raise ValueError(f"不支持的缓存后端地址: {url}")
+        db = parts.path.strip('/')
+        return cls(host=parts.hostname or '127.0.0.1', port=parts.port or 6379, db=int(db) if db else 0,
+                   password=unquote(parts.password) if parts.password else None, **kwargs)
+
+    def _connect(self):
+        conn = _Connection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                conn.command('AUTH', self.password)
+            if self.db:
+                conn.command('SELECT', self.db)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def execute(self, *args):
+        """执行一条命令；网络故障时关闭该连接并抛出 OSError，响应无法解析时抛出 ValueError"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            reply = conn.command(*args)
+        except (OSError, ValueError):
+            conn.close()
+            raise
+        except RedisError:
+            self._release(conn)
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _call(self, *args):
+        """带熔断的命令执行：熔断打开或失败（含响应损坏）时返回 None 并记录日志"""
+        if not self._breaker.allow():
+            return None
+        try:
+            reply = self.execute(*args)
+        except (OSError, ValueError, RedisError) as e:
+            self._breaker.record_failure(e)
+            logger.warning("[共享缓存] %s 失败 %s:%s: %s", args[0], self.host, self.port, e)
+            return None
+        self._breaker.record_success()
+        return reply
+
+    def get(self, key, max_age=None):
+        value = self._call('GET', self.prefix + key)
+        if not value or len(value) < STAMP.size:
+            return None
+        stored_at = STAMP.unpack_from(value)[0]
+        if not _fresh(stored_at, max_age):
+            return None
+        return value[STAMP.size:], stored_at
+
+    def set(self, key, data, stored_at=None):
+        stamp = STAMP.pack(time.time() if stored_at is None else stored_at)
+        self._call('SET', self.prefix + key, stamp + bytes(data), 'EX', int(self.retention))
+
+    def delete(self, key):
+        self._call('DEL', self.prefix + key)
+
+    def ping(self):
+        return self.execute('PING') == 'PONG'
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class TieredBackend(CacheBackend):
+    """两级缓存：near（进程内 LRU）在前，far（共享存储）在后；写入两级，far 命中时回填 near"""
+    name = 'tiered'
+
+    def __init__(self, near, far):
+        self.near = near
+        self.far = far
+        self.shared = near.shared or far.shared
+
+    def get(self, key, max_age=None):
+        entry = self.near.get(key, max_age)
+        if entry is not None:
+            return entry
+        # 进程内没有或已过期：共享存储中可能有其他节点刷新过的版本
+        entry = self.far.get(key, max_age)
+        if entry is not None:
+            self.near.set(key, entry[0], entry[1])
+        return entry
+
+    def set(self, key, data, stored_at=None):
+        stored_at = time.time() if stored_at is None else stored_at
+        self.near.set(key, data, stored_at)
+        self.far.set(key, data, stored_at)
+
+    def delete(self, key):
+        self.near.delete(key)
+        self.far.delete(key)
+
+    def touch(self, key):
+        self.far.touch(key)
+
+    def close(self):
+        self.near.close()
+        self.far.close()
+
+
+def make_backend(cache_dir, spec=None):
+    """按配置（默认取 OPENRANK_CACHE_BACKEND）创建缓存后端"""
+    spec = (spec if spec is not None else os.environ.get('OPENRANK_CACHE_BACKEND') or 'local').strip()
+    if spec == 'local':
+        return LocalBackend(cache_dir)
+    if spec.startswith('redis://'):
+        retention = float(os.environ.get('OPENRANK_CACHE_RETENTION') or DEFAULT_RETENTION)
+        near = MemoryBackend(max_items=int(os.environ.get('OPENRANK_CACHE_MEMORY_ITEMS') or DEFAULT_MEMORY_ITEMS),
+                             max_bytes=parse_size(os.environ.get('OPENRANK_CACHE_MEMORY_BYTES') or DEFAULT_MEMORY_BYTES))
+        return TieredBackend(near, RedisBackend.from_url(spec, retention=retention))
+    raise ValueError(f"未知的缓存后端: {spec}（可选: local、redis://主机:端口/库）")
+
+
+class CacheStore:
+    """缓存后端 + 编解码：按键读写对象，有效期由读取方给出"""
+
+    def __init__(self, backend, codec):
+        self.backend = backend
+        self.codec = codec
+
+    def load(self, key, max_age=None):
+        """返回 (对象, 写入时间戳)；不存在、已过期（max_age 不为 None 时）或无法解码时返回 None"""
+        entry = self.backend.get(key, max_age)
+        if entry is None:
+            return None
+        try:
+            value = self.codec.loads(entry[0])
+        except Exception as e:
+            logger.warning("[缓存] 解码失败 %s: %s", key, e)
+            return None
+        if max_age is not None:
+            self.backend.touch(key)
+        return value, entry[1]
+
+    def dump(self, key, obj):
+        self.backend.set(key, self.codec.dumps(obj))
+
+    def stored_at(self, key):
+        return self.backend.stored_at(key)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                request = read_reply(self.rfile)
+            except (ConnectionError, ValueError, RedisError):
+                return
+            if not isinstance(request, list) or not request:
+                return
+            try:
+                reply = server.dispatch([part if isinstance(part, bytes) else str(part).encode() for part in request])
+            except RedisError as e:
+                reply = RedisError(str(e))
+            self.wfile.write(_encode_reply(reply))
+            self.wfile.flush()
+
+
+def _encode_reply(value):
+    if isinstance(value, RedisError):
+        return b'-ERR %s\r\n' % str(value).encode()
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, str):
+        return b'+%s\r\n' % value.encode()
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class MiniRedisServer(socketserver.ThreadingTCPServer):
+    """最小的 RESP 服务（本地替身，单库、进程内存储、惰性过期）"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        super().__init__(address, _RespHandler)
+        self._data = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _live_locked(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def dispatch(self, args):
+        command = args[0].upper()
+        with self._lock:
+            if command == b'PING':
+                return 'PONG'
+            if command in (b'SELECT', b'AUTH'):
+                return 'OK'
+            if command == b'GET':
+                entry = self._live_locked(args[1])
+                return entry[0] if entry else None
+            if command == b'SET':
+                expires = None
+                options = [arg.upper() for arg in args[3:]]
+                for option, value in zip(options[::2], args[4::2]):
+                    if option == b'EX':
+                        expires = time.monotonic() + int(value)
+                    elif option == b'PX':
+                        expires = time.monotonic() + int(value) / 1000.0
+                self._data[args[1]] = (args[2], expires)
+                return 'OK'
+            if command == b'DEL':
+                return sum(1 for key in args[1:] if self._live_locked(key) and self._data.pop(key, None))
+            if command == b'EXISTS':
+                return sum(1 for key in args[1:] if self._live_locked(key))
+            if command == b'DBSIZE':
+                return sum(1 for key in list(self._data) if self._live_locked(key))
+            if command == b'FLUSHDB':
+                self._data.clear()
+                return 'OK'
+        raise RedisError(f"unknown command '{command.decode('utf-8', 'replace')}'")
+
+    def start(self):
+        """在后台线程中运行，返回自身"""
+        self._thread = threading.Thread(target=self.serve_forever, name='mini-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='缓存后端工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help='启动本地 RESP 替身服务（开发 / 测试多节点共享缓存）')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=6380)
+    ping = sub.add_parser('ping', help='检查共享存储是否可用')
+    ping.add_argument('url', nargs='?', default=os.environ.get('OPENRANK_CACHE_BACKEND') or 'redis://127.0.0.1:6379/0')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        server = MiniRedisServer((args.host, args.port))
+        print(f"RESP 替身服务已启动: {server.url}（OPENRANK_CACHE_BACKEND={server.url}）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        try:
+            print('PONG' if RedisBackend.from_url(args.url).ping() else '响应异常')
+        except (OSError, RedisError) as e:
+            print(f"连接失败: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+缓存编解码与原子写入
+- BinaryCodec（默认）：定长文件头（魔数 + 格式版本 + marshal 版本 + 标志位 + 负载长度）
+  + marshal 二进制负载，超过阈值时 zlib 压缩；版本不符或长度不符视为缓存失效
+- JsonCodec：紧凑 JSON（无缩进），便于人工查看
+所有写入先写同目录临时文件再 os.replace，进程崩溃不会留下半截缓存文件。
+
+基准测试：python cache_codec.py --bench [sample.json]
+"""
+import json
+import marshal
+import os
+import struct
+import tempfile
+import zlib
+
+MAGIC = b'ORCC'
+FORMAT_VERSION = 1
+FLAG_ZLIB = 0x01
+# 魔数(4) | 格式版本(1) | marshal 版本(1) | 标志位(1) | 保留(1) | 负载长度(4)
+HEADER = struct.Struct('<4sBBBxI')
+
+
+class CacheFormatError(ValueError):
+    """缓存文件格式/版本不符"""
+
+
+def atomic_write_bytes(path, data):
+    """原子写入：同目录临时文件 + fsync + os.replace"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class JsonCodec:
+    """紧凑 JSON 编解码"""
+    name = 'json'
+    suffix = '.json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dump(self, obj, path):
+        atomic_write_bytes(path, self.dumps(obj))
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            return self.loads(f.read())
+
+
+class BinaryCodec(JsonCodec):
+    """带版本头的 marshal 二进制编解码（可选 zlib 压缩）"""
+    name = 'binary'
+    suffix = '.bin'
+
+    def __init__(self, compress_threshold=4096, level=1, marshal_version=marshal.version):
+        """marshal_version < 3 时不写对象引用，相同内容总是得到相同字节（便于按内容哈希）"""
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self.marshal_version = marshal_version
+
+    def dumps(self, obj):
+        payload = marshal.dumps(obj, self.marshal_version)
+        flags = 0
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            payload = zlib.compress(payload, self.level)
+            flags |= FLAG_ZLIB
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self.marshal_version, flags, len(payload)) + payload
+
+    def loads(self, data):
+        if len(data) < HEADER.size:
+            raise CacheFormatError('缓存文件过短')
+        magic, version, marshal_version, flags, length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION or marshal_version > marshal.version:
+            raise CacheFormatError('缓存格式版本不符')
+        payload = memoryview(data)[HEADER.size:]
+        if len(payload) != length:
+            raise CacheFormatError('缓存文件长度不符（可能被截断）')
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        return marshal.loads(payload)
+
+
+CODECS = {'binary': BinaryCodec, 'json': JsonCodec}
+
+
+def get_codec(name=None):
+    """按名称获取编解码器，默认取环境变量 OPENRANK_CACHE_CODEC，缺省为 binary"""
+    name = (name or os.environ.get('OPENRANK_CACHE_CODEC') or 'binary').lower()
+    if name not in CODECS:
+        raise ValueError(f"未知的缓存编解码器: {name}（可选: {', '.join(CODECS)}）")
+    return CODECS[name]()
+
+
+def _bench(sample, rounds=5):
+    """对比各编解码器的体积与编解码耗时"""
+    import time
+
+    variants = [
+        ('json indent=2（旧）', lambda o: json.dumps(o, ensure_ascii=False, indent=2).encode('utf-8'), json.loads),
+        ('json 紧凑', JsonCodec().dumps, JsonCodec().loads),
+        ('binary', BinaryCodec(compress_threshold=None).dumps, BinaryCodec().loads),
+        ('binary+zlib', BinaryCodec(compress_threshold=0).dumps, BinaryCodec().loads),
+    ]
+    print(f"{'编解码器':<20}{'体积(KB)':>12}{'编码(ms)':>12}{'解码(ms)':>12}")
+    for name, dumps, loads in variants:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            data = dumps(sample)
+        encode_ms = (time.perf_counter() - started) * 1000 / rounds
+        started = time.perf_counter()
+        for _ in range(rounds):
+            loads(data)
+        decode_ms = (time.perf_counter() - started) * 1000 / rounds
+        print(f"{name:<20}{len(data) / 1024:>12.1f}{encode_ms:>12.2f}{decode_ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description='缓存编解码基准测试')
+    parser.add_argument('--bench', nargs='?', const='', metavar='SAMPLE_JSON',
+                        help='对给定 JSON 文件（缺省为合成的候选池）做基准测试')
+    args = parser.parse_args()
+    if args.bench is None:
+        parser.print_help()
+    elif args.bench:
+        with open(args.bench, 'r', encoding='utf-8') as f:
+            _bench(json.load(f))
+    else:
+        rng = random.Random(0)
+        _bench({f"org{i}/repo{i}": {
+            'repo': f"org{i}/repo{i}", 'language': 'Python', 'tags': ['机器学习', '数据处理'],
+            'difficulty': 'intermediate', 'domain': 'AI', 'activity': rng.uniform(50, 90),
+            'openrank': rng.uniform(60, 90), 'stars': rng.randint(1000, 100000),
+            'forks': rng.randint(100, 10000), 'contributors': rng.randint(10, 5000), 'source': 'standard'
+        } for i in range(20000)})
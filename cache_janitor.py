@@ -0,0 +1,329 @@
+"""
+缓存目录清理（cache janitor）
+cache/ 下每个请求过的 URL、每个仓库、每个仓库的每个 OpenDigger 指标各占一个文件，
+过期文件只会被忽略而不会删除。清理器按以下顺序回收空间：
+1. 删除崩溃遗留的原子写入临时文件（.tmp_*，超过 1 小时）
+2. 删除过期已久的缓存：按文件类型的有效期（与读取方的 TTL 一致）再加宽限期 stale_grace
+   （默认 7 天）才删除——上游熔断时推荐器会降级读取过期缓存，刚过期的条目需要保留
+3. 超出字节预算或条目预算时，按最近使用时间（LRU）从最久未用的开始淘汰
+候选池、向量索引与批量快照等大文件（PINNED_PATTERNS）不参与清理。
+
+最近使用时间取 atime 与 mtime 的较大值；缓存命中时由 mark_accessed 显式更新 atime
+（保留 mtime，不影响过期判断），因此在 noatime 挂载下 LRU 依然有效。
+多个进程共享同一缓存目录时，用锁文件保证同一时刻只有一个清理在执行。
+
+用法：
+    python cache_janitor.py [--cache-dir cache] [--max-bytes 512M] [--max-entries 50000] [--dry-run] [--json]
+服务端：app.py 在后台线程中按 OPENRANK_CACHE_GC_INTERVAL（秒，默认 3600，0 关闭）周期清理，
+预算由 OPENRANK_CACHE_MAX_BYTES / OPENRANK_CACHE_MAX_ENTRIES 配置，宽限期由 OPENRANK_CACHE_STALE_GRACE（秒）配置。
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_INTERVAL = 3600
+# 过期后继续保留的时长：熔断降级（SmartRepoRecommender._load_stale_cache）读取的正是这些条目
+DEFAULT_STALE_GRACE = 7 * 24 * 3600
+
+# (相对路径模式, 有效期秒数)，按顺序匹配第一条；有效期取读取方使用的最长 TTL
+TTL_RULES = (
+    ('*.neg', 24 * 3600),  # 负缓存标记（各失败类别的有效期见 smartreporecommend.NEGATIVE_CACHE_TTL）
+    ('opendigger/*', 7 * 24 * 3600),
+    ('api_*', 24 * 3600),
+    ('*', 24 * 3600),
+)
+# 不参与清理的文件（由推荐器自行按版本/时间重建）
+PINNED_PATTERNS = ('large_candidate_pool.*', 'embedding_index.npz', 'bulk_candidate_pool.json')
+TEMP_PREFIX = '.tmp_'
+TEMP_MAX_AGE = 3600
+LOCK_NAME = '.janitor.lock'
+# 锁文件超过该时长视为清理进程已崩溃，可被接管
+LOCK_STALE_AFTER = 600
+# 接管过期锁时的互斥标记（锁文件名 + 后缀）
+TAKEOVER_SUFFIX = '.takeover'
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value):
+    """'512M' / '2G' / '1048576' -> 字节数"""
+    text = str(value).strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ''
+    number = text[:-1] if unit else text
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"无法解析的大小: {value}")
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{size}B"
+        size /= 1024
+
+
+def mark_accessed(path):
+    """缓存命中时记录访问时间（只更新 atime，mtime 保持不变以免延长有效期）"""
+    try:
+        st = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def _is_stale(path):
+    try:
+        return time.time() - os.stat(path).st_mtime > LOCK_STALE_AFTER
+    except OSError:
+        return False
+
+
+def _discard(path):
+    """把文件原子地改名为本线程独有的名字后删除；改名失败说明已被其他进程移走"""
+    claimed = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return
+    try:
+        os.unlink(claimed)
+    except OSError:
+        pass
+
+
+def _ttl_for(relpath, rules):
+    for pattern, ttl in rules:
+        if fnmatch.fnmatch(relpath, pattern):
+            return ttl
+    return None
+
+
+class CacheJanitor:
+    """按有效期、字节预算与条目预算清理缓存目录"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl_rules=TTL_RULES, pinned=PINNED_PATTERNS, stale_grace=DEFAULT_STALE_GRACE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.stale_grace = stale_grace
+        self.ttl_rules = ttl_rules
+        self.pinned = pinned
+        self._thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, cache_dir):
+        """按环境变量 OPENRANK_CACHE_MAX_BYTES / OPENRANK_CACHE_MAX_ENTRIES / OPENRANK_CACHE_STALE_GRACE 构造"""
+        return cls(cache_dir,
+                   max_bytes=parse_size(os.environ.get('OPENRANK_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES),
+                   max_entries=int(os.environ.get('OPENRANK_CACHE_MAX_ENTRIES') or DEFAULT_MAX_ENTRIES),
+                   stale_grace=float(os.environ.get('OPENRANK_CACHE_STALE_GRACE') or DEFAULT_STALE_GRACE))
+
+    def _scan(self):
+        """遍历缓存目录，返回 [(相对路径, 绝对路径, os.stat_result)]"""
+        entries = []
+        stack = [self.cache_dir]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            relpath = os.path.relpath(entry.path, self.cache_dir).replace(os.sep, '/')
+                            entries.append((relpath, entry.path, st))
+            except OSError:
+                continue
+        return entries
+
+    @staticmethod
+    def _take_over_stale_lock(lock_path):
+        """
+        接管崩溃进程遗留的锁。判断过期与移走锁文件之间，其他进程可能已接管并建了新锁，
+        因此接管本身用 O_EXCL 创建的接管标记串行化：拿到标记后重新确认锁仍过期，再原子地改名移走
+        （正常加锁只做 O_EXCL 创建，不会与之冲突）
+        """
+        if not _is_stale(lock_path):
+            return
+        marker = lock_path + TAKEOVER_SUFFIX
+        if _is_stale(marker):
+            # 接管过程中崩溃遗留的标记
+            _discard(marker)
+        try:
+            fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return
+        os.close(fd)
+        try:
+            if _is_stale(lock_path):
+                _discard(lock_path)
+        finally:
+            try:
+                os.unlink(marker)
+            except OSError:
+                pass
+
+    def _acquire_lock(self):
+        lock_path = os.path.join(self.cache_dir, LOCK_NAME)
+        self._take_over_stale_lock(lock_path)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        return lock_path
+
+    def collect(self, dry_run=False):
+        """
+        执行一次清理，返回统计字典：
+        scanned/bytes_before、temp/expired/evicted（删除的文件数）、reclaimed_bytes、entries/bytes（清理后）；
+        另一进程正在清理时返回 {'skipped': True}
+        """
+        if not os.path.isdir(self.cache_dir):
+            return {'skipped': True}
+        lock_path = None if dry_run else self._acquire_lock()
+        if not dry_run and lock_path is None:
+            logger.info("[缓存清理] 其他进程正在清理，跳过")
+            return {'skipped': True}
+        try:
+            return self._collect(dry_run)
+        finally:
+            if lock_path is not None:
+                try:
+                    os.unlink(lock_path)
+                except OSError:
+                    pass
+
+    def _collect(self, dry_run):
+        started = time.monotonic()
+        now = time.time()
+        report = {'scanned': 0, 'bytes_before': 0, 'temp': 0, 'expired': 0, 'evicted': 0,
+                  'reclaimed_bytes': 0, 'entries': 0, 'bytes': 0, 'pinned': 0, 'dry_run': dry_run}
+
+        def remove(path, st, kind):
+            if not dry_run:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    return
+                except OSError as e:
+                    logger.warning("[缓存清理] 删除失败 %s: %s", path, e)
+                    return
+            report[kind] += 1
+            report['reclaimed_bytes'] += st.st_size
+
+        live = []  # (最近使用时间, 路径, stat)
+        for relpath, path, st in self._scan():
+            name = os.path.basename(relpath)
+            if name in (LOCK_NAME, LOCK_NAME + TAKEOVER_SUFFIX):
+                continue
+            report['scanned'] += 1
+            report['bytes_before'] += st.st_size
+            if name.startswith(TEMP_PREFIX):
+                if now - st.st_mtime > TEMP_MAX_AGE:
+                    remove(path, st, 'temp')
+                continue
+            if any(fnmatch.fnmatch(relpath, pattern) for pattern in self.pinned):
+                report['pinned'] += 1
+                continue
+            ttl = _ttl_for(relpath, self.ttl_rules)
+            if ttl is not None and now - st.st_mtime >= ttl + self.stale_grace:
+                remove(path, st, 'expired')
+                continue
+            live.append((max(st.st_atime, st.st_mtime), path, st))
+
+        # 超出预算时从最久未用的开始淘汰
+        total_bytes = sum(st.st_size for _, _, st in live)
+        total_entries = len(live)
+        if total_bytes > self.max_bytes or total_entries > self.max_entries:
+            live.sort(key=lambda item: item[0])
+            for _, path, st in live:
+                if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                    break
+                remove(path, st, 'evicted')
+                total_bytes -= st.st_size
+                total_entries -= 1
+
+        report['entries'] = total_entries
+        report['bytes'] = total_bytes
+        report['elapsed'] = round(time.monotonic() - started, 3)
+        logger.info("[缓存清理] 扫描 %d 个文件，删除过期 %d、淘汰 %d、临时文件 %d，回收 %s；剩余 %d 个（%s）",
+                    report['scanned'], report['expired'], report['evicted'], report['temp'],
+                    format_size(report['reclaimed_bytes']), total_entries, format_size(total_bytes))
+        return report
+
+    def start(self, interval=DEFAULT_INTERVAL):
+        """启动后台清理线程（守护线程，立即清理一次，之后每 interval 秒一次）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    self.collect()
+                except Exception:
+                    logger.exception("[缓存清理] 清理失败")
+                if self._stop.wait(interval):
+                    break
+
+        self._thread = threading.Thread(target=run, name='cache-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='清理缓存目录（过期删除 + LRU 淘汰）')
+    parser.add_argument('--cache-dir', default='cache', help='缓存目录（默认 cache）')
+    parser.add_argument('--max-bytes', default=os.environ.get('OPENRANK_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES,
+                        help='字节预算，可带单位 K/M/G（默认 512M）')
+    parser.add_argument('--max-entries', type=int,
+                        default=int(os.environ.get('OPENRANK_CACHE_MAX_ENTRIES') or DEFAULT_MAX_ENTRIES),
+                        help='条目预算（默认 50000）')
+    parser.add_argument('--stale-grace', type=float,
+                        default=float(os.environ.get('OPENRANK_CACHE_STALE_GRACE') or DEFAULT_STALE_GRACE),
+                        help='过期后继续保留的秒数，供熔断降级读取（默认 7 天）')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不删除')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出统计')
+    args = parser.parse_args(argv)
+
+    janitor = CacheJanitor(args.cache_dir, max_bytes=parse_size(args.max_bytes), max_entries=args.max_entries,
+                           stale_grace=args.stale_grace)
+    report = janitor.collect(dry_run=args.dry_run)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    elif report.get('skipped'):
+        print('缓存目录不存在或其他进程正在清理，已跳过')
+    else:
+        prefix = '（试运行）' if args.dry_run else ''
+        print(f"{prefix}扫描 {report['scanned']} 个文件（{format_size(report['bytes_before'])}）："
+              f"过期 {report['expired']}，LRU 淘汰 {report['evicted']}，临时文件 {report['temp']}，"
+              f"回收 {format_size(report['reclaimed_bytes'])}；剩余 {report['entries']} 个（{format_size(report['bytes'])}）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+候选池倒排索引（召回阶段）
+候选池加载完成后一次性构建：语言 / 小写标签 / 领域 / skill_graph 关联词 -> 候选编号，
+每次请求只对命中用户技能、领域的候选（加上按质量排序的补充候选）打分，
+请求开销随命中数增长，而不是随候选池规模增长。
+各倒排表按静态先验降序存放，召回时每个表只读取前 limit 个，领域等覆盖大半个候选池的表也不会整表遍历。
+
+存储：每类倒排表（语言 / 标签 / 领域 / 关联技能 / 来源）为一个 CSR——键列表、偏移数组与拼接的候选编号数组，
+by_<类别> 中每个键对应编号数组上的切片视图；先验与先验顺序同为 NumPy 数组。
+这些数组随离线产物保存（arrays / from_features），worker 以只读内存映射加载，
+不在各自的堆中重建成 Python 对象（fork 后读取也不会因引用计数写脏共享页）。
+"""
+from collections import defaultdict
+
+import numpy as np
+
+# 倒排表类别（by_<类别>）
+FAMILIES = ('language', 'tag', 'domain', 'related_skill', 'source')
+# arrays() 导出的数组名
+INDEX_ARRAYS = ('prior_order',) + tuple(f"{family}_{part}" for family in FAMILIES
+                                        for part in ('keys', 'offsets', 'postings'))
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+class CandidateIndex:
+    """候选池倒排索引"""
+
+    def __init__(self, pool, skill_graph, prior_fn):
+        """
+        pool: {repo: project} 候选池（顺序即候选编号）
+        skill_graph: 技能关联图谱（与打分逻辑一致）
+        prior_fn: project -> 静态先验分（质量等与用户无关的部分），用于截断排序和补充召回
+        """
+        self.repos = list(pool.keys())
+        self.cid_of = {repo: cid for cid, repo in enumerate(self.repos)}
+        groups = {family: defaultdict(list) for family in FAMILIES}
+        prior = []
+
+        # skill_graph 关联词 -> 技能（打分时技能通过关联词命中项目标签得 0.6）
+        related_to_skills = defaultdict(set)
+        for skill, info in skill_graph.items():
+            for rel in info.get('related', []):
+                related_to_skills[rel.lower()].add(skill)
+
+        for cid, repo in enumerate(self.repos):
+            project = pool[repo]
+            lang = (project.get('language') or '').lower()
+            if lang:
+                groups['language'][lang].append(cid)
+            tags = set(t.lower() for t in project.get('tags', []))
+            related_hits = set()
+            for tag in tags:
+                groups['tag'][tag].append(cid)
+                related_hits.update(related_to_skills.get(tag, ()))
+            for skill in related_hits:
+                groups['related_skill'][skill].append(cid)
+            groups['domain'][project.get('domain', 'general')].append(cid)
+            groups['source'][project.get('source', 'standard')].append(cid)
+            prior.append(prior_fn(project))
+
+        self.prior = np.asarray(prior, dtype=np.float64)
+        self._sort_postings(groups)
+
+    @classmethod
+    def from_table(cls, table, skill_graph, priors=None):
+        """
+        直接由列式候选池（CandidateTable）向量化构建，结果与逐条构建完全一致，
+        无需物化每一行（大候选池 / 内存映射的离线产物启动更快）
+        priors: 预计算的静态先验分，缺省时由 table.static_priors() 计算
+        """
+        index = cls.__new__(cls)
+        n = len(table)
+        index.repos = table.repos
+        index.cid_of = table.index
+        index.prior = np.asarray(priors if priors is not None else table.static_priors(), dtype=np.float64)
+
+        groups = {}
+        lang_values = table.lang_lower_vocab.values
+        groups['language'] = {lang_values[code]: cids for code, cids in
+                              _group_rows(table.lang_lower_ids).items() if lang_values[code]}
+        domain_values = table.vocabs['domain'].values
+        groups['domain'] = {domain_values[code]: cids for code, cids in _group_rows(table.domain_ids).items()}
+        source_values = table.vocabs['source'].values
+        groups['source'] = {source_values[code]: cids for code, cids in _group_rows(table.source_ids).items()}
+
+        # 小写标签 -> 候选编号（同一候选的重复标签只计一次）
+        tag_values = table.tag_lower_vocab.values
+        pairs = np.sort(np.asarray(table.tag_lower_ids, dtype=np.int64) * max(n, 1) + table.tag_rows)
+        pairs = pairs[np.concatenate(([True], np.diff(pairs) != 0))] if len(pairs) else pairs
+        tag_groups = _group_rows(pairs // max(n, 1), pairs % max(n, 1))
+        groups['tag'] = {tag_values[code]: cids for code, cids in tag_groups.items()}
+
+        groups['related_skill'] = {}
+        for skill, info in skill_graph.items():
+            hit = np.zeros(n, dtype=bool)
+            for rel in info.get('related', []):
+                hit[groups['tag'].get(rel.lower(), _EMPTY)] = True
+            if hit.any():
+                groups['related_skill'][skill] = np.flatnonzero(hit)
+
+        index._sort_postings(groups)
+        return index
+
+    @classmethod
+    def from_features(cls, table, skill_graph, features):
+        """由产物加载：产物中有索引数组时直接使用（内存映射），否则由候选池构建"""
+        if 'index_prior_order' not in features or 'static_prior' not in features:
+            return cls.from_table(table, skill_graph, priors=features.get('static_prior'))
+        index = cls.__new__(cls)
+        index.repos = table.repos
+        index.cid_of = table.index
+        index.prior = features['static_prior']
+        index.prior_order = features['index_prior_order']
+        index._csr = {}
+        for family in FAMILIES:
+            index._attach(family, features[f"index_{family}_keys"].tolist(),
+                          features[f"index_{family}_offsets"], features[f"index_{family}_postings"])
+        return index
+
+    def _sort_postings(self, groups):
+        """
+        groups: {类别: {键: 候选编号}} -> 各类别的 CSR，表内按静态先验降序（同分保持候选编号顺序），
+        召回时每个表的前 limit 个即该表中先验最高的候选；prior_order 为全局先验顺序（补充召回用）
+        """
+        self.prior_order = np.argsort(-self.prior, kind='stable').astype(np.int32)
+        self._csr = {}
+        for family in FAMILIES:
+            keys = list(groups.get(family, {}))
+            lists = [np.asarray(groups[family][key], dtype=np.int32) for key in keys]
+            lengths = np.array([len(cids) for cids in lists], dtype=np.int64)
+            cids = np.concatenate(lists) if lists else _EMPTY
+            owner = np.repeat(np.arange(len(keys)), lengths)
+            postings = cids[np.lexsort((cids, -self.prior[cids], owner))]
+            self._attach(family, keys, np.concatenate(([0], np.cumsum(lengths))), postings)
+
+    def _attach(self, family, keys, offsets, postings):
+        # by_<类别>：键 -> 编号数组上的切片视图（不复制）
+        self._csr[family] = (keys, offsets, postings)
+        setattr(self, f"by_{family}", {key: postings[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys)})
+
+    def arrays(self):
+        """索引数组 {名称: 数组}（名称见 INDEX_ARRAYS），写入产物后由 from_features 加载"""
+        arrays = {'prior_order': self.prior_order}
+        for family, (keys, offsets, postings) in self._csr.items():
+            arrays[f"{family}_keys"] = np.array(keys, dtype=str)
+            arrays[f"{family}_offsets"] = np.asarray(offsets, dtype=np.int64)
+            arrays[f"{family}_postings"] = postings
+        return arrays
+
+    def __len__(self):
+        return len(self.repos)
+
+    def retrieve(self, user_profile, limit=2000, backfill=50, source_backfill=20, extra_repos=()):
+        """召回候选，返回仓库名（保持候选池原顺序），参数见 retrieve_ids"""
+        return [self.repos[cid] for cid in self.retrieve_ids(user_profile, limit, backfill, source_backfill, extra_repos)]
+
+    def retrieve_ids(self, user_profile, limit=2000, backfill=50, source_backfill=20, extra_repos=()):
+        """
+        召回与用户技能/领域匹配的候选，返回升序候选编号（即候选池原顺序）
+        limit: 命中候选的上限（超出时按命中强度、先验截断）；每个倒排表也只读取先验最高的前 limit 个，
+               单次召回的开销与候选池规模无关
+        backfill: 额外补充的高质量候选数量
+        source_backfill: 每个来源（top_300 / standard）额外补充的高质量候选数量，
+                         保证多样性过滤的来源配额总有候选可选
+        extra_repos: 其他召回通道（如向量近邻）给出的仓库名，并入召回结果
+        """
+        # 命中强度：与打分中技能/领域项的权重一致，只做粗排
+        postings, weights = [], []
+
+        def hit(cids, weight):
+            cids = cids[:limit]
+            if len(cids):
+                postings.append(cids)
+                weights.append(np.full(len(cids), weight))
+
+        for skill, strength in user_profile.get('skills', {}).items():
+            w = float(strength)
+            if w <= 0:
+                continue
+            skill_lower = skill.lower()
+            hit(self.by_language.get(skill_lower, _EMPTY), w * 1.0)
+            hit(self.by_tag.get(skill_lower, _EMPTY), w * 0.9)
+            hit(self.by_related_skill.get(skill, _EMPTY), w * 0.6)
+
+        domains = user_profile.get('domains', [])
+        for pos, domain in enumerate(domains):
+            hit(self.by_domain.get(domain, _EMPTY), 1.0 if pos == 0 else 0.4)
+
+        if postings:
+            cids, inverse = np.unique(np.concatenate(postings), return_inverse=True)
+            hits = np.bincount(inverse, weights=np.concatenate(weights))
+            if limit is not None and len(cids) > limit:
+                # 按 (命中强度, 先验) 降序取前 limit 个
+                cids = cids[np.lexsort((self.prior[cids], hits))[::-1][:limit]]
+            chosen = set(cids.tolist())
+        else:
+            chosen = set()
+
+        chosen.update(self.cid_of[repo] for repo in extra_repos if repo in self.cid_of)
+        self._backfill(chosen, self.prior_order, backfill)
+        for cids in self.by_source.values():
+            self._backfill(chosen, cids, source_backfill)
+
+        return sorted(chosen)
+
+    @staticmethod
+    def _backfill(chosen, ordered_cids, count):
+        """按先验顺序向 chosen 中补充 count 个尚未召回的候选（最多跳过 len(chosen) 个，只读取所需前缀）"""
+        added = 0
+        for cid in ordered_cids[:count + len(chosen)].tolist():
+            if added >= count:
+                break
+            if cid not in chosen:
+                chosen.add(cid)
+                added += 1
+
+
+def _group_rows(keys, rows=None):
+    """按键分组：返回 {键: 升序行号数组}，rows 缺省为 keys 的下标（需已按行号升序）"""
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return {}
+    rows = np.arange(len(keys)) if rows is None else np.asarray(rows)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    return {int(sorted_keys[start]): ids for start, ids in zip(starts, np.split(rows[order], boundaries))}
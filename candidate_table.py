@@ -0,0 +1,402 @@
+"""
+列式候选池（CandidateTable）
+- 数值字段（activity/openrank/stars/forks/contributors）存为 NumPy 数组，缺失为 NaN
+- 语言/领域/难度/来源存为驻留词表的整数编号
+- 标签采用 CSR 结构：tag_offsets[i]:tag_offsets[i+1] 为第 i 个候选的标签编号
+- 时间序列特征（timeseries_features，仅 top_300 候选有值）存为 float64 列，缺失为 NaN
+打分与过滤直接读列；只有返回给调用方的少量结果才通过 row() 物化为字典。
+save()/load() 以每列一个 .npy 文件落盘，load(mmap_mode='r') 以只读内存映射打开，
+多个进程映射同一份文件时共享操作系统页缓存，列数据不占各自的私有内存。
+"""
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from cache_codec import BinaryCodec
+from scoring import combine_components
+from timeseries_features import trend_score
+
+NUMERIC_FIELDS = ('activity', 'openrank', 'stars', 'forks', 'contributors')
+INT_FIELDS = ('stars', 'forks', 'contributors')
+CORE_FIELDS = ('repo', 'language', 'tags', 'difficulty', 'domain', 'source', 'is_organization', 'org_name') + NUMERIC_FIELDS
+
+# 落盘的数组列（含派生列，加载时无需重新计算）
+ARRAY_COLUMNS = ('language_ids', 'domain_ids', 'difficulty_ids', 'source_ids', 'tag_ids', 'tag_offsets')
+DERIVED_COLUMNS = ('lang_lower_ids', 'tag_lower_ids', 'tag_rows')
+META_FILE = 'meta.bin'
+# 仓库名/词表/稀疏字段；marshal 版本 2 保证相同内容写出相同字节
+_meta_codec = BinaryCodec(marshal_version=2)
+
+DIFFICULTY_MAP = {
+    'beginner': {'beginner': 1.0, 'intermediate': 0.6, 'advanced': 0.2},
+    'intermediate': {'beginner': 0.6, 'intermediate': 1.0, 'advanced': 0.6},
+    'advanced': {'beginner': 0.2, 'intermediate': 0.6, 'advanced': 1.0}
+}
+
+
+class _Vocab:
+    """字符串驻留词表"""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.ids = {v: i for i, v in enumerate(self.values)}
+
+    def intern(self, value):
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+    def get(self, value, default=-1):
+        return self.ids.get(value, default)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class CandidateTable:
+    """列式存储的候选池"""
+
+    def __init__(self, repos, numeric, language_ids, domain_ids, difficulty_ids, source_ids,
+                 tag_ids, tag_offsets, vocabs, org_names=None, extras=None, features=None):
+        self.repos = list(repos)
+        self.numeric = numeric                      # 字段名 -> float64 数组
+        self.language_ids = language_ids            # int32
+        self.domain_ids = domain_ids                # int32
+        self.difficulty_ids = difficulty_ids        # int32
+        self.source_ids = source_ids                # int32
+        self.tag_ids = tag_ids                      # int32，CSR 数据
+        self.tag_offsets = tag_offsets              # int64，长度 n+1
+        self.vocabs = vocabs                        # 'language'/'domain'/'difficulty'/'source'/'tag' -> _Vocab
+        self.org_names = org_names or {}            # 稀疏：行号 -> 组织名（虚拟组织项目）
+        self.extras = extras or {}                  # 稀疏：行号 -> 其他非核心字段
+        self.features = features or {}              # 特征名 -> float64 数组（缺失为 NaN）
+        self._derive()
+
+    def _derive(self):
+        """派生列：小写语言/标签编号、标签所在行，供向量化打分使用"""
+        self.index = {repo: i for i, repo in enumerate(self.repos)}
+        lower_vocab = _Vocab()
+        lang_lower = np.array([lower_vocab.intern((v or '').lower()) for v in self.vocabs['language'].values],
+                              dtype=np.int32)
+        self.lang_lower_vocab = lower_vocab
+        self.lang_lower_ids = lang_lower[self.language_ids] if len(lang_lower) else self.language_ids.copy()
+        tag_lower_vocab = _Vocab()
+        tag_lower = np.array([tag_lower_vocab.intern(v.lower()) for v in self.vocabs['tag'].values], dtype=np.int32)
+        self.tag_lower_vocab = tag_lower_vocab
+        self.tag_lower_ids = tag_lower[self.tag_ids] if len(tag_lower) else self.tag_ids.copy()
+        self.tag_rows = np.repeat(np.arange(len(self.repos), dtype=np.int32), np.diff(self.tag_offsets))
+
+    @classmethod
+    def from_pool(cls, pool):
+        """由 {repo: project} 字典构建"""
+        vocabs = {name: _Vocab() for name in ('language', 'domain', 'difficulty', 'source', 'tag')}
+        n = len(pool)
+        repos = []
+        numeric = {field: np.full(n, np.nan, dtype=np.float64) for field in NUMERIC_FIELDS}
+        language_ids = np.empty(n, dtype=np.int32)
+        domain_ids = np.empty(n, dtype=np.int32)
+        difficulty_ids = np.empty(n, dtype=np.int32)
+        source_ids = np.empty(n, dtype=np.int32)
+        tag_offsets = np.zeros(n + 1, dtype=np.int64)
+        tag_ids = []
+        org_names, extras = {}, {}
+        for i, (repo, project) in enumerate(pool.items()):
+            repos.append(repo)
+            for field in NUMERIC_FIELDS:
+                value = project.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    numeric[field][i] = value
+            language_ids[i] = vocabs['language'].intern(project.get('language') or '')
+            domain_ids[i] = vocabs['domain'].intern(project.get('domain', 'general'))
+            difficulty_ids[i] = vocabs['difficulty'].intern(project.get('difficulty', 'intermediate'))
+            source_ids[i] = vocabs['source'].intern(project.get('source', 'standard'))
+            tag_ids.extend(vocabs['tag'].intern(t) for t in project.get('tags', []))
+            tag_offsets[i + 1] = len(tag_ids)
+            if project.get('is_organization'):
+                org_names[i] = project.get('org_name') or repo.split('/')[0]
+            extra = {k: v for k, v in project.items() if k not in CORE_FIELDS}
+            if extra:
+                extras[i] = extra
+        return cls(repos, numeric, language_ids, domain_ids, difficulty_ids, source_ids,
+                   np.array(tag_ids, dtype=np.int32), tag_offsets, vocabs, org_names, extras)
+
+    def columns(self):
+        """所有数组列（含派生列与特征列）：[(列名, 数组)]，列名与 save() 的文件名一致"""
+        columns = [(f"numeric_{field}", values) for field, values in self.numeric.items()]
+        columns += [(name, getattr(self, name)) for name in ARRAY_COLUMNS + DERIVED_COLUMNS]
+        columns += [(f"feature_{name}", values) for name, values in self.features.items()]
+        return columns
+
+    def meta(self):
+        """非数组部分：仓库名、词表与稀疏字段（与 columns() 一起可由 assemble() 重建）"""
+        return {
+            'repos': list(self.repos),
+            'numeric_fields': list(self.numeric),
+            'feature_names': list(self.features),
+            'vocabs': {name: list(vocab.values) for name, vocab in self.vocabs.items()},
+            'lang_lower_vocab': list(self.lang_lower_vocab.values),
+            'tag_lower_vocab': list(self.tag_lower_vocab.values),
+            'org_names': dict(self.org_names),
+            'extras': dict(self.extras),
+        }
+
+    def save(self, directory):
+        """写出为目录：每个数组列一个 .npy，仓库名、词表与稀疏字段写入 meta.bin"""
+        os.makedirs(directory, exist_ok=True)
+        for name, values in self.columns():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+        _meta_codec.dump(self.meta(), os.path.join(directory, META_FILE))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        从 save() 写出的目录加载；mmap_mode='r' 时数组列为只读内存映射（多进程共享页缓存），
+        None 时读入私有内存
+        """
+        meta = _meta_codec.load(os.path.join(directory, META_FILE))
+
+        def column(name):
+            array = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            # 以普通 ndarray 视图访问映射内存，避免 np.memmap 子类逐元素访问的额外开销
+            return array.view(np.ndarray) if mmap_mode else array
+
+        return cls.assemble(meta, column)
+
+    @classmethod
+    def assemble(cls, meta, column):
+        """由 meta() 与按列名取数组的 column(name) 组装（不复制数组，派生列直接使用）"""
+        table = cls.__new__(cls)
+        table.repos = meta['repos']
+        table.numeric = {field: column(f"numeric_{field}") for field in meta['numeric_fields']}
+        for name in ARRAY_COLUMNS + DERIVED_COLUMNS:
+            setattr(table, name, column(name))
+        table.vocabs = {name: _Vocab(values) for name, values in meta['vocabs'].items()}
+        table.lang_lower_vocab = _Vocab(meta['lang_lower_vocab'])
+        table.tag_lower_vocab = _Vocab(meta['tag_lower_vocab'])
+        table.org_names = meta['org_names']
+        table.extras = meta['extras']
+        table.features = {name: column(f"feature_{name}") for name in meta.get('feature_names', [])}
+        table.index = {repo: i for i, repo in enumerate(table.repos)}
+        return table
+
+    def __len__(self):
+        return len(self.repos)
+
+    def nbytes(self):
+        """列数组占用的字节数（不含仓库名字符串）"""
+        arrays = list(self.numeric.values()) + [self.language_ids, self.domain_ids, self.difficulty_ids,
+                                                self.source_ids, self.tag_ids, self.tag_offsets]
+        return sum(a.nbytes for a in arrays)
+
+    def row(self, i):
+        """物化第 i 行为候选字典（与原候选池条目结构一致）"""
+        row = {
+            'repo': self.repos[i],
+            'language': self.vocabs['language'].values[self.language_ids[i]],
+            'tags': [self.vocabs['tag'].values[t] for t in self.tag_ids[self.tag_offsets[i]:self.tag_offsets[i + 1]]],
+            'difficulty': self.vocabs['difficulty'].values[self.difficulty_ids[i]],
+            'domain': self.vocabs['domain'].values[self.domain_ids[i]],
+        }
+        for field in NUMERIC_FIELDS:
+            value = float(self.numeric[field][i])
+            if np.isnan(value):
+                row[field] = None
+            elif field in INT_FIELDS and value.is_integer():
+                row[field] = int(value)
+            else:
+                row[field] = value
+        row['source'] = self.vocabs['source'].values[self.source_ids[i]]
+        if i in self.org_names:
+            row['is_organization'] = True
+            row['org_name'] = self.org_names[i]
+        if i in self.extras:
+            row.update(self.extras[i])
+        return row
+
+    def slice_rows(self, start, end):
+        """切出连续行 [start, end) 的子表（用于分片）"""
+        tag_start, tag_end = int(self.tag_offsets[start]), int(self.tag_offsets[end])
+        return CandidateTable(
+            self.repos[start:end],
+            {field: values[start:end].copy() for field, values in self.numeric.items()},
+            self.language_ids[start:end].copy(), self.domain_ids[start:end].copy(),
+            self.difficulty_ids[start:end].copy(), self.source_ids[start:end].copy(),
+            self.tag_ids[tag_start:tag_end].copy(), self.tag_offsets[start:end + 1] - tag_start, self.vocabs,
+            {r - start: v for r, v in self.org_names.items() if start <= r < end},
+            {r - start: v for r, v in self.extras.items() if start <= r < end},
+            {name: values[start:end].copy() for name, values in self.features.items()})
+
+    def attach_features(self, rows, columns):
+        """写入特征列：rows 为行号，columns 为 {特征名: 与 rows 等长的数组}，其余行为 NaN"""
+        rows = np.asarray(rows, dtype=np.int64)
+        for name, values in columns.items():
+            column = np.full(len(self.repos), np.nan)
+            column[rows] = values
+            self.features[name] = column
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 派生列在反序列化时重建，减少跨进程传输量
+        for key in ('index', 'lang_lower_vocab', 'lang_lower_ids', 'tag_lower_vocab', 'tag_lower_ids', 'tag_rows'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._derive()
+
+    # ---- 向量化打分（与 scoring.calculate_match_score 逐项一致） ----
+
+    def _tag_subset(self, rows):
+        """rows 所在行的 CSR 标签 -> (小写标签编号, 所在位置 0..len(rows)-1)；rows 为 None 时为全表"""
+        if rows is None:
+            return self.tag_lower_ids, self.tag_rows
+        starts = self.tag_offsets[rows]
+        lengths = (self.tag_offsets[rows + 1] - starts).astype(np.int64)
+        total = int(lengths.sum())
+        # 各行标签区间拼接后的全局下标：区间起点重复 length 次 + 区间内偏移
+        begins = np.cumsum(lengths) - lengths
+        index = np.repeat(starts - begins, lengths) + np.arange(total, dtype=np.int64)
+        return self.tag_lower_ids[index], np.repeat(np.arange(len(rows), dtype=np.int32), lengths)
+
+    @staticmethod
+    def _tag_hit(tag_lower_ids, tag_rows, n, lower_tag_ids):
+        """每行是否含有给定小写标签之一"""
+        if len(lower_tag_ids) == 0 or len(tag_lower_ids) == 0:
+            return np.zeros(n, dtype=bool)
+        mask = np.isin(tag_lower_ids, lower_tag_ids)
+        return np.bincount(tag_rows[mask], minlength=n) > 0
+
+    def quality_scores(self, rows=None):
+        """项目质量分（0-1），rows 为 None 时计算全表"""
+        def col(field, default):
+            values = self.numeric[field] if rows is None else self.numeric[field][rows]
+            return np.where(np.isnan(values) | (values == 0), default, values)
+        openrank = col('openrank', 70.0)
+        activity = col('activity', 70.0)
+        stars = col('stars', 1000.0)
+        stars_scaled = (np.log1p(stars) / np.log1p(100000))
+        return (0.6 * (openrank / 100.0) + 0.4 * (activity / 100.0)) * 0.8 + stars_scaled * 0.2
+
+    def static_priors(self):
+        """与用户无关的静态先验分（与 scoring.calculate_static_prior 逐项一致）"""
+        top300 = np.where(self.source_ids == self.vocabs['source'].get('top_300'), 0.03, 0.0)
+        return 0.15 * self.quality_scores() + top300
+
+    def trend_scores(self, rows=None):
+        """趋势分（0-1，无时间序列特征的候选为中性 0.5），见 timeseries_features.trend_score"""
+        if 'openrank_growth' not in self.features:
+            return np.full(len(self.repos) if rows is None else len(rows), 0.5)
+        sel = slice(None) if rows is None else rows
+        return trend_score({name: self.features[name][sel] for name in ('openrank_growth', 'activity_growth')})
+
+    def component_scores(self, user_profile, skill_graph, rows=None, cf_vector=None):
+        """
+        各打分分量（与用户相关）：返回 dict，键为 skill/domain/difficulty/quality/top300/trend，
+        每项为与 rows（None 表示全表）等长的 float64 数组（top300 为 0/1 标记）；
+        按 scoring.DEFAULT_WEIGHTS 组合即为 score()，trend 目前权重为 0。
+        给出 cf_vector（协同过滤用户向量）且候选池有 cf_factors 特征时另含 cf = clip(因子 · 向量, 0, 1)
+        给出 rows 时只读取这些行的列与标签区间，代价与 len(rows) 成正比，与候选池大小无关
+        """
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+        n = len(self.repos) if rows is None else len(rows)
+
+        def col(values):
+            return values if rows is None else values[rows]
+
+        tag_lower_ids, tag_rows = self._tag_subset(rows)
+
+        # 技能匹配
+        skill_score = np.zeros(n, dtype=np.float64)
+        skill_weight_sum = 0.0
+        lang_ids = col(self.lang_lower_ids)
+        empty_lang = self.lang_lower_vocab.get('')
+        for skill, strength in user_profile.get('skills', {}).items():
+            w = float(strength)
+            if w <= 0:
+                continue
+            skill_weight_sum += w
+            skill_lower = skill.lower()
+            lang_code = self.lang_lower_vocab.get(skill_lower)
+            lang_hit = (lang_ids == lang_code) & (lang_ids != empty_lang) if lang_code >= 0 else np.zeros(n, dtype=bool)
+            tag_code = self.tag_lower_vocab.get(skill_lower)
+            tag_hit = self._tag_hit(tag_lower_ids, tag_rows, n, [tag_code] if tag_code >= 0 else [])
+            if skill in skill_graph:
+                related = [self.tag_lower_vocab.get(rs.lower()) for rs in skill_graph[skill].get('related', [])]
+                rel_hit = self._tag_hit(tag_lower_ids, tag_rows, n, [r for r in related if r >= 0])
+            else:
+                rel_hit = np.zeros(n, dtype=bool)
+            s = np.where(lang_hit, 1.0, np.where(tag_hit, 0.9, np.where(rel_hit, 0.6, 0.0)))
+            skill_score += w * s
+        skill_match = (skill_score / skill_weight_sum) if skill_weight_sum > 0 else np.zeros(n, dtype=np.float64)
+
+        # 领域匹配
+        domains = user_profile.get('domains', [])
+        domain_match = np.zeros(n, dtype=np.float64)
+        if domains:
+            domain_ids = col(self.domain_ids)
+            in_domains = np.isin(domain_ids, [self.vocabs['domain'].get(d) for d in domains])
+            core_code = self.vocabs['domain'].get(domains[0])
+            domain_match = np.where(in_domains, np.where(domain_ids == core_code, 1.0, 0.4), 0.0)
+
+        # 难度适配
+        level_map = DIFFICULTY_MAP.get(user_profile.get('experience_level', 'intermediate'), {})
+        lookup = np.array([level_map.get(d, 0.6) for d in self.vocabs['difficulty'].values] or [0.6], dtype=np.float64)
+        difficulty_score = lookup[col(self.difficulty_ids)]
+
+        top300_code = self.vocabs['source'].get('top_300')
+        top300 = np.where(col(self.source_ids) == top300_code, 1.0, 0.0)
+
+        components = {
+            'skill': skill_match,
+            'domain': domain_match,
+            'difficulty': difficulty_score,
+            'quality': self.quality_scores(rows),
+            'top300': top300,
+            'trend': self.trend_scores(rows),
+        }
+        if cf_vector is not None and 'cf_factors' in self.features:
+            factors = col(self.features['cf_factors'])
+            components['cf'] = np.clip(factors @ np.asarray(cf_vector, dtype=factors.dtype), 0.0, 1.0).astype(np.float64)
+        return components
+
+    def score(self, user_profile, skill_graph, rows=None, cf_vector=None):
+        """原始匹配分（0-100），无协同过滤分量时与逐条 calculate_match_score 结果一致"""
+        return combine_components(self.component_scores(user_profile, skill_graph, rows, cf_vector), user_profile)
+
+    def bucket_ids(self, core_domain, rows=None):
+        """多样性分组：0/1 = 核心领域 top_300/标准，2/3 = 其他领域 top_300/标准"""
+        domain_ids = self.domain_ids if rows is None else self.domain_ids[rows]
+        source_ids = self.source_ids if rows is None else self.source_ids[rows]
+        core = domain_ids == self.vocabs['domain'].get(core_domain)
+        top300 = source_ids == self.vocabs['source'].get('top_300')
+        return np.where(core, 0, 2) + np.where(top300, 0, 1)
+
+
+def top_k_per_bucket(sorted_buckets, k):
+    """按排名排序的分组编号 -> 每组前 k 个的排名位置（升序）"""
+    positions = [np.flatnonzero(sorted_buckets == b)[:k] for b in np.unique(sorted_buckets)]
+    return np.sort(np.concatenate(positions)) if positions else np.empty(0, dtype=np.int64)
+
+
+class CandidatePoolView(Mapping):
+    """以 {repo: project} 字典接口只读访问 CandidateTable（按需物化行）"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, repo):
+        return self.table.row(self.table.index[repo])
+
+    def __contains__(self, repo):
+        return repo in self.table.index
+
+    def __iter__(self):
+        return iter(self.table.repos)
+
+    def __len__(self):
+        return len(self.table)
@@ -0,0 +1,146 @@
+"""
+上游熔断器（每个上游主机一个）
+GitHub / OpenDigger 限流或故障时，每次请求都要等到 30 秒超时，OpenDigger 还会退避重试 3 次，
+一次 /recommend 可能耗时数分钟。熔断器在连续失败达到阈值后打开：打开期间直接拒绝请求，
+调用方立即使用缓存（含过期缓存）或默认值；经过 reset_timeout 后进入半开状态放行少量探测请求，
+探测成功则关闭，失败则重新打开。
+
+状态：closed（正常）→ open（拒绝）→ half_open（探测）→ closed / open
+失败的判定由调用方决定（网络异常、5xx、429 计为失败；404 等正常响应说明上游可用，计为成功）。
+配置：OPENRANK_BREAKER_THRESHOLD（连续失败次数，默认 5）、OPENRANK_BREAKER_RESET（秒，默认 30）
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """线程安全的熔断器"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._probe_started_at = None
+        # 统计
+        self._successes = 0
+        self._failures = 0
+        self._rejected = 0
+        self._opened_count = 0
+        self._last_failure = None
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self):
+        """open 状态超过 reset_timeout 后转为 half_open（调用方持有锁）"""
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+            logger.info("[熔断] %s 进入半开状态，放行探测请求", self.name)
+
+    def allow(self):
+        """是否放行本次请求；返回 False 时调用方应立即降级（缓存或默认值）"""
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN:
+                # 探测请求长时间未回报（如被取消）时允许发起新的探测
+                stale = self._probe_started_at is not None and self._clock() - self._probe_started_at >= self.reset_timeout
+                if self._probes < self.half_open_max_calls or stale:
+                    self._probes = 1 if stale else self._probes + 1
+                    self._probe_started_at = self._clock()
+                    return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._successes += 1
+            self._consecutive_failures = 0
+            if self._state != CLOSED:
+                logger.warning("[熔断] %s 探测成功，恢复正常", self.name)
+                self._state = CLOSED
+                self._probes = 0
+                self._probe_started_at = None
+
+    def record_failure(self, reason=None):
+        with self._lock:
+            self._failures += 1
+            self._consecutive_failures += 1
+            self._last_failure = str(reason) if reason is not None else None
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._opened_count += 1
+        self._probes = 0
+        self._probe_started_at = None
+        logger.warning("[熔断] %s 已打开（连续失败 %d 次，%s 秒后探测）：%s",
+                       self.name, self._consecutive_failures, self.reset_timeout, self._last_failure)
+
+    def snapshot(self):
+        """当前状态与统计（供 /metrics 输出）"""
+        with self._lock:
+            self._advance()
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (self._clock() - self._opened_at)), 1)
+            return {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'successes': self._successes,
+                'failures': self._failures,
+                'rejected': self._rejected,
+                'opened_count': self._opened_count,
+                'retry_in': retry_in,
+                'last_failure': self._last_failure,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url_or_host):
+    """按上游主机获取（必要时创建）熔断器，参数可为 URL 或主机名"""
+    host = urlsplit(url_or_host).netloc if '://' in url_or_host else url_or_host
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    host,
+                    failure_threshold=int(os.environ.get('OPENRANK_BREAKER_THRESHOLD') or 5),
+                    reset_timeout=float(os.environ.get('OPENRANK_BREAKER_RESET') or 30))
+                _breakers[host] = breaker
+    return breaker
+
+
+def breaker_metrics():
+    """所有上游熔断器的状态 {主机: snapshot}"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {host: breaker.snapshot() for host, breaker in sorted(breakers.items())}
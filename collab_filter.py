@@ -0,0 +1,451 @@
+"""
+协同过滤（离线训练的隐因子模型）
+现有打分只看内容（标签、语言、领域重合）。这里从离线交互数据（已分析用户的 star、批量导出的
+star / 贡献记录）构建稀疏的 用户 × 仓库 矩阵，用纯 NumPy 分解（不依赖 SciPy）：
+- ALS：隐式反馈交替最小二乘（置信度 1 + alpha·r），默认以上一轮结果为初值做几步共轭梯度
+  （所有用户 / 仓库向量化同时迭代，每步 O(交互数 · k)）；solver='exact' 时逐块批量精确求解 k×k 方程组。
+  分块大小受 chunk_bytes 限制，内存与交互数线性相关
+- SVD：随机化截断 SVD（二值化矩阵，幂迭代 + QR），适合快速得到基线
+
+仓库因子按候选池顺序对齐后作为候选池特征列 cf_factors 写入产物（pool_artifact.py build --cf-model），
+用户因子、Gram 矩阵与参数一并写入；请求时协同分量 = clip(仓库因子 · 用户向量, 0, 1)，
+每个召回候选一次点积，按 scoring.DEFAULT_WEIGHTS['cf'] 计入匹配分。
+训练集中没有的用户可按其 star 的仓库即时折叠（fold-in，一次 k×k 求解）得到用户向量。
+
+交互文件：.jsonl（每行 {"user": ..., "repo": "owner/name", "weight": 1}）或 .csv/.tsv（user,repo[,weight]）
+
+用法：
+    python collab_filter.py train --interactions stars.jsonl [--starred-users users.txt] [--method als] -o cf_model.npz
+    python collab_filter.py bench [--sizes 2000:5000:20 20000:50000:20] [--factors 32]
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACTORS = 32
+# 单个分块中 k×k 外积占用的字节上限
+DEFAULT_CHUNK_BYTES = 64 << 20
+STARRED_CACHE_TIME = 24 * 3600
+
+
+def load_interactions(path):
+    """读取交互文件，产出 (用户, 仓库, 权重)"""
+    if path.lower().endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                yield record['user'], record['repo'], float(record.get('weight', 1.0))
+        return
+    delimiter = '\t' if path.lower().endswith('.tsv') else ','
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) < 2 or row[0].strip().lower() == 'user':
+                continue
+            yield row[0].strip(), row[1].strip(), float(row[2]) if len(row) > 2 and row[2].strip() else 1.0
+
+
+def starred_repos(recommender, username, max_pages=1):
+    """用户 star 的仓库全名（经推荐器的 API 缓存、熔断与时间预算）"""
+    repos = []
+    for page in range(1, max_pages + 1):
+        url = f"{recommender.github_api}/users/{username}/starred?per_page=100&page={page}"
+        data = recommender._make_api_request(url, cache_time=STARRED_CACHE_TIME)
+        if not data or not isinstance(data, list):
+            break
+        repos.extend(item['full_name'] for item in data if isinstance(item, dict) and item.get('full_name'))
+        if len(data) < 100:
+            break
+    return repos
+
+
+def starred_interactions(recommender, usernames, max_pages=3):
+    for username in usernames:
+        for repo in starred_repos(recommender, username, max_pages):
+            yield username, repo, 1.0
+
+
+class InteractionMatrix:
+    """用户 × 仓库稀疏矩阵（CSR：indptr / indices / data），用户名与仓库名统一小写"""
+
+    def __init__(self, users, repos, indptr, indices, data):
+        self.users = list(users)
+        self.repos = list(repos)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @classmethod
+    def from_coo(cls, users, repos, rows, cols, values):
+        """由 (行, 列, 值) 构建，重复项累加"""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        order = np.lexsort((cols, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        if len(rows):
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            starts = np.flatnonzero(first)
+            values = np.add.reduceat(values, starts)
+            rows, cols = rows[starts], cols[starts]
+        indptr = np.zeros(len(users) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(users)), out=indptr[1:])
+        return cls(users, repos, indptr, cols.astype(np.int32), values)
+
+    @classmethod
+    def from_interactions(cls, interactions):
+        user_ids, repo_ids = {}, {}
+        rows, cols, values = [], [], []
+        for user, repo, weight in interactions:
+            rows.append(user_ids.setdefault(user.lower(), len(user_ids)))
+            cols.append(repo_ids.setdefault(repo.lower(), len(repo_ids)))
+            values.append(weight)
+        return cls.from_coo(list(user_ids), list(repo_ids), rows, cols, values)
+
+    @property
+    def shape(self):
+        return len(self.users), len(self.repos)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def transpose(self):
+        """仓库 × 用户（CSR）"""
+        rows = np.repeat(np.arange(len(self.users), dtype=np.int64), np.diff(self.indptr))
+        return InteractionMatrix.from_coo(self.repos, self.users, self.indices, rows, self.data)
+
+
+def _row_chunks(indptr, max_nnz):
+    """按交互数分块遍历非空行，产出 (行号, 交互起点, 交互终点, 各行在块内的起点)"""
+    counts = np.diff(indptr)
+    rows = np.flatnonzero(counts)
+    if len(rows) == 0:
+        return
+    cumulative = np.cumsum(counts[rows])
+    start = 0
+    while start < len(rows):
+        offset = cumulative[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(cumulative, offset + max_nnz, side='right')))
+        chunk = rows[start:end]
+        lo, hi = int(indptr[chunk[0]]), int(indptr[chunk[-1] + 1])
+        yield chunk, lo, hi, indptr[chunk] - lo
+        start = end
+
+
+def _spmm(matrix, dense, max_nnz=1 << 22):
+    """稀疏矩阵 × 稠密矩阵"""
+    out = np.zeros((len(matrix.indptr) - 1, dense.shape[1]), dtype=np.float64)
+    for rows, lo, hi, starts in _row_chunks(matrix.indptr, max_nnz):
+        products = matrix.data[lo:hi, None] * dense[matrix.indices[lo:hi]]
+        out[rows] = np.add.reduceat(products, starts, axis=0)
+    return out
+
+
+def _als_half_step(matrix, fixed, regularization, alpha, chunk_bytes):
+    """固定一侧因子，逐块批量精确求解另一侧：(YᵀY + Yᵀ(C-I)Y + λI) x = YᵀC p（每个交互展开 k×k 外积）"""
+    k = fixed.shape[1]
+    base = fixed.T @ fixed + regularization * np.eye(k)
+    solved = np.zeros((len(matrix.indptr) - 1, k), dtype=np.float64)
+    max_nnz = max(1, chunk_bytes // (k * k * 8))
+    for rows, lo, hi, starts in _row_chunks(matrix.indptr, max_nnz):
+        factors = fixed[matrix.indices[lo:hi]]
+        confidence = 1.0 + alpha * matrix.data[lo:hi].astype(np.float64)
+        weighted = factors * (confidence - 1.0)[:, None]
+        if len(rows) == 1:
+            # 单行交互过多时不展开外积
+            gram = (weighted.T @ factors)[None]
+        else:
+            gram = np.add.reduceat(np.einsum('ni,nj->nij', weighted, factors), starts, axis=0)
+        rhs = np.add.reduceat(factors * confidence[:, None], starts, axis=0)
+        solved[rows] = np.linalg.solve(base + gram, rhs[:, :, None])[:, :, 0]
+    return solved
+
+
+def _als_half_step_cg(matrix, fixed, current, regularization, alpha, cg_steps, chunk_bytes):
+    """
+    同 _als_half_step，但以上一轮结果为初值做 cg_steps 步共轭梯度（所有行向量化同时迭代）：
+    每步只需 O(交互数 · k)，不展开 k×k 外积
+    """
+    k = fixed.shape[1]
+    base = fixed.T @ fixed + regularization * np.eye(k)
+    solved = np.zeros((len(matrix.indptr) - 1, k), dtype=np.float64)
+    max_nnz = max(1, chunk_bytes // (k * 8 * 4))
+    for rows, lo, hi, starts in _row_chunks(matrix.indptr, max_nnz):
+        factors = fixed[matrix.indices[lo:hi]]
+        confidence = 1.0 + alpha * matrix.data[lo:hi].astype(np.float64)
+        owner = np.repeat(np.arange(len(rows)), np.diff(np.append(starts, hi - lo)))
+
+        def apply(v):
+            projected = (factors * v[owner]).sum(axis=1) * (confidence - 1.0)
+            return v @ base + np.add.reduceat(factors * projected[:, None], starts, axis=0)
+
+        x = current[rows].astype(np.float64)
+        residual = np.add.reduceat(factors * confidence[:, None], starts, axis=0) - apply(x)
+        direction = residual.copy()
+        norm = (residual * residual).sum(axis=1)
+        for _ in range(cg_steps):
+            applied = apply(direction)
+            curvature = (direction * applied).sum(axis=1)
+            step = np.divide(norm, curvature, out=np.zeros_like(norm), where=curvature > 1e-12)
+            x += step[:, None] * direction
+            residual -= step[:, None] * applied
+            new_norm = (residual * residual).sum(axis=1)
+            beta = np.divide(new_norm, norm, out=np.zeros_like(norm), where=norm > 1e-20)
+            direction = residual + beta[:, None] * direction
+            norm = new_norm
+        solved[rows] = x
+    return solved
+
+
+class CFModel:
+    """训练得到的隐因子模型（用户因子、仓库因子与 fold-in 所需参数）"""
+
+    def __init__(self, users, repos, user_factors, item_factors, regularization, alpha, method='als'):
+        self.users = list(users)
+        self.repos = list(repos)
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.regularization = float(regularization)
+        self.alpha = float(alpha)
+        self.method = method
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def save(self, path):
+        """写出 .npz（不使用 pickle）"""
+        np.savez(path, users=np.array(self.users, dtype=str), repos=np.array(self.repos, dtype=str),
+                 user_factors=self.user_factors, item_factors=self.item_factors,
+                 params=np.array([self.regularization, self.alpha]), method=np.array(self.method))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['users'].tolist(), data['repos'].tolist(), data['user_factors'], data['item_factors'],
+                       data['params'][0], data['params'][1], str(data['method']))
+
+    def pool_factors(self, table):
+        """按候选池顺序对齐的仓库因子（训练集中没有的候选为零向量）"""
+        aligned = np.zeros((len(table), self.factors), dtype=np.float32)
+        positions = {repo: i for i, repo in enumerate(self.repos)}
+        hits = [(row, positions[repo.lower()]) for row, repo in enumerate(table.repos) if repo.lower() in positions]
+        if hits:
+            rows, items = np.array(hits).T
+            aligned[rows] = self.item_factors[items]
+        logger.info("[协同过滤] %d/%d 个候选有仓库因子", len(hits), len(table))
+        return aligned
+
+    def artifact_features(self):
+        """写入产物的模型参数（仓库因子另作为候选池特征列 cf_factors 保存）"""
+        item = self.item_factors.astype(np.float64)
+        return {
+            'cf_users': np.array(self.users, dtype=str),
+            'cf_user_factors': self.user_factors,
+            'cf_gram': item.T @ item,
+            'cf_params': np.array([self.regularization, self.alpha]),
+        }
+
+
+def train_als(matrix, factors=DEFAULT_FACTORS, iterations=10, regularization=0.1, alpha=40.0, seed=0,
+              solver='cg', cg_steps=3, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """隐式反馈 ALS；solver='cg' 为共轭梯度近似求解（默认，快），'exact' 为逐行精确求解"""
+    rng = np.random.default_rng(seed)
+    n_users, n_items = matrix.shape
+    item_factors = rng.normal(scale=0.01, size=(n_items, factors))
+    transposed = matrix.transpose()
+    user_factors = np.zeros((n_users, factors))
+    for iteration in range(iterations):
+        started = time.perf_counter()
+        if solver == 'exact':
+            user_factors = _als_half_step(matrix, item_factors, regularization, alpha, chunk_bytes)
+            item_factors = _als_half_step(transposed, user_factors, regularization, alpha, chunk_bytes)
+        else:
+            user_factors = _als_half_step_cg(matrix, item_factors, user_factors, regularization, alpha,
+                                             cg_steps, chunk_bytes)
+            item_factors = _als_half_step_cg(transposed, user_factors, item_factors, regularization, alpha,
+                                             cg_steps, chunk_bytes)
+        logger.info("[协同过滤] ALS 第 %d/%d 轮，耗时 %.2f 秒", iteration + 1, iterations, time.perf_counter() - started)
+    return CFModel(matrix.users, matrix.repos, user_factors, item_factors, regularization, alpha, 'als')
+
+
+def train_svd(matrix, factors=DEFAULT_FACTORS, oversample=10, power_iterations=2, seed=0, regularization=0.1):
+    """随机化截断 SVD（二值化矩阵），用户 / 仓库因子各乘 sqrt(奇异值)"""
+    rng = np.random.default_rng(seed)
+    binary = InteractionMatrix(matrix.users, matrix.repos, matrix.indptr, matrix.indices,
+                               np.ones_like(matrix.data))
+    transposed = binary.transpose()
+    rank = min(factors + oversample, *matrix.shape)
+    basis, _ = np.linalg.qr(_spmm(binary, rng.standard_normal((matrix.shape[1], rank))))
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(_spmm(binary, _spmm(transposed, basis)))
+    # B = Qᵀ A（rank × 仓库数），经 Aᵀ Q 计算
+    small_u, singular, vt = np.linalg.svd(_spmm(transposed, basis).T, full_matrices=False)
+    k = min(factors, len(singular))
+    scale = np.sqrt(singular[:k])
+    user_factors = (basis @ small_u[:, :k]) * scale
+    item_factors = vt[:k].T * scale
+    return CFModel(matrix.users, matrix.repos, user_factors, item_factors, regularization, 0.0, 'svd')
+
+
+class CFScorer:
+    """请求时的协同分量：用户向量查找 / fold-in，候选因子来自候选池特征列 cf_factors"""
+
+    def __init__(self, table, users, user_factors, gram, regularization, alpha):
+        self.table = table
+        self.user_index = {name: i for i, name in enumerate(users)}
+        self.user_factors = user_factors
+        self.gram = np.asarray(gram, dtype=np.float64)
+        self.regularization = float(regularization)
+        self.alpha = float(alpha)
+        self._repo_index = None
+
+    @classmethod
+    def from_features(cls, table, features):
+        """由产物加载（产物中没有协同过滤模型时返回 None）"""
+        if 'cf_factors' not in table.features or 'cf_users' not in features:
+            return None
+        regularization, alpha = features['cf_params']
+        return cls(table, features['cf_users'].tolist(), features['cf_user_factors'], features['cf_gram'],
+                   regularization, alpha)
+
+    @classmethod
+    def from_model(cls, table, model):
+        """联网模式：把模型的仓库因子对齐并写入候选池特征列"""
+        table.features['cf_factors'] = model.pool_factors(table)
+        params = model.artifact_features()
+        return cls(table, model.users, params['cf_user_factors'], params['cf_gram'], model.regularization, model.alpha)
+
+    def known(self, username):
+        return username.lower() in self.user_index
+
+    def user_vector(self, username, repos=()):
+        """训练集中的用户直接取因子，否则按其交互过的候选 fold-in；都没有时返回 None"""
+        position = self.user_index.get(username.lower())
+        if position is not None:
+            return np.asarray(self.user_factors[position], dtype=np.float64)
+        if self._repo_index is None:
+            self._repo_index = {repo.lower(): i for i, repo in enumerate(self.table.repos)}
+        rows = sorted({self._repo_index[r.lower()] for r in repos if r.lower() in self._repo_index})
+        if not rows:
+            return None
+        factors = np.asarray(self.table.features['cf_factors'][rows], dtype=np.float64)
+        confidence = 1.0 + self.alpha
+        a = self.gram + factors.T @ factors * (confidence - 1.0) + self.regularization * np.eye(len(self.gram))
+        return np.linalg.solve(a, factors.sum(axis=0) * confidence)
+
+
+def synthetic_matrix(n_users, n_items, per_user=20, seed=0):
+    """基准测试用的合成交互矩阵（仓库热度服从幂律）"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, n_items + 1) ** 0.8
+    cols = rng.choice(n_items, size=n_users * per_user, p=popularity / popularity.sum())
+    rows = np.repeat(np.arange(n_users), per_user)
+    return InteractionMatrix.from_coo([f"u{i}" for i in range(n_users)], [f"r/{i}" for i in range(n_items)],
+                                      rows, cols, np.ones(len(cols), dtype=np.float32))
+
+
+def benchmark(sizes, factors=DEFAULT_FACTORS, iterations=3, methods=('als', 'svd')):
+    """随矩阵规模增长测量训练耗时与峰值内存（tracemalloc 统计 NumPy 分配）"""
+    results = []
+    for n_users, n_items, per_user in sizes:
+        matrix = synthetic_matrix(n_users, n_items, per_user)
+        for method in methods:
+            tracemalloc.start()
+            started = time.perf_counter()
+            if method == 'als':
+                train_als(matrix, factors=factors, iterations=iterations)
+            else:
+                train_svd(matrix, factors=factors)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({
+                'method': method, 'users': n_users, 'items': n_items, 'nnz': matrix.nnz,
+                'matrix_mb': round(matrix.nbytes() / 1e6, 2), 'seconds': round(elapsed, 3),
+                'seconds_per_iteration': round(elapsed / iterations, 3) if method == 'als' else None,
+                'peak_mb': round(peak / 1e6, 1),
+            })
+    return results
+
+
+def _parse_size(text):
+    parts = [int(p) for p in text.split(':')]
+    if len(parts) == 2:
+        parts.append(20)
+    return tuple(parts)
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='训练协同过滤模型 / 基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+    train = sub.add_parser('train', help='由交互数据训练模型')
+    train.add_argument('--interactions', action='append', default=[], help='交互文件（.jsonl/.csv/.tsv，可重复）')
+    train.add_argument('--starred-users', help='名单文件：拉取这些用户 star 的仓库作为交互')
+    train.add_argument('--starred-pages', type=int, default=3, help='每个用户最多拉取的 star 页数（每页 100）')
+    train.add_argument('--token', default=os.environ.get('GITHUB_TOKEN'), help='GitHub Token（默认取 GITHUB_TOKEN）')
+    train.add_argument('--method', choices=('als', 'svd'), default='als')
+    train.add_argument('--factors', type=int, default=DEFAULT_FACTORS)
+    train.add_argument('--iterations', type=int, default=10, help='ALS 迭代轮数')
+    train.add_argument('--regularization', type=float, default=0.1)
+    train.add_argument('--alpha', type=float, default=40.0, help='ALS 置信度系数')
+    train.add_argument('--solver', choices=('cg', 'exact'), default='cg', help='ALS 求解方式（默认共轭梯度）')
+    train.add_argument('-o', '--output', default='cf_model.npz')
+    bench = sub.add_parser('bench', help='随矩阵规模增长测量训练耗时与内存')
+    bench.add_argument('--sizes', nargs='+', default=['2000:5000:20', '10000:20000:20', '50000:50000:20'],
+                       help='用户数:仓库数[:每用户交互数]')
+    bench.add_argument('--factors', type=int, default=DEFAULT_FACTORS)
+    bench.add_argument('--iterations', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        for row in benchmark([_parse_size(s) for s in args.sizes], factors=args.factors, iterations=args.iterations):
+            print(json.dumps(row, ensure_ascii=False))
+        return
+
+    def interactions():
+        for path in args.interactions:
+            yield from load_interactions(path)
+        if args.starred_users:
+            from profile_warmup import load_usernames
+            from smartreporecommend import SmartRepoRecommender
+            artifact = os.environ.get('OPENRANK_POOL_ARTIFACT', 'artifacts')
+            recommender = SmartRepoRecommender(github_token=args.token,
+                                               pool_artifact=artifact if os.path.exists(artifact) else None)
+            yield from starred_interactions(recommender, load_usernames(args.starred_users), args.starred_pages)
+
+    matrix = InteractionMatrix.from_interactions(interactions())
+    if matrix.nnz == 0:
+        parser.error('没有读取到任何交互')
+    logger.info("[协同过滤] 交互矩阵 %d 用户 × %d 仓库，%d 个交互", *matrix.shape, matrix.nnz)
+    started = time.perf_counter()
+    if args.method == 'als':
+        model = train_als(matrix, factors=args.factors, iterations=args.iterations,
+                          regularization=args.regularization, alpha=args.alpha, solver=args.solver)
+    else:
+        model = train_svd(matrix, factors=args.factors, regularization=args.regularization)
+    model.save(args.output)
+    print(f"已写入 {args.output}（{args.method}，{matrix.shape[0]} 用户 × {matrix.shape[1]} 仓库，"
+          f"{matrix.nnz} 个交互，训练 {time.perf_counter() - started:.1f} 秒）")
+
+
+if __name__ == '__main__':
+    main()
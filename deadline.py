@@ -0,0 +1,125 @@
+"""
+请求级时间预算（deadline）
+一次推荐请求创建一个 Deadline，经 contextvars 传递给画像拉取、指标补充与打分各阶段
+（与请求ID相同的传递方式，copy_context 后同样进入线程池）：
+- 网络请求的超时不超过剩余预算
+- 预算耗尽后各阶段降级：使用（过期）缓存、跳过可选请求、退回基于用户名哈希的默认画像，
+  并记录降级原因；响应据此标记为部分结果（partial）
+- stage() 记录各阶段耗时，随响应返回
+
+未设置 Deadline 时（离线构建、命令行）所有辅助函数均为空操作，不限制耗时。
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 网络请求的最小超时（秒），避免把 0 传给 requests
+MIN_TIMEOUT = 0.05
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class Deadline:
+    """单个请求的时间预算、阶段耗时与降级记录"""
+
+    def __init__(self, budget=None, clock=time.monotonic):
+        """budget: 预算秒数，None 表示不限时（仍记录阶段耗时）"""
+        self.budget = budget
+        self._clock = clock
+        self.started = clock()
+        self.expires_at = self.started + budget if budget is not None else None
+        self.timings = {}
+        self.degraded = []
+        self._stage = None
+
+    def remaining(self):
+        if self.expires_at is None:
+            return float('inf')
+        return self.expires_at - self._clock()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        """不超过剩余预算的超时秒数"""
+        return max(MIN_TIMEOUT, min(cap, self.remaining()))
+
+    @contextmanager
+    def stage(self, name):
+        previous, self._stage = self._stage, name
+        started = self._clock()
+        try:
+            yield self
+        finally:
+            elapsed = (self._clock() - started) * 1000
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 1)
+            self._stage = previous
+
+    def degrade(self, reason, stage=None):
+        """记录一次降级（同一阶段的同一原因只记一次）"""
+        entry = {'stage': stage or self._stage or 'unknown', 'reason': reason}
+        if entry not in self.degraded:
+            self.degraded.append(entry)
+            logger.info("[时间预算] 阶段 %s 降级：%s", entry['stage'], reason)
+
+    @property
+    def partial(self):
+        return bool(self.degraded)
+
+    def report(self):
+        """响应中附带的预算信息"""
+        return {
+            'partial': self.partial,
+            'degraded': list(self.degraded),
+            'timings': dict(self.timings),
+            'elapsed_ms': round((self._clock() - self.started) * 1000, 1),
+            'budget_ms': round(self.budget * 1000) if self.budget is not None else None,
+        }
+
+
+def current_deadline():
+    return _current.get()
+
+
+@contextmanager
+def use_deadline(deadline):
+    """在当前上下文中启用 deadline（None 时不改变当前设置）"""
+    if deadline is None:
+        yield None
+        return
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """记录当前请求某个阶段的耗时（无 deadline 时为空操作）"""
+    deadline = _current.get()
+    if deadline is None:
+        yield None
+        return
+    with deadline.stage(name):
+        yield deadline
+
+
+def deadline_expired():
+    deadline = _current.get()
+    return deadline is not None and deadline.expired()
+
+
+def remaining_timeout(cap):
+    """网络请求超时：有 deadline 时取 min(cap, 剩余预算)，否则为 cap"""
+    deadline = _current.get()
+    return cap if deadline is None else deadline.timeout(cap)
+
+
+def mark_degraded(reason):
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.degrade(reason)
@@ -0,0 +1,146 @@
+"""
+配额式多样性选择器
+输入一串按分数降序的候选（打分结果；无序时先排序一次），按需顺序读取并分入各优先级分层（tier）
+的惰性堆，只处理真正用到的前缀；按分层优先级依次弹出，满足各维度配额
+（domain / source / language / org，每页每个取值最多若干个）的候选入选。
+总代价不超过 O(n + k log n)，与分层数量、配额维度数量无关：
+- 某分层的所有候选在某维度上取值相同（如 top_300 分层的 source）且该取值配额已满时，整层跳过，不逐个弹出
+- 因配额落选的候选暂存，本页结束后放回堆中，可进入下一页
+
+默认策略与原 _ensure_absolute_diversity 一致：分层顺序为 核心领域 top_300 → 其他领域 top_300
+→ 核心领域标准项目 → 其他领域标准项目，source=top_300 每页最多 max_top300_per_user 个，页内按分数降序。
+"""
+import heapq
+
+# 配额维度 -> 候选上的取值
+DIMENSIONS = {
+    'domain': lambda p: p.get('domain', 'general'),
+    'source': lambda p: p.get('source', 'standard'),
+    'language': lambda p: p.get('language') or '',
+    'org': lambda p: ((p.get('repo') or '').split('/')[0] or p.get('org') or '').lower(),
+}
+# 配额中匹配其余取值的通配键
+ANY = '*'
+
+
+def validate_quotas(quotas):
+    """检查配额配置 {维度: {取值或 '*': 每页上限}}，返回规范化后的副本；不合法时抛出 ValueError"""
+    normalized = {}
+    for dimension, limits in (quotas or {}).items():
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"未知的多样性维度: {dimension}（可选: {', '.join(DIMENSIONS)}）")
+        if not isinstance(limits, dict):
+            raise ValueError(f"配额必须是 {{取值: 上限}} 对象: {dimension}")
+        normalized[dimension] = {value: int(limit) for value, limit in limits.items()}
+    return normalized
+
+
+def default_tiers(core_domain):
+    """默认分层：返回 (tier_of, 分层顺序, 各分层的固定取值)，分层编号与 CandidateTable.bucket_ids 一致"""
+    def tier_of(project):
+        core = project.get('domain') == core_domain
+        top300 = project.get('source') == 'top_300'
+        return (0 if core else 2) + (0 if top300 else 1)
+    fixed = {0: {'domain': core_domain, 'source': 'top_300'}, 1: {'domain': core_domain},
+             2: {'source': 'top_300'}}
+    return tier_of, (0, 2, 1, 3), fixed
+
+
+class DiversitySelector:
+    """分层惰性堆 + 每页配额；select() 可重复调用逐页取结果"""
+
+    def __init__(self, projects, quotas=None, tier_of=None, tier_order=(0,), tier_fixed=None, depth=None,
+                 presorted=False):
+        """
+        projects: 已填 total_score 的候选；presorted=True 表示已按分数降序（打分结果均如此），
+                  此时按需从流中读取，只处理真正用到的前缀；否则先稳定排序一次
+        quotas: {维度: {取值或 '*': 每页上限}}，见 validate_quotas
+        tier_of: 候选 -> 分层编号（None 时所有候选为第 0 层）；tier_order: 分层优先级
+        tier_fixed: {分层: {维度: 取值}}，声明该层所有候选共有的取值，配额已满时整层跳过
+        depth: 每个分层最多保留的候选数（打分时的截断深度）；恰好取满 depth 个的分层视为被截断，
+               本页需要它补位却已取空时停止（后续页面不再有结果），避免用低优先级分层错误补位
+        """
+        if not presorted:
+            projects = sorted(projects, key=lambda p: p['total_score'], reverse=True)
+        self.quotas = validate_quotas(quotas)
+        self.tier_order = tuple(tier_order)
+        self.tier_fixed = tier_fixed or {}
+        self.depth = depth
+        self._tier_of = tier_of
+        self._stream = enumerate(projects)
+        self._drained = False
+        self._heaps = {tier: [] for tier in self.tier_order}
+        self._pulled = dict.fromkeys(self.tier_order, 0)
+        self.exhausted = False
+
+    def _fill(self, tier):
+        """从输入流读取，直到该分层的堆非空或输入读完；途经的其他分层候选入各自的堆"""
+        heap = self._heaps[tier]
+        tier_of = self._tier_of
+        while not heap and not self._drained:
+            item = next(self._stream, None)
+            if item is None:
+                self._drained = True
+                break
+            seq, project = item
+            other = tier_of(project) if tier_of is not None else 0
+            if other not in self._heaps:
+                continue
+            self._pulled[other] += 1
+            # (-分数, 输入顺序)：同分时保持输入顺序；输入有序时入堆为 O(1)
+            heapq.heappush(self._heaps[other], (-project['total_score'], seq, project))
+        return bool(heap)
+
+    def _truncated(self, tier):
+        return self.depth is not None and self._pulled[tier] >= self.depth
+
+    def _limit(self, dimension, value):
+        limits = self.quotas.get(dimension)
+        if not limits:
+            return None
+        return limits.get(value, limits.get(ANY))
+
+    def _saturated(self, counts, dimension, value):
+        limit = self._limit(dimension, value)
+        return limit is not None and counts.get((dimension, value), 0) >= limit
+
+    def _admit(self, counts, project):
+        """候选是否满足所有配额；满足时计入计数"""
+        keys = [(dimension, DIMENSIONS[dimension](project)) for dimension in self.quotas]
+        if any(self._saturated(counts, dimension, value) for dimension, value in keys):
+            return False
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+        return True
+
+    def select(self, k):
+        """取下一页（最多 k 个，页内按分数降序）；没有更多结果时返回 []"""
+        if self.exhausted or k <= 0:
+            return []
+        page = []
+        counts = {}
+        deferred = []
+        complete = True
+        for tier in self.tier_order:
+            heap = self._heaps[tier]
+            fixed = self.tier_fixed.get(tier, {})
+            while len(page) < k:
+                if any(self._saturated(counts, dimension, value) for dimension, value in fixed.items()):
+                    break
+                if not self._fill(tier):
+                    complete = not self._truncated(tier)
+                    break
+                entry = heapq.heappop(heap)
+                if self._admit(counts, entry[2]):
+                    page.append(entry)
+                else:
+                    deferred.append((tier, entry))
+            if not complete or len(page) >= k:
+                break
+        # 因配额落选的候选放回，可进入下一页
+        for tier, entry in deferred:
+            heapq.heappush(self._heaps[tier], entry)
+        self.exhausted = (not complete or not page
+                          or (self._drained and not any(self._heaps.values())))
+        # 页内按分数降序（稳定排序，同分保持选取顺序）
+        return [project for _, _, project in sorted(page, key=lambda entry: entry[0])]
@@ -0,0 +1,191 @@
+"""
+候选项目的向量化与近似最近邻（ANN）召回
+- TermEmbedder：把项目（标签/语言/领域/语义关键词）和用户画像（skills/topic_stats/领域）
+  通过特征哈希映射为稠密向量，语义关键词与技能图谱用于扩展同义/关联词
+- LSHIndex：NumPy 随机超平面 LSH（多表 + 汉明距离1的多探针），本地运行，可保存/加载
+"""
+import logging
+import os
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TermEmbedder:
+    """基于特征哈希的词项向量化"""
+
+    def __init__(self, semantic_keywords=None, skill_graph=None, dim=256):
+        self.dim = dim
+        # 关键词 -> 语义组：标签命中组名或组内关键词时，互相扩展
+        self.semantic_groups = {}
+        for group, keywords in (semantic_keywords or {}).items():
+            terms = [group.lower()] + [k.lower() for k in keywords]
+            for term in terms:
+                self.semantic_groups.setdefault(term, set()).update(terms)
+        self.skill_related = {k.lower(): [r.lower() for r in v.get('related', [])]
+                              for k, v in (skill_graph or {}).items()}
+        self._slot_cache = {}
+
+    def _slot(self, term):
+        """词项 -> (维度下标, 符号)"""
+        slot = self._slot_cache.get(term)
+        if slot is None:
+            h = zlib.crc32(term.encode('utf-8'))
+            slot = (h % self.dim, 1.0 if (h >> 16) & 1 else -1.0)
+            self._slot_cache[term] = slot
+        return slot
+
+    def _expand(self, weighted_terms):
+        """语义扩展：语义组与技能关联词以较低权重加入"""
+        expanded = dict(weighted_terms)
+        for term, weight in weighted_terms.items():
+            for syn in self.semantic_groups.get(term, ()):
+                if syn != term:
+                    expanded[syn] = max(expanded.get(syn, 0.0), weight * 0.5)
+            for rel in self.skill_related.get(term, ()):
+                expanded[rel] = max(expanded.get(rel, 0.0), weight * 0.4)
+        return expanded
+
+    def embed_terms(self, weighted_terms):
+        """{词项: 权重} -> 单位向量（float32）"""
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for term, weight in self._expand(weighted_terms).items():
+            idx, sign = self._slot(term)
+            vec[idx] += sign * weight
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def project_terms(self, project):
+        terms = {}
+        for tag in project.get('tags', []):
+            terms[tag.lower()] = 1.0
+        lang = (project.get('language') or '').lower()
+        if lang:
+            terms[lang] = 1.0
+        domain = (project.get('domain') or '').lower()
+        if domain and domain != 'general':
+            terms[domain] = max(terms.get(domain, 0.0), 0.8)
+        return terms
+
+    def profile_terms(self, user_profile):
+        terms = {}
+        for skill, strength in user_profile.get('skills', {}).items():
+            terms[skill.lower()] = max(terms.get(skill.lower(), 0.0), float(strength))
+        topic_stats = user_profile.get('topic_stats') or {}
+        if topic_stats:
+            top_count = max(topic_stats.values())
+            for topic, count in topic_stats.items():
+                terms[topic.lower()] = max(terms.get(topic.lower(), 0.0), 0.8 * count / top_count)
+        for pos, domain in enumerate(user_profile.get('domains', [])):
+            domain = domain.lower()
+            terms[domain] = max(terms.get(domain, 0.0), 0.8 if pos == 0 else 0.3)
+        return terms
+
+    def embed_project(self, project):
+        return self.embed_terms(self.project_terms(project))
+
+    def embed_profile(self, user_profile):
+        return self.embed_terms(self.profile_terms(user_profile))
+
+
+class LSHIndex:
+    """随机超平面 LSH 近似最近邻索引（余弦相似度）"""
+
+    def __init__(self, vectors, repos, n_tables=8, n_bits=12, seed=20231, planes=None,
+                 bucket_order=None, sorted_codes=None):
+        """
+        vectors 可为只读内存映射（离线产物）；bucket_order/sorted_codes 为预计算的分桶结果
+        （每张表按哈希码排序的候选编号及对应哈希码），提供时跳过哈希与排序
+        """
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.repos = list(repos)
+        dim = self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+        if planes is None:
+            rng = np.random.default_rng(seed)
+            planes = rng.standard_normal((n_tables, n_bits, dim)).astype(np.float32)
+        self.planes = planes
+        self.n_tables, self.n_bits = planes.shape[0], planes.shape[1]
+        self._bit_weights = (1 << np.arange(self.n_bits, dtype=np.int64))
+        self._build_buckets(bucket_order, sorted_codes)
+
+    def _codes(self, vectors):
+        """向量 -> 每张表的哈希码，形状 (n_tables, n)"""
+        projections = np.einsum('tbd,nd->tnb', self.planes, vectors)
+        return ((projections > 0).astype(np.int64) * self._bit_weights).sum(axis=2)
+
+    def _build_buckets(self, bucket_order=None, sorted_codes=None):
+        self.tables = []
+        if len(self.repos) == 0:
+            self.bucket_order = self.sorted_codes = None
+            return
+        if bucket_order is None or sorted_codes is None:
+            codes = self._codes(self.vectors)
+            bucket_order = np.argsort(codes, axis=1, kind='stable').astype(np.int32)
+            sorted_codes = np.take_along_axis(codes, bucket_order, axis=1).astype(np.int32)
+        self.bucket_order, self.sorted_codes = bucket_order, sorted_codes
+        for t in range(self.n_tables):
+            boundaries = np.flatnonzero(np.diff(sorted_codes[t])) + 1
+            starts = np.concatenate(([0], boundaries))
+            # 各桶为 bucket_order 的切片视图（内存映射时不复制）
+            self.tables.append({int(sorted_codes[t][start]): ids
+                                for start, ids in zip(starts, np.split(bucket_order[t], boundaries))})
+
+    def __len__(self):
+        return len(self.repos)
+
+    def query(self, vector, k=300, max_candidates=None):
+        """
+        返回与 vector 最相近的至多 k 个候选仓库名（按相似度降序）
+        max_candidates: 参与精确余弦重排的候选上限（默认 4k），控制单次查询耗时
+        """
+        if not self.tables or not np.any(vector):
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        max_candidates = max_candidates or 4 * k
+        codes = self._codes(vector[None, :])[:, 0]
+        probes = []
+        gathered = 0
+        # 多探针：先取各表本桶，不足时再取汉明距离为1的邻桶，候选数达到上限即停止
+        for flip in [0] + [1 << b for b in range(self.n_bits)]:
+            for t in range(self.n_tables):
+                ids = self.tables[t].get(int(codes[t]) ^ flip)
+                if ids is not None:
+                    ids = ids[:max_candidates - gathered]
+                    probes.append(ids)
+                    gathered += len(ids)
+                if gathered >= max_candidates:
+                    break
+            if gathered >= max_candidates:
+                break
+        if not probes:
+            return []
+        candidates = np.unique(np.concatenate(probes))
+        sims = self.vectors[candidates] @ vector
+        if len(candidates) > k:
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-sims[top], kind='stable')]
+        return [self.repos[i] for i in candidates[top]]
+
+    def save(self, path):
+        """保存向量、超平面与仓库名（桶在加载时重建）"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, vectors=self.vectors, planes=self.planes,
+                            repos=np.array(self.repos, dtype=np.str_))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vectors'], data['repos'].tolist(), planes=data['planes'])
+
+    @classmethod
+    def build(cls, pool, embedder, **kwargs):
+        repos = list(pool.keys())
+        vectors = np.zeros((len(repos), embedder.dim), dtype=np.float32)
+        for i, repo in enumerate(repos):
+            vectors[i] = embedder.embed_project(pool[repo])
+        return cls(vectors, repos, **kwargs)
@@ -0,0 +1,126 @@
+"""
+候选池热加载（原子切换）
+刷新后的 top_300_metrics 导出或重新构建的候选池产物无需重启进程即可生效：
+- 后台线程构建新的推荐器快照（top300_projects、索引、large_candidate_pool 全部重新加载），
+  构建期间继续使用旧快照提供服务
+- 构建完成后一次赋值切换（版本号 +1）；已经拿到旧快照的在途请求在旧快照上完成，
+  旧快照随最后一个引用释放（其异步 HTTP 会话由 app.py 在旧快照上的异步请求全部完成后关闭）
+- 构建失败时保留旧快照并记录错误
+触发方式：管理接口（app.py 的 POST /admin/reload）或轮询式目录监视（SnapshotReloader.watch）。
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotReloader:
+    """后台构建 + 原子切换；同一时刻只运行一个构建"""
+
+    def __init__(self, factory, swap, fingerprint=None):
+        """
+        factory: 无参函数，构建并返回新快照（耗时操作，在后台线程中执行）
+        swap: 接收新快照的函数，负责原子替换（返回新版本号）
+        fingerprint: 无参函数，返回数据源的指纹（如产物 LATEST 内容、导出目录修改时间），变化时触发重载
+        """
+        self.factory = factory
+        self.swap = swap
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._thread = None
+        self._watch_thread = None
+        self._stop = threading.Event()
+        self._last_fingerprint = None
+        self._status = {
+            'state': 'idle', 'version': None, 'reason': None, 'started_at': None,
+            'finished_at': None, 'duration': None, 'last_error': None, 'reloads': 0,
+        }
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _safe_fingerprint(self):
+        if self.fingerprint is None:
+            return None
+        try:
+            return self.fingerprint()
+        except Exception as e:
+            logger.warning("[热加载] 读取数据源指纹失败: %s", e)
+            return None
+
+    def reload(self, reason='manual'):
+        """在后台开始一次重载；已有重载在进行时不重复启动。返回 (是否新启动, 状态)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False, dict(self._status)
+            self._status.update(state='building', reason=reason, started_at=time.time(),
+                                finished_at=None, duration=None, last_error=None)
+            self._thread = threading.Thread(target=self._run, name='snapshot-reload', daemon=True)
+            self._thread.start()
+            return True, dict(self._status)
+
+    def _run(self):
+        started = time.monotonic()
+        fingerprint = self._safe_fingerprint()
+        with self._lock:
+            reason = self._status['reason']
+        logger.info("[热加载] 开始构建新快照（%s）", reason)
+        try:
+            snapshot = self.factory()
+            version = self.swap(snapshot)
+        except Exception as e:
+            logger.exception("[热加载] 构建新快照失败，继续使用旧快照")
+            with self._lock:
+                self._status.update(state='failed', last_error=str(e), finished_at=time.time(),
+                                    duration=round(time.monotonic() - started, 2))
+            return
+        with self._lock:
+            self._last_fingerprint = fingerprint
+            self._status.update(state='idle', version=version, finished_at=time.time(),
+                                duration=round(time.monotonic() - started, 2),
+                                reloads=self._status['reloads'] + 1)
+        logger.info("[热加载] 已切换到新快照（版本 %s，耗时 %.1f 秒）", version, time.monotonic() - started)
+
+    def mark_current(self):
+        """记录当前快照对应的数据源指纹（首次加载完成后调用）"""
+        self._last_fingerprint = self._safe_fingerprint()
+
+    def check(self):
+        """数据源指纹变化时触发重载，返回是否触发"""
+        fingerprint = self._safe_fingerprint()
+        if fingerprint is None or fingerprint == self._last_fingerprint:
+            return False
+        if self._last_fingerprint is None:
+            # 尚未记录基准（首次加载未经过 mark_current），以当前指纹为基准
+            self._last_fingerprint = fingerprint
+            return False
+        started, _ = self.reload(reason='数据源已更新')
+        return started
+
+    def watch(self, interval=30.0):
+        """启动轮询监视线程（守护线程），每 interval 秒比较一次数据源指纹"""
+        if self.fingerprint is None or (self._watch_thread is not None and self._watch_thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.check()
+                except Exception:
+                    logger.exception("[热加载] 监视失败")
+
+        self._watch_thread = threading.Thread(target=run, name='snapshot-watch', daemon=True)
+        self._watch_thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout)
+            self._watch_thread = None
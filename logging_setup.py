@@ -0,0 +1,90 @@
+"""
+推荐系统日志配置
+- production 模式：安静（WARNING 及以上），JSON 结构化输出，带请求ID
+- cli 模式：详细（DEBUG/INFO），纯文本输出，便于交互式调试
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+# 当前请求ID（Flask 请求 / 批处理任务中设置，日志记录自动携带）
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+# 日志记录中作为结构化字段输出的额外属性
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None)).keys()) | {'message', 'asctime', 'request_id'}
+
+
+def new_request_id():
+    """生成一个新的请求ID"""
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id=None):
+    """设置当前上下文的请求ID，返回用于恢复的 token"""
+    return request_id_var.set(request_id or new_request_id())
+
+
+def reset_request_id(token):
+    """恢复设置前的请求ID"""
+    request_id_var.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """为每条日志记录注入 request_id 字段"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志格式：只在真正输出时才格式化消息"""
+
+    def format(self, record):
+        payload = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(mode=None, json_format=None, level=None):
+    """
+    配置根日志
+    mode: 'production'（默认，安静）或 'cli'（详细）；可由环境变量 OPENRANK_LOG_MODE 指定
+    json_format: 是否输出 JSON；默认 production 为 True、cli 为 False（OPENRANK_LOG_JSON=1/0 可覆盖）
+    level: 显式日志级别，覆盖模式默认值（OPENRANK_LOG_LEVEL）
+    """
+    mode = (mode or os.environ.get('OPENRANK_LOG_MODE') or 'production').lower()
+    if json_format is None:
+        env_json = os.environ.get('OPENRANK_LOG_JSON')
+        json_format = (env_json == '1') if env_json is not None else (mode != 'cli')
+    level = level or os.environ.get('OPENRANK_LOG_LEVEL') or ('INFO' if mode == 'cli' else 'WARNING')
+
+    handler = logging.StreamHandler(sys.stderr if mode != 'cli' else sys.stdout)
+    handler.addFilter(RequestIdFilter())
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    elif mode == 'cli':
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return root
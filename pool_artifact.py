@@ -0,0 +1,301 @@
+"""
+候选池离线构建产物（pool artifact）
+离线命令一次性构建候选池（以及可选的 top_300 快照、预计算特征），写入带版本号、
+按内容哈希命名的只读目录；服务进程只加载已构建好的产物，不在请求路径上访问网络。
+数组文件以只读内存映射加载：多个 worker 进程映射同一产物时共享操作系统页缓存，
+内存占用不随 worker 数增长（配合 gunicorn --preload 时 master 加载一次后 fork）。
+完整校验（逐文件 sha256）读遍整个产物，只在 build / verify 命令与热加载切换前执行；
+服务进程启动时只核对清单（文件齐全、大小一致、清单内容哈希），不读文件内容，启动耗时与产物规模无关。
+
+目录结构：
+    artifacts/
+      LATEST                              最新产物的目录名（原子更新）
+      pool-v2-20240101T000000-<hash12>/
+        manifest.json                     格式版本、内容哈希、各文件 sha256、规模统计
+        table/                            列式候选池（CandidateTable.save，每列一个 .npy）
+        top300_projects.bin               top_300 项目快照（可选）
+        static_prior.npy                  预计算的静态先验分（可选）
+        index_*.npy                       召回倒排索引：先验顺序与各类倒排表的键、偏移、候选编号（可选）
+        embedding_*.npy                   向量索引：向量、超平面、分桶结果（可选）
+        cf_*.npy                          协同过滤模型：用户名、用户因子、Gram 矩阵、参数（可选；
+                                          仓库因子为候选池特征列 table/feature_cf_factors.npy）
+
+用法：
+    python pool_artifact.py build -o artifacts [--no-top300] [--no-features] [--cf-model cf_model.npz]
+    python pool_artifact.py verify artifacts
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+import numpy as np
+
+from cache_codec import BinaryCodec, CacheFormatError, atomic_write_bytes
+from candidate_index import INDEX_ARRAYS
+from candidate_table import CandidateTable
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+LATEST_NAME = 'LATEST'
+TABLE_DIR = 'table'
+TOP300_FILE = 'top300_projects.bin'
+FEATURE_FILES = {
+    'static_prior': 'static_prior.npy',
+    'embedding_vectors': 'embedding_vectors.npy',
+    'embedding_planes': 'embedding_planes.npy',
+    'embedding_bucket_order': 'embedding_bucket_order.npy',
+    'embedding_sorted_codes': 'embedding_sorted_codes.npy',
+    'cf_users': 'cf_users.npy',
+    'cf_user_factors': 'cf_user_factors.npy',
+    'cf_gram': 'cf_gram.npy',
+    'cf_params': 'cf_params.npy',
+    **{f"index_{name}": f"index_{name}.npy" for name in INDEX_ARRAYS},
+}
+# 长度与候选池一致的特征（其余按自身形状存放）
+ROW_FEATURES = ('static_prior', 'embedding_vectors')
+
+# 产物格式固定为二进制编码，与 OPENRANK_CACHE_CODEC 无关；
+# marshal 版本 2 不含对象引用，同一内容的字节稳定，内容哈希可复现
+_codec = BinaryCodec(marshal_version=2)
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _content_hash(file_hashes):
+    """产物内容哈希：按文件名排序后对 (文件名, 文件 sha256) 求哈希（不含构建时间）"""
+    digest = hashlib.sha256(f"v{ARTIFACT_VERSION}".encode('ascii'))
+    for name in sorted(file_hashes):
+        digest.update(f"\0{name}\0{file_hashes[name]}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _list_files(directory):
+    """目录下所有文件的相对路径（'/' 分隔，排序）"""
+    names = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            names.append(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def resolve_artifact_dir(path):
+    """产物根目录（含 LATEST）解析为最新产物目录；本身就是产物目录时原样返回"""
+    latest = os.path.join(path, LATEST_NAME)
+    if not os.path.exists(os.path.join(path, MANIFEST_NAME)) and os.path.exists(latest):
+        with open(latest, 'r', encoding='utf-8') as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def write_artifact(output_root, table, top300_projects=None, features=None):
+    """
+    写出产物目录并更新 LATEST，返回产物目录路径
+    table: CandidateTable；features: {特征名: 数组}（键见 FEATURE_FILES，ROW_FEATURES 与候选池顺序对齐）
+    同一内容重复构建得到同名目录，已存在时直接复用
+    """
+    os.makedirs(output_root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.building_', dir=output_root)
+    try:
+        table.save(os.path.join(staging, TABLE_DIR))
+        if top300_projects is not None:
+            _codec.dump(top300_projects, os.path.join(staging, TOP300_FILE))
+        for name, array in (features or {}).items():
+            np.save(os.path.join(staging, FEATURE_FILES[name]), np.ascontiguousarray(array))
+
+        files = {}
+        for name in _list_files(staging):
+            path = os.path.join(staging, *name.split('/'))
+            files[name] = {'sha256': _file_sha256(path), 'bytes': os.path.getsize(path)}
+        content_hash = _content_hash({name: info['sha256'] for name, info in files.items()})
+        created_at = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        manifest = {
+            'artifact_version': ARTIFACT_VERSION,
+            'content_hash': content_hash,
+            'created_at': created_at,
+            'candidates': len(table),
+            'top300_projects': len(top300_projects) if top300_projects is not None else None,
+            'features': sorted(features or {}),
+            'files': files,
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # 同一内容只保留一份：按内容哈希查找已有产物
+        existing = [name for name in os.listdir(output_root)
+                    if name.startswith(f"pool-v{ARTIFACT_VERSION}-") and name.endswith(content_hash[:12])]
+        if existing:
+            artifact_name = existing[0]
+            shutil.rmtree(staging)
+            logger.info("[产物] 内容未变化，复用已有产物 %s", artifact_name)
+        else:
+            artifact_name = f"pool-v{ARTIFACT_VERSION}-{created_at}-{content_hash[:12]}"
+            for name in _list_files(staging):
+                os.chmod(os.path.join(staging, *name.split('/')), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.rename(staging, os.path.join(output_root, artifact_name))
+            logger.info("[产物] 已写出 %s（%d 个候选）", artifact_name, len(table))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    atomic_write_bytes(os.path.join(output_root, LATEST_NAME), f"{artifact_name}\n".encode('utf-8'))
+    return os.path.join(output_root, artifact_name)
+
+
+class PoolArtifact:
+    """已构建的候选池产物（只读加载）"""
+
+    def __init__(self, path, manifest, table, top300_projects=None, features=None):
+        self.path = path
+        self.manifest = manifest
+        self.table = table
+        self.top300_projects = top300_projects
+        self.features = features or {}
+
+    @property
+    def version(self):
+        return os.path.basename(os.path.normpath(self.path))
+
+    @classmethod
+    def load(cls, path, verify=True, mmap_mode='r'):
+        """
+        加载产物（path 可为产物目录或含 LATEST 的根目录），总是核对清单（verify_manifest），
+        verify=True 时再逐文件校验哈希（读遍整个产物）；
+        mmap_mode='r' 时列数据与特征以只读内存映射打开，None 时读入私有内存
+        """
+        path = resolve_artifact_dir(path)
+        with open(os.path.join(path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('artifact_version') != ARTIFACT_VERSION:
+            raise CacheFormatError(f"产物版本不符: {manifest.get('artifact_version')}（需要 {ARTIFACT_VERSION}）")
+        if verify:
+            verify_artifact(path, manifest)
+        else:
+            verify_manifest(path, manifest)
+
+        files = manifest['files']
+        table = CandidateTable.load(os.path.join(path, TABLE_DIR), mmap_mode=mmap_mode)
+        top300_projects = _codec.load(os.path.join(path, TOP300_FILE)) if TOP300_FILE in files else None
+        features = {}
+        for name, filename in FEATURE_FILES.items():
+            if filename in files:
+                array = np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+                features[name] = array.view(np.ndarray) if mmap_mode else array
+        for name in ROW_FEATURES:
+            if name in features and len(features[name]) != len(table):
+                raise CacheFormatError(f"特征 {name} 与候选池长度不一致")
+        logger.info("[产物] 已加载 %s（%d 个候选）", os.path.basename(os.path.normpath(path)), len(table))
+        return cls(path, manifest, table, top300_projects, features)
+
+
+def verify_manifest(path, manifest):
+    """只核对清单：文件齐全、大小与清单一致、各文件哈希汇总后与内容哈希一致（不读文件内容）"""
+    for name, info in manifest['files'].items():
+        try:
+            size = os.path.getsize(os.path.join(path, *name.split('/')))
+        except OSError:
+            raise CacheFormatError(f"产物缺少文件: {name}")
+        if size != info['bytes']:
+            raise CacheFormatError(f"产物文件大小不符: {name}")
+    if _content_hash({name: info['sha256'] for name, info in manifest['files'].items()}) != manifest['content_hash']:
+        raise CacheFormatError('产物清单内容哈希不符')
+    return manifest
+
+
+def verify_artifact(path, manifest=None):
+    """校验产物目录：文件齐全、各文件 sha256 与内容哈希一致，不一致时抛出 CacheFormatError"""
+    path = resolve_artifact_dir(path)
+    if manifest is None:
+        with open(os.path.join(path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    hashes = {}
+    for name, info in manifest['files'].items():
+        file_path = os.path.join(path, *name.split('/'))
+        if not os.path.exists(file_path):
+            raise CacheFormatError(f"产物缺少文件: {name}")
+        hashes[name] = _file_sha256(file_path)
+        if hashes[name] != info['sha256']:
+            raise CacheFormatError(f"产物文件校验失败: {name}")
+    if _content_hash(hashes) != manifest['content_hash']:
+        raise CacheFormatError('产物内容哈希不符')
+    return manifest
+
+
+def build_artifact(output_root, include_top300=True, include_features=True, github_token=None, opendigger_api_key=None,
+                   cf_model=None):
+    """
+    联网构建候选池（沿用推荐器的缓存与批量快照），写出产物目录
+    cf_model: 协同过滤模型文件（collab_filter.py train 的输出），None 时沿用 OPENRANK_CF_MODEL
+    """
+    from collab_filter import CFModel, CFScorer
+    from smartreporecommend import SmartRepoRecommender
+
+    started = time.monotonic()
+    recommender = SmartRepoRecommender(github_token=github_token, opendigger_api_key=opendigger_api_key)
+    features = None
+    if include_features:
+        embedding_index = recommender.embedding_index
+        features = {
+            'static_prior': np.asarray(recommender.candidate_index.prior, dtype=np.float64),
+            'embedding_vectors': embedding_index.vectors,
+            'embedding_planes': embedding_index.planes,
+            **{f"index_{name}": array for name, array in recommender.candidate_index.arrays().items()},
+        }
+        if embedding_index.bucket_order is not None:
+            features['embedding_bucket_order'] = embedding_index.bucket_order
+            features['embedding_sorted_codes'] = embedding_index.sorted_codes
+    model = CFModel.load(cf_model) if cf_model else recommender.cf_model
+    if model is not None:
+        # 仓库因子写入候选池特征列，随 table/ 一起保存
+        CFScorer.from_model(recommender.candidate_table, model)
+        features = {**(features or {}), **model.artifact_features()}
+    top300_projects = recommender.top300_projects if include_top300 else None
+    path = write_artifact(output_root, recommender.candidate_table, top300_projects, features)
+    verify_artifact(path)
+    logger.info("[产物] 构建耗时 %.1f 秒", time.monotonic() - started)
+    return path
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='离线构建 / 校验候选池产物')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='构建候选池产物')
+    build.add_argument('-o', '--output', default='artifacts', help='产物根目录（默认 artifacts）')
+    build.add_argument('--no-top300', action='store_true', help='不写入 top_300 项目快照')
+    build.add_argument('--no-features', action='store_true', help='不写入预计算特征')
+    build.add_argument('--github-token', default=os.environ.get('GITHUB_TOKEN'), help='GitHub Token（默认取 GITHUB_TOKEN）')
+    build.add_argument('--opendigger-key', default=None, help='OpenDigger API Key')
+    build.add_argument('--cf-model', default=None, help='协同过滤模型（collab_filter.py train 的输出）')
+    verify = sub.add_parser('verify', help='校验产物完整性')
+    verify.add_argument('path', help='产物目录或含 LATEST 的根目录')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        path = build_artifact(args.output, include_top300=not args.no_top300,
+                              include_features=not args.no_features,
+                              github_token=args.github_token, opendigger_api_key=args.opendigger_key,
+                              cf_model=args.cf_model)
+        print(path)
+    else:
+        manifest = verify_artifact(args.path)
+        print(f"OK {manifest['content_hash']}（{manifest['candidates']} 个候选）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+用户画像预热（warm-up）
+给定一批用户名（班级名单、组织成员、访问日志中最近活跃的用户），在后台预先拉取其 GitHub
+仓库列表并分析画像，写入持久画像缓存（cache/profiles/）；之后这些用户的 /recommend
+只需读缓存与打分，不再等待 GitHub 往返。
+
+速率预算：只有真正访问网络的用户消耗预算（画像或仓库列表已缓存的直接跳过）。
+每小时请求数默认取 GitHub 限额的一半（有 Token 5000/h，无 Token 60/h），为在线请求留出余量；
+启动时查询 /rate_limit（该接口不计入限额），剩余额度低于保留量时暂停到额度重置。
+
+用法：
+    python profile_warmup.py users.txt [--org ORG] [--from-log app.log] [--token ghp_xxx] [--rate 1000]
+服务端：POST /warmup {"usernames": [...], "org": "...", "token": "..."} 启动，GET /warmup 查看进度
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from logging_setup import set_request_id, reset_request_id
+
+logger = logging.getLogger(__name__)
+
+# 每小时可用的 GitHub 请求占限额的比例（其余留给在线请求）
+DEFAULT_BUDGET_SHARE = 0.5
+# 剩余额度低于该值时暂停预热，等待额度重置
+RESERVED_REQUESTS = 10
+USER_REPOS_CACHE_TIME = 24 * 3600
+
+_USERNAME = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})$')
+_LOG_USER = re.compile(r'开始分析用户: ([A-Za-z0-9-]{1,39})')
+
+
+def load_usernames(path):
+    """名单文件：每行一个用户名，忽略空行与 # 注释，保持顺序去重"""
+    names = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            name = line.split('#', 1)[0].strip()
+            if name:
+                names.append(name)
+    return _dedupe(names)
+
+
+def usernames_from_log(path, limit=None):
+    """从服务日志中提取最近活跃的用户（按出现次数降序，次数相同时越晚出现越靠前）"""
+    counter = Counter()
+    last_seen = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for lineno, line in enumerate(f):
+            match = _LOG_USER.search(line)
+            if match:
+                counter[match.group(1)] += 1
+                last_seen[match.group(1)] = lineno
+    names = sorted(counter, key=lambda name: (-counter[name], -last_seen[name]))
+    return names[:limit] if limit else names
+
+
+def org_members(recommender, org, max_pages=10, acquire=None):
+    """
+    GitHub 组织的公开成员（经推荐器的 API 缓存）
+    acquire: 每个未缓存的分页请求前调用（如 RateBudget.acquire），返回 False 时停止分页
+    """
+    names = []
+    for page in range(1, max_pages + 1):
+        url = f"{recommender.github_api}/orgs/{org}/members?per_page=100&page={page}"
+        if acquire is not None and not _api_cached(recommender, url) and not acquire():
+            break
+        members = recommender._make_api_request(url, cache_time=USER_REPOS_CACHE_TIME)
+        if not members or not isinstance(members, list):
+            break
+        names.extend(member['login'] for member in members if isinstance(member, dict) and member.get('login'))
+        if len(members) < 100:
+            break
+    return names
+
+
+def default_requests_per_hour(recommender):
+    """默认每小时请求数：GitHub 限额（有 Token 5000/h，无 Token 60/h）的 DEFAULT_BUDGET_SHARE"""
+    limit = 5000 if getattr(recommender, 'token_valid', False) else 60
+    return limit * DEFAULT_BUDGET_SHARE
+
+
+def user_repos_cached(recommender, username):
+    """该用户的仓库列表是否已在 API 缓存中（画像或仓库列表已缓存的用户不消耗速率预算）"""
+    return _api_cached(recommender, f"{recommender.github_api}/users/{username}/repos?per_page=100")
+
+
+def _api_cached(recommender, url):
+    return recommender._read_api_cache(url, USER_REPOS_CACHE_TIME)[1]
+
+
+def _dedupe(names):
+    seen = set()
+    result = []
+    for name in names:
+        key = name.lower()
+        if key not in seen and _USERNAME.match(name):
+            seen.add(key)
+            result.append(name)
+    return result
+
+
+class RateBudget:
+    """按每小时请求数为网络请求排队（线程安全，可由多个 worker 共享）；每 50 次核对一次 GitHub 实际剩余额度"""
+
+    def __init__(self, recommender, requests_per_hour=None, stop=None, clock=time.monotonic):
+        """
+        requests_per_hour: 每小时可用的请求数，None 时见 default_requests_per_hour
+        stop: threading.Event，置位后等待中的 acquire() 立即返回 False
+        """
+        self.recommender = recommender
+        self.requests_per_hour = requests_per_hour or default_requests_per_hour(recommender)
+        self._stop = stop or threading.Event()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next_request_at = 0.0
+        self.requests = 0
+
+    def rate_limit_status(self):
+        """GitHub /rate_limit（不计入限额），返回 (剩余次数, 重置时间戳) 或 None"""
+        try:
+            response = requests.get(f"{self.recommender.github_api}/rate_limit",
+                                    headers=self.recommender.headers, timeout=10)
+            core = response.json()['resources']['core']
+            return int(core['remaining']), float(core['reset'])
+        except Exception as e:
+            logger.debug("[速率预算] 查询限额失败: %s", e)
+            return None
+
+    def acquire(self):
+        """为下一次网络请求等待（按到达顺序分配时间槽）；返回 False 表示已停止"""
+        interval = 3600.0 / self.requests_per_hour
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_request_at)
+            self._next_request_at = slot + interval
+            check = self.requests % 50 == 0
+            self.requests += 1
+        if slot > now and self._stop.wait(slot - now):
+            return False
+        if check:
+            status = self.rate_limit_status()
+            if status is not None and status[0] <= RESERVED_REQUESTS:
+                wait = max(0.0, status[1] - time.time()) + 1
+                logger.warning("[速率预算] GitHub 剩余额度 %d，暂停 %.0f 秒等待重置", status[0], wait)
+                if self._stop.wait(wait):
+                    return False
+        return True
+
+
+class ProfileWarmer:
+    """在后台线程中按速率预算预热一批用户的画像"""
+
+    def __init__(self, recommender, usernames, requests_per_hour=None, orgs=()):
+        """
+        recommender: SmartRepoRecommender（其凭据决定限额）
+        requests_per_hour: 预热可用的每小时请求数，None 时取限额的 DEFAULT_BUDGET_SHARE
+        orgs: 额外预热的 GitHub 组织，成员列表在后台线程中展开（分页请求不阻塞调用方）
+        """
+        self.recommender = recommender
+        self.usernames = _dedupe(usernames)
+        self.orgs = list(orgs)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._budget = RateBudget(recommender, requests_per_hour, stop=self._stop)
+        self.requests_per_hour = self._budget.requests_per_hour
+        self._progress = {
+            'state': 'pending', 'total': len(self.usernames), 'done': 0,
+            'cached': 0, 'fetched': 0, 'failed': 0, 'requests': 0,
+            'current': None, 'started_at': None, 'finished_at': None, 'eta_seconds': None,
+        }
+
+    def progress(self):
+        with self._lock:
+            return dict(self._progress)
+
+    def _update(self, **changes):
+        with self._lock:
+            for key, value in changes.items():
+                self._progress[key] = value
+
+    def _increment(self, key):
+        with self._lock:
+            self._progress[key] += 1
+            self._progress['done'] += 1
+            self._progress['eta_seconds'] = self._eta_locked()
+
+    def _eta_locked(self):
+        remaining = self._progress['total'] - self._progress['done']
+        if remaining <= 0:
+            return 0
+        # 按速率预算估算（已缓存的用户不计），实际通常更快
+        return round(remaining * 3600 / self.requests_per_hour)
+
+    def _warm_one(self, username):
+        recommender = self.recommender
+        if recommender._load_cached_profile(username) is not None:
+            self._increment('cached')
+            return
+        if not user_repos_cached(recommender, username) and not self._acquire_request():
+            return
+        user_repos = recommender._get_user_repos(username)
+        recommender._build_user_profile(username, user_repos)
+        self._increment('fetched' if user_repos is not None else 'failed')
+
+    def _acquire_request(self):
+        """为一次网络请求等待速率预算并计入进度；返回 False 表示已停止"""
+        if not self._budget.acquire():
+            return False
+        with self._lock:
+            self._progress['requests'] += 1
+        return True
+
+    def _expand_orgs(self):
+        """把各组织的公开成员并入预热名单（未缓存的分页同样消耗速率预算）"""
+        for org in self.orgs:
+            if self._stop.is_set():
+                break
+            self._update(current=f"org:{org}")
+            try:
+                members = org_members(self.recommender, org, acquire=self._acquire_request)
+            except Exception as e:
+                logger.warning("[预热] 获取组织成员失败 %s: %s", org, e)
+                continue
+            self.usernames = _dedupe(self.usernames + members)
+            self._update(total=len(self.usernames))
+
+    def run(self):
+        """在当前线程中执行预热（阻塞直到完成或 stop）"""
+        self._update(state='running', started_at=time.time())
+        token = set_request_id('warmup')
+        try:
+            self._expand_orgs()
+            logger.info("[预热] 开始预热 %d 个用户（每小时最多 %d 次请求）", len(self.usernames), self.requests_per_hour)
+            for username in self.usernames:
+                if self._stop.is_set():
+                    break
+                self._update(current=username)
+                try:
+                    self._warm_one(username)
+                except Exception as e:
+                    logger.warning("[预热] 预热失败 %s: %s", username, e)
+                    self._increment('failed')
+        finally:
+            reset_request_id(token)
+            self._update(state='stopped' if self._stop.is_set() else 'done', current=None, finished_at=time.time())
+        progress = self.progress()
+        logger.info("[预热] 完成：已缓存 %d，新拉取 %d，失败 %d（%d 次请求）",
+                    progress['cached'], progress['fetched'], progress['failed'], progress['requests'])
+        return progress
+
+    def start(self):
+        """启动后台预热线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run, name='profile-warmup', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='预热用户画像（拉取仓库列表并分析，写入画像缓存）')
+    parser.add_argument('users', nargs='?', help='名单文件（每行一个用户名）')
+    parser.add_argument('--user', action='append', default=[], help='单个用户名（可重复）')
+    parser.add_argument('--org', action='append', default=[], help='预热 GitHub 组织的公开成员（可重复）')
+    parser.add_argument('--from-log', help='从服务日志中提取最近活跃的用户')
+    parser.add_argument('--log-limit', type=int, default=500, help='从日志中最多取多少个用户（默认 500）')
+    parser.add_argument('--token', default=os.environ.get('GITHUB_TOKEN'), help='GitHub Token（默认取 GITHUB_TOKEN）')
+    parser.add_argument('--rate', type=float, default=None, help='每小时最多请求数（默认限额的一半）')
+    parser.add_argument('--artifact', default=os.environ.get('OPENRANK_POOL_ARTIFACT', 'artifacts'),
+                        help='候选池产物目录（存在时只读加载）')
+    parser.add_argument('--interval', type=float, default=5, help='进度输出间隔（秒）')
+    args = parser.parse_args(argv)
+
+    from smartreporecommend import SmartRepoRecommender
+    recommender = SmartRepoRecommender(github_token=args.token,
+                                       pool_artifact=args.artifact if os.path.exists(args.artifact) else None)
+    usernames = list(args.user)
+    if args.users:
+        usernames.extend(load_usernames(args.users))
+    if args.from_log:
+        usernames.extend(usernames_from_log(args.from_log, args.log_limit))
+    if not usernames and not args.org:
+        parser.error('未提供任何用户名')
+
+    warmer = ProfileWarmer(recommender, usernames, requests_per_hour=args.rate, orgs=args.org)
+    warmer.start()
+    try:
+        while warmer.running:
+            warmer._thread.join(args.interval)
+            progress = warmer.progress()
+            eta = f"，预计剩余 {progress['eta_seconds']} 秒" if progress['eta_seconds'] else ''
+            print(f"进度 {progress['done']}/{progress['total']}：已缓存 {progress['cached']}，"
+                  f"新拉取 {progress['fetched']}，失败 {progress['failed']}{eta}")
+    except KeyboardInterrupt:
+        warmer.stop()
+    print(json.dumps(warmer.progress(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
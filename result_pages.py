@@ -0,0 +1,120 @@
+"""
+推荐结果分页（服务端游标）
+一次 /recommend 打分后，按排名排序的候选（每个多样性分组保留前 page_size × max_pages 个）
+连同多样性状态保存在服务端，返回不透明游标；「显示更多」凭游标取下一页，
+不再重新分析画像、不再对候选池打分。
+
+每一页在剩余候选上重新套用多样性规则（与 _ensure_absolute_diversity 一致，见 diversity.py）：
+top_300 项目先核心领域后其他领域、每页最多 top300_quota 个，其余名额依次由核心领域、
+其他领域的标准项目补足，页内按 total_score 降序。各分组为惰性堆，取一页约为 O(page_size · log n)。
+
+游标保存在进程内（OPENRANK_PAGE_TTL 秒过期，默认 600）；多 worker 部署时游标只在签发它的
+worker 上有效，过期或找不到时客户端重新调用 /recommend 即可。
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from diversity import DiversitySelector, default_tiers
+
+
+class RankedPages:
+    """按排名排序的候选流 + 逐页增量套用多样性规则（diversity.DiversitySelector）"""
+
+    def __init__(self, projects, core_domain, top300_quota=3, page_size=8, depth=None, quotas=None, presorted=False):
+        """
+        projects: 已填 total_score 的候选；presorted=True 表示已按分数降序（打分结果），否则先排序
+        quotas: 额外的每页配额 {维度: {取值或 '*': 上限}}（domain / source / language / org），
+                source=top_300 的上限默认为 top300_quota
+        depth: 每个分组最多保留的候选数（打分时的截断深度）；某个分组恰好取满 depth 个时
+               视为被截断，取空后停止分页，避免后续页面用其他分组错误补位。None 表示未截断
+        """
+        self.core_domain = core_domain
+        self.page_size = page_size
+        merged = {'source': {'top_300': top300_quota}}
+        for dimension, limits in (quotas or {}).items():
+            merged[dimension] = {**merged.get(dimension, {}), **limits}
+        tier_of, tier_order, tier_fixed = default_tiers(core_domain)
+        self._selector = DiversitySelector(projects, merged, tier_of=tier_of, tier_order=tier_order,
+                                           tier_fixed=tier_fixed, depth=depth, presorted=presorted)
+        self._pages = []
+        self._lock = threading.Lock()
+
+    def page(self, index):
+        """第 index 页（从 0 开始，按需顺序计算并缓存）；超出范围时返回 []"""
+        with self._lock:
+            while len(self._pages) <= index and not self._selector.exhausted:
+                self._pages.append(self._selector.select(self.page_size))
+            return list(self._pages[index]) if index < len(self._pages) else []
+
+    def has_page(self, index):
+        """是否存在第 index 页（必要时计算前面的页）"""
+        self.page(index)
+        with self._lock:
+            return index < len(self._pages) and bool(self._pages[index])
+
+
+class PageStore:
+    """进程内游标存储：TTL 过期 + 条目上限（最久未访问的先淘汰）"""
+
+    def __init__(self, ttl=600.0, max_sessions=2000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    @classmethod
+    def from_env(cls):
+        return cls(ttl=float(os.environ.get('OPENRANK_PAGE_TTL') or 600),
+                   max_sessions=int(os.environ.get('OPENRANK_PAGE_SESSIONS') or 2000))
+
+    def _evict_locked(self, now):
+        while self._sessions:
+            session_id, (_, _, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def save(self, pages, meta=None):
+        """保存一次排名结果，返回会话ID"""
+        session_id = secrets.token_urlsafe(12)
+        now = self._clock()
+        with self._lock:
+            self._sessions[session_id] = (pages, meta or {}, now + self.ttl)
+            self._evict_locked(now)
+        return session_id
+
+    def load(self, session_id):
+        """返回 (RankedPages, meta)，过期或不存在时返回 None；访问会续期"""
+        now = self._clock()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[2] <= now:
+                self._sessions.pop(session_id, None)
+                return None
+            pages, meta, _ = entry
+            self._sessions[session_id] = (pages, meta, now + self.ttl)
+            self._sessions.move_to_end(session_id)
+            return pages, meta
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def cursor(self, session_id, pages, index):
+        """第 index 页的游标；该页不存在时返回 None"""
+        return f"{session_id}.{index}" if pages.has_page(index) else None
+
+    def resolve(self, cursor):
+        """游标 -> (会话ID, RankedPages, meta, 页码)，无效（含非字符串）或过期时返回 None"""
+        if not isinstance(cursor, str):
+            return None
+        session_id, _, index = cursor.rpartition('.')
+        if not session_id or not index.isdigit():
+            return None
+        loaded = self.load(session_id)
+        if loaded is None:
+            return None
+        return session_id, loaded[0], loaded[1], int(index)
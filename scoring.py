@@ -0,0 +1,121 @@
+"""
+推荐打分（纯函数，便于在召回、分片打分等多处 / 多进程中复用）
+"""
+import numpy as np
+
+# 各打分分量的默认权重：top300 为 top_300 项目的加分，trend 暂不计入总分，
+# cf 为协同过滤分量（仅在加载了协同过滤模型且有用户向量时存在，见 collab_filter.py）
+# 画像中的 exp_weight / contrib_weight / activity_weight 另外作用于 skill / domain / quality
+DEFAULT_WEIGHTS = {'skill': 0.45, 'domain': 0.2, 'difficulty': 0.15, 'quality': 0.15, 'top300': 0.03, 'trend': 0.0,
+                   'cf': 0.1}
+
+
+def resolve_weights(weights=None):
+    """在默认权重上覆盖自定义权重（可只给部分分量）；未知分量或非数值时抛出 ValueError"""
+    resolved = dict(DEFAULT_WEIGHTS)
+    for name, value in (weights or {}).items():
+        if name not in DEFAULT_WEIGHTS:
+            raise ValueError(f"未知的打分分量: {name}（可选: {', '.join(DEFAULT_WEIGHTS)}）")
+        try:
+            resolved[name] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"权重必须是数值: {name}={value!r}") from None
+    return resolved
+
+
+def combine_components(components, user_profile, weights=DEFAULT_WEIGHTS):
+    """各分量（标量或等长数组，见 CandidateTable.component_scores）按权重线性组合为原始分（0-100）"""
+    raw = (
+        components['skill'] * (weights['skill'] * user_profile.get('exp_weight', 1.0)) +
+        components['domain'] * (weights['domain'] * user_profile.get('contrib_weight', 1.0)) +
+        components['difficulty'] * weights['difficulty'] +
+        components['quality'] * (weights['quality'] * user_profile.get('activity_weight', 1.0)) +
+        components['top300'] * weights['top300']
+    )
+    if weights['trend']:
+        raw = raw + components.get('trend', 0.5) * weights['trend']
+    if weights['cf'] and 'cf' in components:
+        raw = raw + components['cf'] * weights['cf']
+    return raw * 100.0
+
+
+def calculate_quality_score(project):
+    """项目质量分（0-1，与用户无关）"""
+    openrank = float(project.get('openrank') or 70.0)
+    activity = float(project.get('activity') or 70.0)
+    stars = float(project.get('stars') or 1000)
+    stars_scaled = (np.log1p(stars) / np.log1p(100000))  # 大致归一到 0-1
+    return (0.6 * (openrank / 100.0) + 0.4 * (activity / 100.0)) * 0.8 + stars_scaled * 0.2
+
+
+def calculate_static_prior(project):
+    """与用户无关的打分部分（质量 + top_300 加分），召回阶段用于截断排序和补充候选"""
+    top300_bonus = 0.03 if project.get('source') == 'top_300' else 0.0
+    return 0.15 * calculate_quality_score(project) + top300_bonus
+
+
+def calculate_match_score(project, user_profile, skill_graph):
+    """个性化匹配分数计算（改进版）"""
+    # 更稳定、可解释的打分：将多维特征按标准化权重线性组合，减少极端随机性
+    project_domain = project.get('domain', 'general')
+
+    # 技能匹配：计算用户技能与项目语言/标签/相关技能的覆盖率（0-1）
+    project_tags = set([t.lower() for t in project.get('tags', [])])
+    project_lang = (project.get('language') or '').lower()
+    skill_score = 0.0
+    skill_weight_sum = 0.0
+    for skill, strength in user_profile.get('skills', {}).items():
+        w = float(strength)
+        if w <= 0:
+            continue
+        skill_weight_sum += w
+        s = 0.0
+        if skill.lower() == project_lang and project_lang:
+            s = 1.0
+        elif skill.lower() in project_tags:
+            s = 0.9
+        elif skill in skill_graph:
+            related = [rs.lower() for rs in skill_graph[skill].get('related', [])]
+            if any(r in project_tags for r in related):
+                s = 0.6
+        skill_score += w * s
+    skill_match = (skill_score / skill_weight_sum) if skill_weight_sum > 0 else 0.0
+
+    # 领域匹配：核心领域得分更高
+    domain_match = 0.0
+    if project_domain in user_profile.get('domains', []):
+        if user_profile.get('domains', [None])[0] == project_domain:
+            domain_match = 1.0
+        else:
+            domain_match = 0.4
+
+    # 难度适配：基于经验等级匹配程度（0-1）
+    difficulty_map = {
+        'beginner': {'beginner': 1.0, 'intermediate': 0.6, 'advanced': 0.2},
+        'intermediate': {'beginner': 0.6, 'intermediate': 1.0, 'advanced': 0.6},
+        'advanced': {'beginner': 0.2, 'intermediate': 0.6, 'advanced': 1.0}
+    }
+    difficulty_score = difficulty_map.get(user_profile.get('experience_level', 'intermediate'), {}).get(
+        project.get('difficulty', 'intermediate'), 0.6)
+
+    # 项目质量：归一化 openrank/activity (均假定0-100)，stars 使用 log1p 缩放
+    quality_score = calculate_quality_score(project)
+
+    # top_300 小幅加分
+    is_top300 = 1.0 if project.get('source') == 'top_300' else 0.0
+
+    # 线性组合（各项均为 0-1 范围，权重见 DEFAULT_WEIGHTS），给出原始分数（0-100）供外部归一
+    components = {'skill': skill_match, 'domain': domain_match, 'difficulty': difficulty_score,
+                  'quality': quality_score, 'top300': is_top300}
+    return float(combine_components(components, user_profile))
+
+
+def rank_to_total_score(idx, n, high=98.9, low=60.1):
+    """按排名线性映射到 60.1-98.9（排名 0 -> 最高分），n 为参与排名的候选总数"""
+    if n == 1:
+        mapped = (high + low) / 2.0
+    else:
+        frac = idx / float(n - 1)  # 0 for top, 1 for last
+        # shrink slightly to avoid exact boundaries
+        mapped = low + 0.001 + (1.0 - frac) * (high - low - 0.002)
+    return round(mapped, 2)
@@ -0,0 +1,207 @@
+"""
+多进程分片打分（可选）
+列式候选池（CandidateTable）按顺序切分为连续分片，每个分片交给一个独立的单进程 worker：
+分片的数组列一次性写入一段共享内存，worker 直接在共享内存上建立只读 NumPy 视图
+（不复制到各自的堆中，N 个 worker 的列数据只占一份内存），共享内存在进程池关闭时才释放。
+
+每次请求分两步，进程间只传递与 top-k 相关的少量数据：
+1. 各分片打分，只返回本分片内各多样性分组（核心领域/其他 × top_300/标准）的局部 top-k，
+   本分片降序排列的原始分数暂存在 worker 中
+2. 父进程把所有入选候选的原始分发给每个分片，分片用 searchsorted 回答「本分片中排在它前面的候选数」，
+   父进程据此得出与单进程全池打分（retrieval_limit=None）完全一致的全局排名与分数
+暂存的分数在第二步取用后释放；请求中途失败时由父进程显式释放，不按数量淘汰
+（否则高并发下第二步可能找不到自己的数据）。
+"""
+import atexit
+import itertools
+import logging
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from candidate_table import CandidateTable, top_k_per_bucket
+from scoring import rank_to_total_score
+
+logger = logging.getLogger(__name__)
+
+# 共享内存中各列的起始偏移按该字节数对齐
+_ALIGN = 64
+
+# worker 进程内的分片状态
+_SHARD = {}
+
+
+def _pack_columns(table):
+    """把分片的数组列写入一段新的共享内存，返回 (SharedMemory, 布局 [(列名, dtype, shape, 偏移)])"""
+    columns = [(name, np.ascontiguousarray(values)) for name, values in table.columns()]
+    layout, offset = [], 0
+    for name, values in columns:
+        layout.append((name, values.dtype.str, values.shape, offset))
+        offset += -(-values.nbytes // _ALIGN) * _ALIGN
+    shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+    for (name, values), (_, dtype, shape, start) in zip(columns, layout):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)[...] = values
+    return shm, layout
+
+
+def _init_worker(shm_name, layout, meta, start, skill_graph):
+    """worker 初始化：在共享内存上建立本分片各列的只读视图（不复制）"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = {}
+    for name, dtype, shape, offset in layout:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        array.flags.writeable = False
+        arrays[name] = array
+    # 视图引用映射内存，SharedMemory 对象须与分片同生命周期
+    _SHARD['shm'] = shm
+    _SHARD['table'] = CandidateTable.assemble(meta, arrays.__getitem__)
+    _SHARD['start'] = start
+    _SHARD['skill_graph'] = skill_graph
+    _SHARD['pending'] = {}
+
+
+def _shard_size():
+    return len(_SHARD['table'])
+
+
+def _score_shard(request_id, user_profile, k, cf_vector=None):
+    """
+    第一步：对本分片打分，返回分组局部 top-k [(全局行号, 原始分, 分片内排名, 候选)]；
+    本分片降序原始分数（取负后升序）暂存，供 _count_ahead 使用
+    """
+    table = _SHARD['table']
+    start = _SHARD['start']
+    raws = table.score(user_profile, _SHARD['skill_graph'], cf_vector=cf_vector)
+
+    # 与单进程一致的排序：原始分降序，同分保持候选池顺序
+    order = np.lexsort((np.arange(len(raws)), -raws))
+    buckets = table.bucket_ids(user_profile.get('core_domain'), order)
+    winners = []
+    for local_rank in top_k_per_bucket(buckets, k):
+        i = int(order[local_rank])
+        winners.append((start + i, float(raws[i]), int(local_rank), table.row(i)))
+    _SHARD['pending'][request_id] = -raws[order]
+    return winners
+
+
+def _count_ahead(request_id, earlier, later):
+    """
+    第二步：本分片中排在给定原始分之前的候选数。
+    earlier 来自编号更小的分片（同分时它们在前，只数严格更高的），later 来自编号更大的分片（同分也数）
+    """
+    neg_sorted = _SHARD['pending'].pop(request_id)
+    return (np.searchsorted(neg_sorted, -np.asarray(earlier, dtype=np.float64), side='left'),
+            np.searchsorted(neg_sorted, -np.asarray(later, dtype=np.float64), side='right'))
+
+
+def _release(request_id):
+    """丢弃未完成第二步的请求暂存的分数（请求中途失败时）"""
+    _SHARD['pending'].pop(request_id, None)
+
+
+class ShardedScorer:
+    """
+    把候选池分片到多个进程，对整个候选池精确打分（不经过召回）。
+    归并结果与单进程在 retrieval_limit=None 时的打分完全一致；单进程默认先召回再打分，
+    因此开启 scoring_workers 后排名会与默认配置不同
+    """
+
+    def __init__(self, table, skill_graph, n_shards=None):
+        self.n_candidates = len(table)
+        self.n_shards = max(1, min(n_shards or os.cpu_count() or 1, self.n_candidates or 1))
+        self._executors = []
+        self._shms = []
+        self._request_ids = itertools.count()
+
+        # 进程退出时兜底清理（先关闭进程池，再释放共享内存）
+        self._finalizer = weakref.finalize(self, ShardedScorer._cleanup, self._executors, self._shms)
+        atexit.register(self._finalizer)
+
+        bounds = np.linspace(0, self.n_candidates, self.n_shards + 1).astype(int)
+        for shard_id in range(self.n_shards):
+            start, end = int(bounds[shard_id]), int(bounds[shard_id + 1])
+            shard = table.slice_rows(start, end)
+            shm, layout = _pack_columns(shard)
+            self._shms.append(shm)
+            self._executors.append(ProcessPoolExecutor(
+                max_workers=1, initializer=_init_worker,
+                initargs=(shm.name, layout, shard.meta(), start, skill_graph)))
+            del shard
+
+        loaded = sum(f.result() for f in [executor.submit(_shard_size) for executor in self._executors])
+        logger.info("[分片打分] %d 个候选分为 %d 个分片（共享内存 %.1f MB）",
+                    loaded, self.n_shards, sum(shm.size for shm in self._shms) / 1e6)
+
+    @staticmethod
+    def _release_shared_memory(shms):
+        for shm in shms:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        shms.clear()
+
+    @staticmethod
+    def _cleanup(executors, shms):
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        ShardedScorer._release_shared_memory(shms)
+
+    def close(self):
+        self._finalizer()
+
+    def score(self, user_profile, top_n, cf_vector=None):
+        """
+        分片打分并归并，返回按全局排名排序的候选副本（已填 total_score），
+        包含每个多样性分组的全局 top_n，足够 _ensure_absolute_diversity 得出与单进程相同的结果；
+        cf_vector 为协同过滤用户向量（可选，各分片的 cf_factors 特征列随分片一起传入）
+        """
+        request_id = next(self._request_ids)
+        counted = False
+        try:
+            results, ranks = self._rank(request_id, user_profile, top_n, cf_vector)
+            counted = True
+        finally:
+            if not counted:
+                for executor in self._executors:
+                    executor.submit(_release, request_id)
+
+        merged = []
+        for winners, shard_ranks in zip(results, ranks):
+            for (global_idx, _, _, project), rank in zip(winners, shard_ranks):
+                merged.append((int(rank), global_idx, project))
+
+        merged.sort(key=lambda item: item[0])
+        scored_projects = []
+        for rank, global_idx, project in merged:
+            project['total_score'] = rank_to_total_score(rank, self.n_candidates)
+            scored_projects.append(project)
+        return scored_projects
+
+    def _rank(self, request_id, user_profile, top_n, cf_vector):
+        """两步打分，返回 (各分片的入选候选, 各分片入选候选的全局排名)"""
+        futures = [executor.submit(_score_shard, request_id, user_profile, top_n, cf_vector)
+                   for executor in self._executors]
+        # 每个分片的 worker 按提交顺序执行，失败后补交的 _release 总在本请求的第一步之后
+        results = [f.result() for f in futures]
+
+        # 全局排名 = 本分片内排名 + 其他分片中排在它前面的候选数
+        # （同分时按候选池顺序，分片连续切分，编号更小的分片整体在前）
+        ranks = [np.array([local_rank for _, _, local_rank, _ in winners], dtype=np.int64) for winners in results]
+        raws = [[raw for _, raw, _, _ in winners] for winners in results]
+        futures = [executor.submit(_count_ahead, request_id,
+                                   [raw for other in range(shard_id) for raw in raws[other]],
+                                   [raw for other in range(shard_id + 1, self.n_shards) for raw in raws[other]])
+                   for shard_id, executor in enumerate(self._executors)]
+        for shard_id, future in enumerate(futures):
+            # 依次对应分片 0..shard_id-1、shard_id+1.. 的入选候选
+            counts = np.concatenate(future.result())
+            pos = 0
+            for other in itertools.chain(range(shard_id), range(shard_id + 1, self.n_shards)):
+                ranks[other] += counts[pos:pos + len(raws[other])]
+                pos += len(raws[other])
+        return results, ranks
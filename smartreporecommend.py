@@ -7,90 +7,260 @@ import json
 import os
 import re
 import time
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 import hashlib
 from urllib.parse import quote
 import traceback
 import random
+import logging
+import copy
+import asyncio
+import contextvars
+import functools
+import threading
 import numpy as np
 from datetime import datetime, timedelta
 
+from async_http import AsyncHttpClient
+from cache_backend import CacheStore, make_backend
+from cache_codec import get_codec
+from circuit_breaker import get_breaker
+from deadline import deadline_expired, mark_degraded, remaining_timeout, stage, use_deadline
+from candidate_index import CandidateIndex
+from candidate_table import CandidateTable, CandidatePoolView, top_k_per_bucket
+from embedding_index import TermEmbedder, LSHIndex
+from pool_artifact import PoolArtifact
+from collab_filter import CFModel, CFScorer, starred_repos
+from diversity import validate_quotas
+from result_pages import RankedPages
+from scoring import (calculate_match_score, calculate_quality_score, calculate_static_prior, combine_components,
+                     rank_to_total_score, resolve_weights)
+from sharded_scoring import ShardedScorer
+from timeseries_features import compute_features, month_ordinal
+from top300_source import data_mtime as top300_data_mtime, is_archive, iter_projects as iter_top300_projects
+
+logger = logging.getLogger(__name__)
+
+# 负缓存：上游失败按失败类别记录标记文件（<缓存文件>.neg），有效期内不再请求
+NEGATIVE_CACHE_SUFFIX = '.neg'
+NEGATIVE_CACHE_TTL = {
+    'not_found': 24 * 3600,   # 404：仓库/指标不存在（含虚拟组织项目、OpenDigger 未收录的仓库）
+    'forbidden': 10 * 60,     # 401/403/429：Token 无效或限流，只对相同凭据生效
+    'unavailable': 5 * 60,    # 5xx、网络异常、重试耗尽
+}
+
+
+def _failure_class(status_code):
+    if status_code == 404:
+        return 'not_found'
+    if status_code in (401, 403, 429):
+        return 'forbidden'
+    return 'unavailable'
+
+
+def _rate_limited(status_code, headers):
+    """403 是否为限流：GitHub 主限流（X-RateLimit-Remaining: 0）或次级限流（带 Retry-After）"""
+    if status_code != 403 or headers is None:
+        return False
+    return headers.get('X-RateLimit-Remaining') == '0' or headers.get('Retry-After') is not None
+
+
+def _record_upstream(breaker, status_code, headers=None):
+    """
+    按响应状态更新熔断器：5xx、429 与限流导致的 403 计为失败，
+    其余（含 404、Token 无效的 403）说明上游可用
+    """
+    if status_code >= 500 or status_code == 429 or _rate_limited(status_code, headers):
+        breaker.record_failure(f"HTTP {status_code}")
+    else:
+        breaker.record_success()
+
+
+# 用户画像持久缓存有效期（与用户仓库列表的 API 缓存一致）
+PROFILE_CACHE_TTL = 24 * 3600
+
+
+# 重试退避抖动只影响等待时长、不影响结果，使用独立的随机数生成器
+_backoff_rng = random.Random()
+
+
+def _seeded_rng(*parts):
+    """
+    按给定键（用户名、仓库名等）派生的独立随机数生成器：相同输入总是得到相同的随机序列，
+    与处理顺序、并发线程无关（不修改全局 random 状态）
+    """
+    seed = int(hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest(), 16) % (2 ** 32)
+    return random.Random(seed)
+
+
 class SmartRepoRecommender:
     """开源项目推荐核心类（整合top_300项目库）"""
-    def __init__(self, github_token=None, opendigger_api_key=None):
+    def __init__(self, github_token=None, opendigger_api_key=None, scoring_workers=0, pool_artifact=None):
+        """
+        pool_artifact: 离线构建的候选池产物（目录路径或已加载的 PoolArtifact，见 pool_artifact.py）；
+                       提供时只读加载候选池、top_300 快照与预计算特征，不再联网构建
+        """
         # 基础配置
         self.github_api = "https://api.github.com"
         self.opendigger_base_url = "https://oss.x-lab.info/open_digger"
-        self.opendigger_api_key = opendigger_api_key
-        self.github_token = github_token
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "application/vnd.github.v3+json"
-        }
         
         # 路径配置
-        self.top300_root_dir = r"D:\dase导论\期末大作业\top_300_metrics"
+        # top_300 数据源：解压后的目录，或单个打包文件（.zip / .tar[.gz]，见 top300_source.py）
+        self.top300_root_dir = os.environ.get('OPENRANK_TOP300_PATH') or r"D:\dase导论\期末大作业\top_300_metrics"
         self.cache_dir = os.path.abspath("cache")
         self.opendigger_cache_dir = os.path.join(self.cache_dir, "opendigger")
-        self.large_candidate_cache = os.path.join(self.cache_dir, "large_candidate_pool.json")
+        # 用户画像持久缓存（预热与各 worker 共享）
+        self.profile_cache_dir = os.path.join(self.cache_dir, "profiles")
+        # API / 指标 / 画像 / 候选池缓存的存储后端（默认本地 cache/ 目录；OPENRANK_CACHE_BACKEND=redis://... 时
+        # 为进程内 LRU + 共享存储两级缓存，多节点共享上游数据，见 cache_backend.py），键为相对 cache_dir 的路径
+        cache_backend = make_backend(self.cache_dir)
+        # 缓存编解码（默认带版本头的二进制格式，原子写入；OPENRANK_CACHE_CODEC=json 切换为紧凑 JSON）。
+        # 共享存储的内容可能由任一节点写入，marshal 不能安全地解码不可信数据，此时固定使用 JSON
+        self.cache_codec = get_codec('json' if cache_backend.shared else None)
+        if cache_backend.shared and (os.environ.get('OPENRANK_CACHE_CODEC') or 'json').lower() != 'json':
+            logger.warning("[缓存] 共享缓存后端只支持 JSON 编解码，忽略 OPENRANK_CACHE_CODEC=%s",
+                           os.environ.get('OPENRANK_CACHE_CODEC'))
+        self.cache = CacheStore(cache_backend, self.cache_codec)
+        # 异步路径使用的 HTTP 客户端（with_credentials 得到的副本共享同一连接池）
+        self.http_client = AsyncHttpClient()
+        self.large_candidate_cache = f"large_candidate_pool{self.cache_codec.suffix}"
+        self.embedding_index_cache = os.path.join(self.cache_dir, "embedding_index.npz")
+        # bulk_ingest.py 生成的批量候选池快照（存在时并入候选池）
+        self.bulk_candidate_snapshot = os.path.join(self.cache_dir, "bulk_candidate_pool.json")
         
         # 新增：top_300项目映射表
         self.top300_projects = {}
         
         # 日志格式
-        print(f"[初始化] 指定的top_300_metrics路径: {self.top300_root_dir}")
-        print(f"[初始化] 路径是否存在: {os.path.exists(self.top300_root_dir)}")
+        logger.debug("[初始化] 指定的top_300_metrics路径: %s (存在: %s)",
+                     self.top300_root_dir, os.path.exists(self.top300_root_dir))
         
         # Token处理
-        if github_token and github_token.strip():
-            token = github_token.strip()
-            if token.startswith('ghp_') or token.startswith('github_pat_'):
-                self.headers["Authorization"] = f"token {token}"
-                self.token_valid = True
-                print("[初始化] ✅ GitHub Token已生效")
-            else:
-                print("[初始化] ⚠️  警告：Token格式错误（需以ghp_/github_pat_开头）")
-                self.token_valid = False
-        else:
-            self.token_valid = False
-            print("[初始化] ℹ️ 使用公开API（每小时限60次请求）")
+        self._apply_credentials(github_token, opendigger_api_key)
         
         # 目录创建
         try:
             os.makedirs(self.cache_dir, exist_ok=True)
             os.makedirs(self.opendigger_cache_dir, exist_ok=True)
-            os.makedirs(self.top300_root_dir, exist_ok=True)
+            os.makedirs(self.profile_cache_dir, exist_ok=True)
+            if pool_artifact is None and not is_archive(self.top300_root_dir):
+                os.makedirs(self.top300_root_dir, exist_ok=True)
         except Exception as e:
-            print(f"[初始化] ⚠️  目录创建失败: {e}")
+            logger.warning("[初始化] 目录创建失败: %s", e)
         
         # 每个用户最多允许的 top_300 项目数量（可调整）
         self.max_top300_per_user = 3
+        # 额外的多样性配额（每页）：{维度: {取值或 '*': 上限}}，维度为 domain/source/language/org，
+        # 如 {"language": {"*": 3}, "org": {"*": 2}}；OPENRANK_DIVERSITY_QUOTAS 以 JSON 配置
+        self.diversity_quotas = validate_quotas(json.loads(os.environ.get('OPENRANK_DIVERSITY_QUOTAS') or '{}'))
+        # 设置了额外配额时，打分阶段每个分组多保留的倍数（部分候选会因配额落选）
+        self.diversity_oversample = 4
+        
+        # 召回阶段：命中候选上限、按质量补充的候选数量（全局 / 每个来源）；retrieval_limit=None 时对全池精确打分
+        self.retrieval_limit = 2000
+        self.retrieval_backfill = 50
+        self.retrieval_source_backfill = 20
+        # 向量近邻召回数量（0 表示关闭）
+        self.ann_neighbors = 300
         
         # 初始化核心数据
         self.skill_graph = self._build_skill_graph()
         self.semantic_keywords = self._build_semantic_keywords()
-        self._load_top300_projects()  # 新增：加载top_300项目
-        self.large_candidate_pool = self._build_large_candidate_pool()
+        self.pool_artifact = None
+        if pool_artifact is not None:
+            # 只读加载离线产物，启动过程不访问网络；只核对清单，完整哈希校验由 build / verify 命令与热加载负责
+            if not isinstance(pool_artifact, PoolArtifact):
+                pool_artifact = PoolArtifact.load(pool_artifact, verify=False)
+            self.pool_artifact = pool_artifact
+            self.top300_projects = dict(pool_artifact.top300_projects or {})
+            # 列数据为只读内存映射，多个 worker 进程共享同一份页缓存
+            self.candidate_table = pool_artifact.table
+            self.snapshot_id = pool_artifact.version
+        else:
+            self.snapshot_id = time.strftime('live-%Y%m%dT%H%M%S', time.gmtime())
+            self._load_top300_projects()  # 新增：加载top_300项目
+            candidate_pool = self._build_large_candidate_pool()
+            self._merge_bulk_snapshot(candidate_pool)
+            # 列式存储候选池
+            self.candidate_table = CandidateTable.from_pool(candidate_pool)
+            del candidate_pool
+            self._attach_timeseries_features()
+        # large_candidate_pool 保留字典接口（按需物化行）
+        self.large_candidate_pool = CandidatePoolView(self.candidate_table)
+        features = self.pool_artifact.features if self.pool_artifact is not None else {}
+        self.candidate_index = CandidateIndex.from_features(self.candidate_table, self.skill_graph, features)
+        self.embedder = TermEmbedder(self.semantic_keywords, self.skill_graph)
+        self.embedding_index = self._load_embedding_index()
+        # 可选：协同过滤（collab_filter.py）。产物模式随产物加载；联网模式由 OPENRANK_CF_MODEL 指定模型文件，
+        # 仓库因子对齐后写入候选池特征列 cf_factors（须在分片之前）
+        self.cf_model = None
+        if self.pool_artifact is not None:
+            self.cf_scorer = CFScorer.from_features(self.candidate_table, features)
+        elif os.environ.get('OPENRANK_CF_MODEL'):
+            self.cf_model = CFModel.load(os.environ['OPENRANK_CF_MODEL'])
+            self.cf_scorer = CFScorer.from_model(self.candidate_table, self.cf_model)
+        else:
+            self.cf_scorer = None
+        # 训练集中没有的用户：OPENRANK_CF_STARRED=1 时拉取其 star 列表（经 API 缓存）即时 fold-in
+        self.cf_fold_in_starred = os.environ.get('OPENRANK_CF_STARRED') == '1'
+        # 可选：多进程分片打分（对整个候选池精确打分，不经过召回）
+        self.sharded_scorer = None
+        if scoring_workers:
+            self.sharded_scorer = ShardedScorer(self.candidate_table, self.skill_graph, n_shards=scoring_workers)
         self.user_profile_map = {}
+        # 权重重排（rerank）：每个用户对全部候选的打分分量只计算一次，按 LRU 保留
+        # component_cache_size 个用户（with_credentials 得到的副本共享同一缓存）
+        self.component_cache_size = 32
+        self._component_cache = OrderedDict()
+        self._component_lock = threading.Lock()
+
+    def _apply_credentials(self, github_token, opendigger_api_key):
+        """设置 GitHub Token / OpenDigger Key 及对应请求头"""
+        self.opendigger_api_key = opendigger_api_key
+        self.github_token = github_token
+        self.headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        if github_token and github_token.strip():
+            token = github_token.strip()
+            if token.startswith('ghp_') or token.startswith('github_pat_'):
+                self.headers["Authorization"] = f"token {token}"
+                self.token_valid = True
+                logger.info("[初始化] GitHub Token已生效")
+            else:
+                logger.warning("[初始化] Token格式错误（需以ghp_/github_pat_开头）")
+                self.token_valid = False
+        else:
+            self.token_valid = False
+            logger.info("[初始化] 使用公开API（每小时限60次请求）")
+
+    def with_credentials(self, github_token=None, opendigger_api_key=None):
+        """
+        返回共享候选池/索引的浅拷贝，仅替换凭据（用于服务端按请求传入 Token），
+        候选池等只读数据不会重复加载；用户画像缓存各自独立
+        """
+        clone = copy.copy(self)
+        clone._apply_credentials(github_token, opendigger_api_key)
+        clone.user_profile_map = {}
+        return clone
+
+    def top300_data_mtime(self):
+        """top_300 数据源中最新的修改时间（不存在时为 0），用于判断导出是否已刷新"""
+        return top300_data_mtime(self.top300_root_dir)
 
     def _load_top300_projects(self):
         """加载top_300项目库的指标数据 - 适配组织/仓库混合格式"""
-        print(f"[Top300] 开始加载top_300项目库数据...")
+        logger.info("[Top300] 开始加载top_300项目库数据")
         
         if not os.path.exists(self.top300_root_dir):
-            print(f"[Top300] ⚠️  top_300_metrics路径不存在: {self.top300_root_dir}")
+            logger.warning("[Top300] top_300_metrics路径不存在: %s", self.top300_root_dir)
             return
         
-        # 扫描目录中的所有项目文件夹
+        # 逐个读取项目文件夹（目录或打包文件，打包文件只用一个文件句柄顺序读取）
         try:
-            project_folders = [d for d in os.listdir(self.top300_root_dir) 
-                             if os.path.isdir(os.path.join(self.top300_root_dir, d))]
-            print(f"[Top300] 发现 {len(project_folders)} 个项目文件夹")
-            
             loaded_count = 0
-            for project_folder in project_folders:
-                project_path = os.path.join(self.top300_root_dir, project_folder)
-                
+            for project_folder, metrics in iter_top300_projects(self.top300_root_dir):
                 # 尝试从文件夹名推断仓库信息
                 # 文件夹名可能是组织名（如"facebook"）或仓库名（如"facebook_react"）
                 repo_info = self._infer_repo_info_from_folder(project_folder)
@@ -101,55 +271,23 @@ class SmartRepoRecommender:
                     'metrics': {}
                 })
                 
-                # 读取各种指标文件
-                metric_files = {
-                    'activity': 'activity.json',
-                    'openrank': 'openrank.json',
-                    'attention': 'attention.json',
-                    'issue': 'issue.json',
-                    'stars': 'stars.json',
-                    'technical_fork': 'technical_fork.json',
-                    'participants': 'participants.json',
-                    'inactive_contributors': 'inactive_contributors.json',
-                    'bus_factor': 'bus_factor.json',
-                    'issues_new': 'issues_new.json',
-                    'issues_closed': 'issues_closed.json',
-                    'issue_comments': 'issue_comments.json',
-                    'issue_response_time': 'issue_response_time.json',
-                    'issue_resolution_duration': 'issue_resolution_duration.json',
-                    'code_change_lines': 'code_change_lines.json',
-                    'change_requests': 'change_requests.json',
-                    'change_requests_accepted': 'change_requests_accepted.json',
-                    'change_requests_reviews': 'change_requests_reviews.json'
-                }
-                
-                for metric_name, filename in metric_files.items():
-                    file_path = os.path.join(project_path, filename)
-                    if os.path.exists(file_path):
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                data = json.load(f)
-                                repo_info['metrics'][metric_name] = data
-                                
-                                # 如果是关键指标，立即计算平均值
-                                if metric_name in ['activity', 'openrank', 'stars', 'technical_fork']:
-                                    avg_value = self._calculate_avg_from_time_series(data, metric_name)
-                                    repo_info[metric_name] = avg_value
-                                    
-                        except Exception as e:
-                            repo_info['metrics'][metric_name] = None
-                    else:
-                        repo_info['metrics'][metric_name] = None
+                # 各指标数据（18 个指标，见 timeseries_features.TOP300_METRICS；缺失或无法解析时为 None）
+                for metric_name, data in metrics.items():
+                    repo_info['metrics'][metric_name] = data
+                    # 如果是关键指标，立即计算平均值
+                    if data is not None and metric_name in ['activity', 'openrank', 'stars', 'technical_fork']:
+                        repo_info[metric_name] = self._calculate_avg_from_time_series(data, metric_name)
                 
-                # 确保至少有一些关键指标
+                # 确保至少有一些关键指标（缺失时按文件夹名确定性生成）
+                rng = _seeded_rng('top300', project_folder)
                 if 'activity' not in repo_info or repo_info['activity'] is None:
-                    repo_info['activity'] = random.uniform(50, 90)
+                    repo_info['activity'] = rng.uniform(50, 90)
                 if 'openrank' not in repo_info or repo_info['openrank'] is None:
-                    repo_info['openrank'] = random.uniform(60, 90)
+                    repo_info['openrank'] = rng.uniform(60, 90)
                 if 'stars' not in repo_info or repo_info['stars'] is None:
-                    repo_info['stars'] = random.randint(1000, 100000)
+                    repo_info['stars'] = rng.randint(1000, 100000)
                 if 'forks' not in repo_info or repo_info.get('forks') is None:
-                    repo_info['forks'] = random.randint(100, 10000)
+                    repo_info['forks'] = rng.randint(100, 10000)
                 
                 # 添加到映射表
                 key = repo_info['repo'] if 'repo' in repo_info else repo_info['org']
@@ -158,12 +296,14 @@ class SmartRepoRecommender:
                 
                 # 进度显示
                 if loaded_count % 50 == 0:
-                    print(f"[Top300] 已加载 {loaded_count}/{len(project_folders)} 个项目...")
+                    logger.debug("[Top300] 已加载 %d 个项目", loaded_count)
             
-            print(f"[Top300] ✅ 成功加载 {len(self.top300_projects)} 个top_300项目")
+            logger.info("[Top300] 成功加载 %d 个top_300项目", len(self.top300_projects))
             
-            # 打印前10个项目信息（安全的格式化）
-            print("[Top300] 前10个项目示例:")
+            # 前10个项目示例（仅在调试级别格式化）
+            if not logger.isEnabledFor(logging.DEBUG):
+                return
+            logger.debug("[Top300] 前10个项目示例:")
             for i, (key, info) in enumerate(list(self.top300_projects.items())[:10]):
                 activity_val = info.get('activity')
                 openrank_val = info.get('openrank')
@@ -175,11 +315,10 @@ class SmartRepoRecommender:
                 stars_str = f"{stars_val:,}" if isinstance(stars_val, int) else str(stars_val)
                 
                 repo_name = info.get('repo', info.get('org', 'Unknown'))
-                print(f"  {i+1}. {repo_name}: activity={activity_str}, openrank={openrank_str}, stars={stars_str}")
+                logger.debug("  %d. %s: activity=%s, openrank=%s, stars=%s", i + 1, repo_name, activity_str, openrank_str, stars_str)
         
         except Exception as e:
-            print(f"[Top300] ❌ 加载top_300项目库失败: {e}")
-            traceback.print_exc()
+            logger.exception("[Top300] 加载top_300项目库失败: %s", e)
 
     def _infer_repo_info_from_folder(self, folder_name):
         """从文件夹名推断仓库信息"""
@@ -234,26 +373,28 @@ class SmartRepoRecommender:
             'type': 'organization'
         }
 
-    def _calculate_avg_from_time_series(self, data, metric_name):
+    @staticmethod
+    def _calculate_avg_from_time_series(data, metric_name):
         """从时间序列数据中计算平均值"""
         if not data or not isinstance(data, dict):
             return None
         
         try:
-            # 提取所有数值
-            values = []
+            # 提取所有数值（只处理年月格式的键，如"2023-01"），按月份排序
+            dated = []
             for key, value in data.items():
-                # 只处理年月格式的键（如"2023-01"）
-                if key.startswith('2') and '-' in key and len(key.split('-')) == 2:
-                    try:
-                        # 尝试转换为浮点数
-                        float_val = float(value)
-                        values.append(float_val)
-                    except (ValueError, TypeError):
-                        continue
+                ordinal = month_ordinal(key)
+                if ordinal is None:
+                    continue
+                try:
+                    dated.append((ordinal, float(value)))
+                except (ValueError, TypeError):
+                    continue
             
-            if not values:
+            if not dated:
                 return None
+            dated.sort(key=lambda item: item[0])
+            values = [value for _, value in dated]
             
             # 计算最近12个月的平均值（或所有数据的平均值）
             recent_values = values[-12:] if len(values) >= 12 else values
@@ -273,9 +414,28 @@ class SmartRepoRecommender:
                 return avg_value
                 
         except Exception as e:
-            print(f"[时间序列计算] 失败 {metric_name}: {e}")
+            logger.debug("[时间序列计算] 失败 %s: %s", metric_name, e)
             return None
 
+    @staticmethod
+    def _top300_pool_key(key, top300_info):
+        """top_300 项目在候选池中的键（组织项目为虚拟仓库 org/top-repos）"""
+        if top300_info.get('type') == 'repository':
+            return top300_info['repo']
+        return f"{top300_info.get('org', key)}/top-repos"
+
+    def _attach_timeseries_features(self):
+        """由 top_300 项目的 18 个指标时间序列向量化计算特征，作为候选池列（其余候选为 NaN）"""
+        rows, series = [], []
+        for key, top300_info in self.top300_projects.items():
+            row = self.candidate_table.index.get(self._top300_pool_key(key, top300_info))
+            if row is not None and top300_info.get('metrics'):
+                rows.append(row)
+                series.append(top300_info['metrics'])
+        if rows:
+            self.candidate_table.attach_features(rows, compute_features(series))
+            logger.info("[特征] 已计算 %d 个top_300项目的时间序列特征", len(rows))
+
     def _build_skill_graph(self):
         """扩展版技能关联图谱"""
         return {
@@ -310,10 +470,10 @@ class SmartRepoRecommender:
             '嵌入式': ['embedded', '硬件', '物联网', '单片机']
         }
 
-    def _get_opendigger_cache_path(self, repo_full_name, metric_name):
-        """生成OpenDigger缓存路径"""
+    def _get_opendigger_cache_key(self, repo_full_name, metric_name):
+        """生成OpenDigger缓存键"""
         safe_repo = repo_full_name.replace('/', '_').replace('\\', '_').replace(':', '_')
-        return os.path.join(self.opendigger_cache_dir, f"{safe_repo}_{metric_name}.json")
+        return f"opendigger/{safe_repo}_{metric_name}{self.cache_codec.suffix}"
 
     def _fetch_opendigger_metric_with_retry(self, repo_full_name, metric_name, max_retries=3):
         """获取OpenDigger指标（优先使用top_300本地数据）"""
@@ -323,39 +483,52 @@ class SmartRepoRecommender:
             # 检查是否匹配组织名或仓库名
             if 'repo' in top300_info and top300_info['repo'] == repo_full_name:
                 if metric_name == 'activity' and 'activity' in top300_info and top300_info['activity'] is not None:
-                    print(f"[指标] 使用top_300本地数据: {repo_full_name}/activity")
+                    logger.debug("[指标] 使用top_300本地数据: %s/activity", repo_full_name)
                     return [{'value': top300_info['activity']}]
                 
                 if metric_name == 'openrank' and 'openrank' in top300_info and top300_info['openrank'] is not None:
-                    print(f"[指标] 使用top_300本地数据: {repo_full_name}/openrank")
+                    logger.debug("[指标] 使用top_300本地数据: %s/openrank", repo_full_name)
                     return [{'value': top300_info['openrank']}]
         
         # 如果没有本地数据，则从OpenDigger API获取
-        cache_path = self._get_opendigger_cache_path(repo_full_name, metric_name)
+        cache_path = self._get_opendigger_cache_key(repo_full_name, metric_name)
         cache_ttl = 7 * 24 * 3600
         
-        if os.path.exists(cache_path):
-            file_age = time.time() - os.path.getmtime(cache_path)
-            if file_age < cache_ttl:
-                try:
-                    with open(cache_path, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except Exception as e:
-                    print(f"[缓存] 读取失败 {repo_full_name}: {e}")
+        cached = self.cache.load(cache_path, cache_ttl)
+        if cached is not None:
+            return cached[0]
         
+        rng = _seeded_rng('opendigger', repo_full_name, metric_name)
         if '/' not in repo_full_name:
-            print(f"[OpenDigger] 跳过无效仓库名: {repo_full_name}")
-            return [{'value': random.uniform(60, 90)}]
+            logger.debug("[OpenDigger] 跳过无效仓库名: %s", repo_full_name)
+            return [{'value': rng.uniform(60, 90)}]
+        
+        # 已知缺失/不可用的指标直接使用默认值，不再重复重试
+        failure = self._read_negative_cache(cache_path)
+        if failure is not None:
+            logger.debug("[OpenDigger] 负缓存命中 %s/%s (%s)", repo_full_name, metric_name, failure)
+            return [{'value': rng.uniform(60, 90)}]
         
         owner, repo = repo_full_name.split('/', 1)
         url = f"{self.opendigger_base_url}/github/{quote(owner)}/{quote(repo)}/{metric_name}.json"
         
         headers = {"User-Agent": "OpenDigger-Data-Client/2.0"}
+        breaker = get_breaker(url)
         
         for retry in range(max_retries):
+            # 请求时间预算耗尽或熔断打开时不再等待超时与退避，直接使用过期缓存或默认值
+            expired = deadline_expired()
+            if expired or not breaker.allow():
+                if expired:
+                    mark_degraded('时间预算耗尽，OpenDigger 指标使用缓存或默认值')
+                else:
+                    logger.debug("[OpenDigger] 熔断中，降级处理 %s/%s", repo_full_name, metric_name)
+                stale = self._load_stale_cache(cache_path)
+                return stale if stale is not None else [{'value': rng.uniform(60, 90)}]
             try:
-                time.sleep(random.uniform(0.5, 1.5))
-                response = requests.get(url, headers=headers, timeout=30)
+                time.sleep(remaining_timeout(_backoff_rng.uniform(0.5, 1.5)))
+                response = requests.get(url, headers=headers, timeout=remaining_timeout(30))
+                _record_upstream(breaker, response.status_code, response.headers)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -366,33 +539,38 @@ class SmartRepoRecommender:
                         result_data = data
                     
                     try:
-                        with open(cache_path, 'w', encoding='utf-8') as f:
-                            json.dump(result_data, f, ensure_ascii=False, indent=2)
+                        self.cache.dump(cache_path, result_data)
                     except Exception as e:
-                        print(f"[缓存] 保存失败 {repo_full_name}: {e}")
+                        logger.warning("[缓存] 保存失败 %s: %s", repo_full_name, e)
                     return result_data
                 elif response.status_code == 404:
-                    print(f"[OpenDigger] 指标不存在 {repo_full_name}/{metric_name}")
-                    return [{'value': random.uniform(60, 90)}]
+                    logger.info("[OpenDigger] 指标不存在 %s/%s", repo_full_name, metric_name)
+                    self._write_negative_cache(cache_path, 'not_found', 404)
+                    return [{'value': rng.uniform(60, 90)}]
                 elif response.status_code == 429:
                     wait_time = 10 * (retry + 1)
-                    print(f"[OpenDigger] 限流，等待{wait_time}秒后重试 {repo_full_name} (重试{retry+1}/{max_retries})")
-                    time.sleep(wait_time)
+                    logger.warning("[OpenDigger] 限流，等待%d秒后重试 %s (重试%d/%d)", wait_time, repo_full_name, retry + 1, max_retries)
+                    time.sleep(remaining_timeout(wait_time))
                     continue
                 else:
-                    print(f"[OpenDigger] 请求失败 {url}: {response.status_code} (重试{retry+1}/{max_retries})")
+                    logger.warning("[OpenDigger] 请求失败 %s: %s (重试%d/%d)", url, response.status_code, retry + 1, max_retries)
                     
             except Exception as e:
-                print(f"[OpenDigger] 请求异常 {repo_full_name}: {e} (重试{retry+1}/{max_retries})")
-                if retry == max_retries - 1:
-                    return [{'value': random.uniform(60, 90)}]
+                if deadline_expired():
+                    # 超时由请求预算截断，不计为上游故障
+                    continue
+                breaker.record_failure(e)
+                logger.warning("[OpenDigger] 请求异常 %s: %s (重试%d/%d)", repo_full_name, e, retry + 1, max_retries)
         
-        return [{'value': random.uniform(60, 90)}]
+        # 重试耗尽
+        self._write_negative_cache(cache_path, 'unavailable')
+        return [{'value': rng.uniform(60, 90)}]
 
-    def _calculate_opendigger_metric(self, metric_data, metric_type):
-        """计算OpenDigger指标有效值"""
+    def _calculate_opendigger_metric(self, metric_data, metric_type, repo_full_name=''):
+        """计算OpenDigger指标有效值（无有效数据时按仓库名确定性生成默认值）"""
+        rng = _seeded_rng('opendigger_value', repo_full_name, metric_type)
         if not metric_data or not isinstance(metric_data, list):
-            return random.uniform(60, 90)
+            return rng.uniform(60, 90)
         
         values = []
         for item in metric_data:
@@ -405,50 +583,140 @@ class SmartRepoRecommender:
                     values.append(value)
         
         if not values:
-            return random.uniform(60, 90)
+            return rng.uniform(60, 90)
         
         recent_values = values[-12:] if len(values) >= 12 else values
         avg_value = sum(recent_values) / len(recent_values)
         
         return round(min(avg_value, 100.0), 2)
 
-    def _make_api_request(self, url, cache_time=3600):
-        """通用API请求方法"""
+    def _credential_fingerprint(self):
+        """当前 GitHub 凭据的指纹（负缓存中 forbidden 类只对相同凭据生效）"""
+        return hashlib.md5(self.headers.get('Authorization', '').encode()).hexdigest()[:12]
+
+    def _read_negative_cache(self, cache_file, fingerprint=''):
+        """读取负缓存标记（cache_file 为数据的缓存键），有效时返回失败类别，否则返回 None"""
+        cached = self.cache.load(cache_file + NEGATIVE_CACHE_SUFFIX)
+        if cached is None:
+            return None
+        entry, stored_at = cached
+        age = time.time() - stored_at
+        failure = entry.get('failure') if isinstance(entry, dict) else None
+        if failure not in NEGATIVE_CACHE_TTL or age >= NEGATIVE_CACHE_TTL[failure]:
+            return None
+        if failure == 'forbidden' and entry.get('credential') != fingerprint:
+            return None
+        return failure
+
+    def _write_negative_cache(self, cache_file, failure, status_code=None, fingerprint=''):
+        """记录负缓存标记（失败类别见 NEGATIVE_CACHE_TTL）"""
+        try:
+            self.cache.dump(cache_file + NEGATIVE_CACHE_SUFFIX,
+                            {'failure': failure, 'status': status_code, 'credential': fingerprint})
+        except Exception as e:
+            logger.warning("[负缓存] 保存失败 %s: %s", cache_file, e)
+
+    def _load_stale_cache(self, cache_file):
+        """读取缓存（不论是否过期），不存在或损坏时返回 None；用于熔断期间的降级"""
+        cached = self.cache.load(cache_file)
+        if cached is None:
+            return None
+        logger.debug("[熔断] 使用过期缓存 %s", cache_file)
+        return cached[0]
+
+    def _read_api_cache(self, url, cache_time):
+        """
+        读取未过期的API缓存，返回 (缓存键, 是否命中, 数据)；
+        负缓存命中时同样视为命中，数据为 None（与请求失败的返回值一致）
+        """
         cache_key = hashlib.md5(url.encode()).hexdigest()
-        cache_file = os.path.join(self.cache_dir, f"api_{cache_key}.json")
-        
-        if os.path.exists(cache_file) and (time.time() - os.path.getmtime(cache_file) < cache_time):
+        cache_file = f"api_{cache_key}{self.cache_codec.suffix}"
+        
+        cached = self.cache.load(cache_file, cache_time)
+        if cached is not None:
+            return cache_file, True, cached[0]
+        failure = self._read_negative_cache(cache_file, self._credential_fingerprint())
+        if failure is not None:
+            logger.debug("[API缓存] 负缓存命中 %s (%s)", url, failure)
+            return cache_file, True, None
+        return cache_file, False, None
+
+    def _handle_api_response(self, url, cache_file, status_code, data):
+        """处理API响应：200 写缓存并返回数据，其余状态记录日志、写负缓存并返回 None"""
+        if status_code == 200:
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                self.cache.dump(cache_file, data)
             except Exception as e:
-                print(f"[API缓存] 读取失败 {url}: {e}")
+                logger.warning("[API缓存] 保存失败 %s: %s", url, e)
+            return data
+        elif status_code == 403:
+            logger.warning("[API] 权限拒绝 %s (Token无效/限流)", url)
+        elif status_code == 404:
+            logger.info("[API] 资源不存在 %s", url)
+        else:
+            logger.warning("[API] 请求失败 %s: %s", url, status_code)
+        self._write_negative_cache(cache_file, _failure_class(status_code), status_code, self._credential_fingerprint())
+        return None
+
+    def _make_api_request(self, url, cache_time=3600):
+        """通用API请求方法"""
+        cache_file, hit, data = self._read_api_cache(url, cache_time)
+        if hit:
+            return data
+        if deadline_expired():
+            mark_degraded('时间预算耗尽，跳过 GitHub 请求并使用缓存')
+            return self._load_stale_cache(cache_file)
+        breaker = get_breaker(url)
+        if not breaker.allow():
+            return self._load_stale_cache(cache_file)
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                try:
-                    with open(cache_file, 'w', encoding='utf-8') as f:
-                        json.dump(data, f, ensure_ascii=False, indent=2)
-                except Exception as e:
-                    print(f"[API缓存] 保存失败 {url}: {e}")
-                return data
-            elif response.status_code == 403:
-                print(f"[API] 权限拒绝 {url} (Token无效/限流)")
-                return None
-            elif response.status_code == 404:
-                print(f"[API] 资源不存在 {url}")
-                return None
-            else:
-                print(f"[API] 请求失败 {url}: {response.status_code}")
-                return None
+            response = requests.get(url, headers=self.headers, timeout=remaining_timeout(30))
+            data = response.json() if response.status_code == 200 else None
+        except Exception as e:
+            if deadline_expired():
+                # 超时由请求预算截断，不计为上游故障
+                mark_degraded('时间预算耗尽，GitHub 请求被中止')
+                return self._load_stale_cache(cache_file)
+            breaker.record_failure(e)
+            logger.warning("[API] 请求异常 %s: %s", url, e)
+            self._write_negative_cache(cache_file, 'unavailable')
+            return None
+        _record_upstream(breaker, response.status_code, response.headers)
+        return self._handle_api_response(url, cache_file, response.status_code, data)
+
+    async def _make_api_request_async(self, url, cache_time=3600):
+        """
+        通用API请求方法（异步：等待上游响应期间不占用线程）
+        缓存读写在线程中执行：Redis / 分层后端的读写是阻塞的网络往返，不能占用事件循环
+        """
+        cache_file, hit, data = await asyncio.to_thread(self._read_api_cache, url, cache_time)
+        if hit:
+            return data
+        if deadline_expired():
+            mark_degraded('时间预算耗尽，跳过 GitHub 请求并使用缓存')
+            return await asyncio.to_thread(self._load_stale_cache, cache_file)
+        breaker = get_breaker(url)
+        if not breaker.allow():
+            return await asyncio.to_thread(self._load_stale_cache, cache_file)
+        
+        try:
+            status_code, data, headers = await self.http_client.get_json(url, headers=self.headers,
+                                                                         timeout=remaining_timeout(30))
         except Exception as e:
-            print(f"[API] 请求异常 {url}: {e}")
+            if deadline_expired():
+                mark_degraded('时间预算耗尽，GitHub 请求被中止')
+                return await asyncio.to_thread(self._load_stale_cache, cache_file)
+            breaker.record_failure(e)
+            logger.warning("[API] 请求异常 %s: %s", url, e)
+            await asyncio.to_thread(self._write_negative_cache, cache_file, 'unavailable')
             return None
+        _record_upstream(breaker, status_code, headers)
+        return await asyncio.to_thread(self._handle_api_response, url, cache_file, status_code, data)
 
     def _get_github_repo_metrics(self, repo_full_name):
-        """获取GitHub仓库指标（优先使用top_300本地数据）"""
+        """获取GitHub仓库指标（优先使用top_300本地数据；缺失项按仓库名确定性生成）"""
+        rng = _seeded_rng('github', repo_full_name)
         # 首先检查top_300项目中是否有该指标
         for key, top300_info in self.top300_projects.items():
             if 'repo' in top300_info and top300_info['repo'] == repo_full_name:
@@ -457,19 +725,19 @@ class SmartRepoRecommender:
                 
                 # 如果本地数据中没有，使用默认值
                 if stars is None or stars <= 0:
-                    stars = random.randint(1000, 100000)
+                    stars = rng.randint(1000, 100000)
                 if forks is None or forks <= 0:
-                    forks = random.randint(100, 10000)
+                    forks = rng.randint(100, 10000)
                 
                 # 估算贡献者数（基于星数分级）
                 if stars < 1000:
-                    contributors = random.randint(5, 50)
+                    contributors = rng.randint(5, 50)
                 elif stars < 10000:
-                    contributors = random.randint(50, 500)
+                    contributors = rng.randint(50, 500)
                 elif stars < 100000:
-                    contributors = random.randint(500, 2000)
+                    contributors = rng.randint(500, 2000)
                 else:
-                    contributors = random.randint(2000, 5000)
+                    contributors = rng.randint(2000, 5000)
                 
                 metrics = {
                     'stars': int(stars),
@@ -481,39 +749,33 @@ class SmartRepoRecommender:
         
         # 如果没有本地数据，则从GitHub API获取
         cache_key = hashlib.md5(f"github_{repo_full_name}".encode()).hexdigest()
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        cache_file = f"{cache_key}{self.cache_codec.suffix}"
         cache_ttl = 24 * 3600
         
-        use_cache = False
-        cached_data = None
-        if os.path.exists(cache_file) and (time.time() - os.path.getmtime(cache_file) < cache_ttl):
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-                    use_cache = True
-            except Exception as e:
-                print(f"[GitHub API] 缓存读取失败 {repo_full_name}: {e}")
+        cached = self.cache.load(cache_file, cache_ttl)
+        if cached is not None:
+            return cached[0]
         
         try:
             url = f"{self.github_api}/repos/{repo_full_name}"
             response = self._make_api_request(url, cache_time=cache_ttl)
             
             if response:
-                stars = response.get('stargazers_count', random.randint(1000, 100000))
-                forks = response.get('forks_count', random.randint(100, 10000))
+                stars = response.get('stargazers_count', rng.randint(1000, 100000))
+                forks = response.get('forks_count', rng.randint(100, 10000))
             else:
-                stars = random.randint(1000, 100000)
-                forks = random.randint(100, 10000)
+                stars = rng.randint(1000, 100000)
+                forks = rng.randint(100, 10000)
             
             # 按星数分级估算贡献者数
             if stars < 1000:
-                contributors = random.randint(5, 50)
+                contributors = rng.randint(5, 50)
             elif stars < 10000:
-                contributors = random.randint(50, 500)
+                contributors = rng.randint(50, 500)
             elif stars < 100000:
-                contributors = random.randint(500, 2000)
+                contributors = rng.randint(500, 2000)
             else:
-                contributors = random.randint(2000, 5000)
+                contributors = rng.randint(2000, 5000)
             
             metrics = {
                 'stars': stars,
@@ -522,28 +784,37 @@ class SmartRepoRecommender:
             }
             
             try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(metrics, f, ensure_ascii=False, indent=2)
+                self.cache.dump(cache_file, metrics)
             except Exception as e:
-                print(f"[缓存] 保存失败 {repo_full_name}: {e}")
+                logger.warning("[缓存] 保存失败 %s: %s", repo_full_name, e)
             
             return metrics
         except Exception as e:
-            print(f"[GitHub API] 获取指标失败 {repo_full_name}: {e}")
+            logger.warning("[GitHub API] 获取指标失败 %s: %s", repo_full_name, e)
             return {
-                'stars': random.randint(1000, 100000),
-                'contributors': random.randint(10, 5000),
-                'forks': random.randint(100, 10000)
+                'stars': rng.randint(1000, 100000),
+                'contributors': rng.randint(10, 5000),
+                'forks': rng.randint(100, 10000)
             }
 
     def _get_user_repos(self, username):
         """获取用户的GitHub仓库列表"""
-        print(f"🔍 正在获取 {username} 的仓库数据...")
+        logger.info("[用户] 正在获取 %s 的仓库数据", username)
         repos_url = f"{self.github_api}/users/{username}/repos?per_page=100"
         repos_data = self._make_api_request(repos_url, cache_time=24*3600)
-        
+        return self._parse_user_repos(username, repos_data)
+
+    async def _get_user_repos_async(self, username):
+        """获取用户的GitHub仓库列表（异步）"""
+        logger.info("[用户] 正在获取 %s 的仓库数据", username)
+        repos_url = f"{self.github_api}/users/{username}/repos?per_page=100"
+        repos_data = await self._make_api_request_async(repos_url, cache_time=24*3600)
+        return self._parse_user_repos(username, repos_data)
+
+    def _parse_user_repos(self, username, repos_data):
+        """GitHub 仓库列表响应 -> 仓库关键信息列表"""
         if not repos_data or not isinstance(repos_data, list):
-            print(f"⚠️  无法获取 {username} 的仓库数据，使用默认偏好")
+            logger.warning("[用户] 无法获取 %s 的仓库数据，使用默认偏好", username)
             return None
         
         # 提取仓库关键信息
@@ -561,7 +832,7 @@ class SmartRepoRecommender:
                 'forks': repo.get('forks_count', 0) or 0
             })
         
-        print(f"✅ 成功获取 {username} 的 {len(user_repos)} 个有效仓库")
+        logger.info("[用户] 成功获取 %s 的 %d 个有效仓库", username, len(user_repos))
         return user_repos
 
     def _analyze_user_from_repos(self, username, user_repos):
@@ -571,6 +842,7 @@ class SmartRepoRecommender:
             user_hash = int(hashlib.md5(username.encode('utf-8')).hexdigest(), 16)
             core_domains = ["AI", "前端", "后端", "DevOps", "数据"]
             core_domain = core_domains[user_hash % len(core_domains)]
+            rng = random.Random(user_hash % 1000000)
             
             if core_domain == "AI":
                 user_skills = {"python": 0.9, "机器学习": 0.85}
@@ -583,16 +855,16 @@ class SmartRepoRecommender:
             else:
                 user_skills = {"sql": 0.9, "数据处理": 0.85}
             
-            domain_preferences = [core_domain] + random.sample(["AI", "数据", "后端", "前端", "工具"], 2)
+            domain_preferences = [core_domain] + rng.sample(["AI", "数据", "后端", "前端", "工具"], 2)
             return {
                 'skills': user_skills,
                 'domains': domain_preferences,
                 'core_domain': core_domain,
-                'experience_level': random.choice(['beginner', 'intermediate', 'advanced']),
+                'experience_level': rng.choice(['beginner', 'intermediate', 'advanced']),
                 'user_seed': user_hash % 1000000,
-                'exp_weight': random.uniform(0.8, 1.2),
-                'contrib_weight': random.uniform(0.7, 1.3),
-                'activity_weight': random.uniform(0.8, 1.2)
+                'exp_weight': rng.uniform(0.8, 1.2),
+                'contrib_weight': rng.uniform(0.7, 1.3),
+                'activity_weight': rng.uniform(0.8, 1.2)
             }
         
         # 分析用户仓库的语言分布
@@ -652,10 +924,18 @@ class SmartRepoRecommender:
         if domain_scores:
             core_domain = max(domain_scores, key=domain_scores.get)
         
+        # 生成用户唯一种子：画像中的随机项都来自该用户自己的随机数生成器，
+        # 不修改全局 random 状态，多线程并发时互不干扰，相同输入得到相同画像
+        user_seed = int(hashlib.md5(f"{username}_{str(language_counter)}".encode()).hexdigest(), 16) % 1000000
+        rng = random.Random(user_seed)
+        exp_weight = rng.uniform(0.8, 1.2)
+        contrib_weight = rng.uniform(0.7, 1.3)
+        activity_weight = rng.uniform(0.8, 1.2)
+        
         # 确定领域偏好
         domain_preferences = [core_domain]
         other_domains = [d for d in domain_keywords.keys() if d != core_domain]
-        domain_preferences.extend(random.sample(other_domains, 2))
+        domain_preferences.extend(rng.sample(other_domains, 2))
         
         # 确定经验等级
         avg_stars = sum(repo.get('stars', 0) for repo in user_repos) / max(1, len(user_repos))
@@ -666,10 +946,6 @@ class SmartRepoRecommender:
         else:
             experience_level = 'beginner'
         
-        # 生成用户唯一种子
-        user_seed = int(hashlib.md5(f"{username}_{str(language_counter)}".encode()).hexdigest(), 16) % 1000000
-        random.seed(user_seed)
-        
         # 构建用户画像
         user_profile = {
             'skills': user_skills,
@@ -677,184 +953,115 @@ class SmartRepoRecommender:
             'core_domain': core_domain,
             'experience_level': experience_level,
             'user_seed': user_seed,
-            'exp_weight': random.uniform(0.8, 1.2),
-            'contrib_weight': random.uniform(0.7, 1.3),
-            'activity_weight': random.uniform(0.8, 1.2),
+            'exp_weight': exp_weight,
+            'contrib_weight': contrib_weight,
+            'activity_weight': activity_weight,
             'language_stats': dict(language_counter),
             'topic_stats': dict(topic_counter.most_common(5))
         }
         
-        # 打印用户分析结果
-        print(f"\n📊 {username} 的画像分析:")
-        print(f"   主要语言: {', '.join([f'{lang} ({count})' for lang, count in language_counter.most_common(3)])}")
-        print(f"   核心领域: {core_domain}")
-        print(f"   经验等级: {experience_level}")
-        print(f"   热门主题: {', '.join(list(topic_counter.keys())[:5])}")
+        # 用户分析结果（详细模式下输出）
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[画像] %s: 主要语言=%s, 核心领域=%s, 经验等级=%s, 热门主题=%s",
+                        username,
+                        ', '.join(f'{lang} ({count})' for lang, count in language_counter.most_common(3)),
+                        core_domain, experience_level,
+                        ', '.join(list(topic_counter.keys())[:5]))
         
         return user_profile
 
     def _analyze_user_profile(self, username):
         """入口方法：分析用户画像"""
-        print(f"👤 开始分析用户: {username}")
+        logger.info("[画像] 开始分析用户: %s", username)
         
         # 1. 获取用户仓库
         user_repos = self._get_user_repos(username)
-        
+        return self._build_user_profile(username, user_repos)
+
+    def _build_user_profile(self, username, user_repos):
+        """基于已获取的仓库分析并保存用户画像"""
         # 2. 基于仓库分析画像
         user_profile = self._analyze_user_from_repos(username, user_repos)
         
-        # 3. 保存用户画像
+        # 3. 保存用户画像（仓库数据获取失败时的默认偏好不写入持久缓存）
         self.user_profile_map[username] = user_profile
+        if user_repos is not None:
+            self._save_cached_profile(username, user_profile)
         
-        print(f"✅ 用户分析完成: {username}")
+        logger.info("[画像] 用户分析完成: %s", username)
+        return user_profile
+
+    def _profile_cache_key(self, username):
+        # GitHub 用户名不区分大小写
+        cache_key = hashlib.md5(username.lower().encode('utf-8')).hexdigest()
+        return f"profiles/{cache_key}{self.cache_codec.suffix}"
+
+    def _load_cached_profile(self, username):
+        """读取未过期的持久画像缓存，未命中时返回 None"""
+        cached = self.cache.load(self._profile_cache_key(username), PROFILE_CACHE_TTL)
+        if cached is None:
+            return None
+        user_profile = cached[0]
+        logger.info("[画像] 命中画像缓存: %s", username)
         return user_profile
 
+    def _save_cached_profile(self, username, user_profile):
+        try:
+            self.cache.dump(self._profile_cache_key(username), user_profile)
+        except Exception as e:
+            logger.warning("[画像缓存] 保存失败 %s: %s", username, e)
+
     def _calculate_personalized_match_score(self, project, user_profile):
-        """个性化匹配分数计算（改进版）"""
-        # 更稳定、可解释的打分：将多维特征按标准化权重线性组合，减少极端随机性
-        project_domain = project.get('domain', 'general')
-
-        # 技能匹配：计算用户技能与项目语言/标签/相关技能的覆盖率（0-1）
-        project_tags = set([t.lower() for t in project.get('tags', [])])
-        project_lang = (project.get('language') or '').lower()
-        skill_score = 0.0
-        skill_weight_sum = 0.0
-        for skill, strength in user_profile.get('skills', {}).items():
-            w = float(strength)
-            if w <= 0:
-                continue
-            skill_weight_sum += w
-            s = 0.0
-            if skill.lower() == project_lang and project_lang:
-                s = 1.0
-            elif skill.lower() in project_tags:
-                s = 0.9
-            elif skill in self.skill_graph:
-                related = [rs.lower() for rs in self.skill_graph[skill].get('related', [])]
-                if any(r in project_tags for r in related):
-                    s = 0.6
-            skill_score += w * s
-        skill_match = (skill_score / skill_weight_sum) if skill_weight_sum > 0 else 0.0
-
-        # 领域匹配：核心领域得分更高
-        domain_match = 0.0
-        if project_domain in user_profile.get('domains', []):
-            if user_profile.get('domains', [None])[0] == project_domain:
-                domain_match = 1.0
-            else:
-                domain_match = 0.4
+        """个性化匹配分数计算（改进版），见 scoring.calculate_match_score"""
+        return calculate_match_score(project, user_profile, self.skill_graph)
 
-        # 难度适配：基于经验等级匹配程度（0-1）
-        difficulty_map = {
-            'beginner': {'beginner': 1.0, 'intermediate': 0.6, 'advanced': 0.2},
-            'intermediate': {'beginner': 0.6, 'intermediate': 1.0, 'advanced': 0.6},
-            'advanced': {'beginner': 0.2, 'intermediate': 0.6, 'advanced': 1.0}
-        }
-        difficulty_score = difficulty_map.get(user_profile.get('experience_level', 'intermediate'), {}).get(
-            project.get('difficulty', 'intermediate'), 0.6)
-
-        # 项目质量：归一化 openrank/activity (均假定0-100)，stars 使用 log1p 缩放
-        openrank = float(project.get('openrank') or 70.0)
-        activity = float(project.get('activity') or 70.0)
-        stars = float(project.get('stars') or 1000)
-        stars_scaled = (np.log1p(stars) / np.log1p(100000))  # 大致归一到 0-1
-        quality_score = (0.6 * (openrank / 100.0) + 0.4 * (activity / 100.0)) * 0.8 + stars_scaled * 0.2
-
-        # top_300 小幅加分
-        top300_bonus = 0.03 if project.get('source') == 'top_300' else 0.0
-
-        # 线性组合（各项均为 0-1 范围），给出原始分数（0-100）供外部归一
-        weights = {
-            'skill': 0.45 * user_profile.get('exp_weight', 1.0),
-            'domain': 0.2 * user_profile.get('contrib_weight', 1.0),
-            'difficulty': 0.15,
-            'quality': 0.15 * user_profile.get('activity_weight', 1.0)
-        }
+    def _calculate_quality_score(self, project):
+        """项目质量分（0-1，与用户无关）"""
+        return calculate_quality_score(project)
+
+    def _calculate_static_prior(self, project):
+        """与用户无关的打分部分（质量 + top_300 加分）"""
+        return calculate_static_prior(project)
 
-        raw = (
-            skill_match * weights['skill'] +
-            domain_match * weights['domain'] +
-            difficulty_score * weights['difficulty'] +
-            quality_score * weights['quality'] +
-            top300_bonus
-        )
+    def _diversity_depth(self, page_size, max_pages=1):
+        """打分阶段每个多样性分组需要保留的候选数"""
+        depth = page_size * max_pages
+        return depth * self.diversity_oversample if self.diversity_quotas else depth
 
-        # 扩展到 0-100 量表并返回浮点数
-        return float(raw * 100.0)
+    def _diversity_pages(self, recommendations, user_profile, page_size=8, depth=None, presorted=False):
+        """候选 -> 逐页套用多样性规则的分页器（见 result_pages.RankedPages）；presorted 表示已按分数降序"""
+        return RankedPages(recommendations, user_profile['core_domain'],
+                           top300_quota=getattr(self, 'max_top300_per_user', 3), page_size=page_size,
+                           depth=depth, quotas=self.diversity_quotas, presorted=presorted)
 
     def _ensure_absolute_diversity(self, recommendations, user_profile, top_n=8):
-        """多样性过滤（改进版，优先推荐top_300项目）"""
-        core_domain = user_profile['core_domain']
-        
-        # 分离不同类型的项目
-        core_top300 = [p for p in recommendations if p.get('domain') == core_domain and p.get('source') == 'top_300']
-        other_top300 = [p for p in recommendations if p.get('domain') != core_domain and p.get('source') == 'top_300']
-        core_standard = [p for p in recommendations if p.get('domain') == core_domain and p.get('source') != 'top_300']
-        other_standard = [p for p in recommendations if p.get('domain') != core_domain and p.get('source') != 'top_300']
-        
-        final_recommendations = []
-        seen_repos = set()
-        
-        # 策略：优先选择 top_300 项目，但对每用户数量设上限 self.max_top300_per_user
-        top300_selected = 0
-        core_top300_sorted = sorted(core_top300, key=lambda x: x['total_score'], reverse=True)
-        for proj in core_top300_sorted:
-            if top300_selected >= getattr(self, 'max_top300_per_user', 3):
-                break
-            if proj.get('repo') not in seen_repos and len(final_recommendations) < top_n:
-                final_recommendations.append(proj)
-                seen_repos.add(proj.get('repo'))
-                top300_selected += 1
-
-        other_top300_sorted = sorted(other_top300, key=lambda x: x['total_score'], reverse=True)
-        for proj in other_top300_sorted:
-            if top300_selected >= getattr(self, 'max_top300_per_user', 3):
-                break
-            if proj.get('repo') not in seen_repos and len(final_recommendations) < top_n:
-                final_recommendations.append(proj)
-                seen_repos.add(proj.get('repo'))
-                top300_selected += 1
-        
-        # 3. 如果还需要更多，加核心领域的标准项目
-        if len(final_recommendations) < top_n:
-            core_standard_sorted = sorted(core_standard, key=lambda x: x['total_score'], reverse=True)
-            for proj in core_standard_sorted:
-                if proj.get('repo') not in seen_repos and len(final_recommendations) < top_n:
-                    final_recommendations.append(proj)
-                    seen_repos.add(proj.get('repo'))
-        
-        # 4. 如果还需要更多，加其他领域的标准项目
-        if len(final_recommendations) < top_n:
-            other_standard_sorted = sorted(other_standard, key=lambda x: x['total_score'], reverse=True)
-            for proj in other_standard_sorted:
-                if proj.get('repo') not in seen_repos and len(final_recommendations) < top_n:
-                    final_recommendations.append(proj)
-                    seen_repos.add(proj.get('repo'))
-        
-        # 最终排序（按分数降序）
-        final_recommendations = sorted(final_recommendations, key=lambda x: x['total_score'], reverse=True)
-        
-        final_domains = set([proj.get('domain', 'general') for proj in final_recommendations[:top_n]])
-        top300_count = sum(1 for proj in final_recommendations[:top_n] if proj.get('source') == 'top_300')
-        print(f"[多样性] 推荐结果包含 {len(final_domains)} 个不同领域: {final_domains} (核心领域: {core_domain}), {top300_count} 个top_300项目")
-        
-        return final_recommendations[:top_n]
+        """
+        多样性过滤（改进版，优先推荐top_300项目），单次遍历 + 分层惰性堆，见 diversity.DiversitySelector
+        策略：优先选择 top_300 项目（先核心领域后其他领域），对每用户数量设上限 self.max_top300_per_user；
+        其余名额依次由核心领域、其他领域的标准项目补足，同时满足 self.diversity_quotas；最终按分数降序
+        """
+        final_recommendations = self._diversity_pages(recommendations, user_profile, top_n).page(0)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            core_domain = user_profile['core_domain']
+            final_domains = set([proj.get('domain', 'general') for proj in final_recommendations[:top_n]])
+            top300_count = sum(1 for proj in final_recommendations[:top_n] if proj.get('source') == 'top_300')
+            logger.debug("[多样性] 推荐结果包含 %d 个不同领域: %s (核心领域: %s), %d 个top_300项目",
+                         len(final_domains), final_domains, core_domain, top300_count)
+        
+        return final_recommendations
 
     def _build_large_candidate_pool(self):
         """构建候选池（整合top_300项目）"""
-        print("\n📊 构建大规模候选项目池（整合top_300项目库）...")
+        logger.info("[候选池] 构建大规模候选项目池（整合top_300项目库）")
         
         # 缓存检查：优先重用最近的候选池，避免每次重新构建造成大量网络请求
-        if os.path.exists(self.large_candidate_cache):
-            cache_time = os.path.getmtime(self.large_candidate_cache)
-            if time.time() - cache_time < 3 * 24 * 3600:
-                try:
-                    with open(self.large_candidate_cache, 'r', encoding='utf-8') as f:
-                        candidate_pool = json.load(f)
-                    print(f"✅ 从缓存加载候选池（{len(candidate_pool)}个项目）")
-                    return candidate_pool
-                except Exception as e:
-                    print(f"⚠️  候选池缓存加载失败，重新构建: {e}")
+        # （top_300 导出在缓存之后被刷新时重新构建）
+        cached = self.cache.load(self.large_candidate_cache, 3 * 24 * 3600)
+        if cached is not None and cached[1] >= self.top300_data_mtime():
+            candidate_pool = cached[0]
+            logger.info("[候选池] 从缓存加载候选池（%d个项目）", len(candidate_pool))
+            return candidate_pool
         
         # 原始候选池数据（103个项目）
         candidate_pool = {}
@@ -989,7 +1196,7 @@ class SmartRepoRecommender:
         candidate_pool.update(other_projects)
         
         # 新增：添加top_300项目到候选池（作为组织项目）
-        print(f"[整合] 添加 {len(self.top300_projects)} 个top_300项目到候选池...")
+        logger.info("[整合] 添加 %d 个top_300项目到候选池", len(self.top300_projects))
         
         for key, top300_info in self.top300_projects.items():
             # 根据项目类型处理
@@ -1015,6 +1222,7 @@ class SmartRepoRecommender:
                     # 如果不在候选池中，则创建新条目
                     # 尝试推断语言和领域
                     language, domain, tags = self._infer_repo_attributes(repo_name)
+                    rng = _seeded_rng('pool', repo_name)
                     
                     # 创建项目条目
                     candidate_pool[repo_name] = {
@@ -1023,10 +1231,10 @@ class SmartRepoRecommender:
                         'tags': tags,
                         'difficulty': 'intermediate',  # 默认中等难度
                         'domain': domain,
-                        'activity': top300_info.get('activity', random.uniform(50, 90)),
-                        'openrank': top300_info.get('openrank', random.uniform(60, 90)),
-                        'stars': top300_info.get('stars', random.randint(1000, 100000)),
-                        'forks': top300_info.get('forks', random.randint(100, 10000)),
+                        'activity': top300_info.get('activity', rng.uniform(50, 90)),
+                        'openrank': top300_info.get('openrank', rng.uniform(60, 90)),
+                        'stars': top300_info.get('stars', rng.randint(1000, 100000)),
+                        'forks': top300_info.get('forks', rng.randint(100, 10000)),
                         'contributors': 0,  # 稍后计算
                         'source': 'top_300'
                     }
@@ -1037,6 +1245,7 @@ class SmartRepoRecommender:
                 
                 # 推断组织的主要领域
                 language, domain, tags = self._infer_org_attributes(org_name)
+                rng = _seeded_rng('pool', org_repo_name)
                 
                 # 创建组织项目条目
                 candidate_pool[org_repo_name] = {
@@ -1045,10 +1254,10 @@ class SmartRepoRecommender:
                     'tags': tags,
                     'difficulty': 'intermediate',
                     'domain': domain,
-                    'activity': top300_info.get('activity', random.uniform(50, 90)),
-                    'openrank': top300_info.get('openrank', random.uniform(60, 90)),
-                    'stars': top300_info.get('stars', random.randint(1000, 100000)),
-                    'forks': top300_info.get('forks', random.randint(100, 10000)),
+                    'activity': top300_info.get('activity', rng.uniform(50, 90)),
+                    'openrank': top300_info.get('openrank', rng.uniform(60, 90)),
+                    'stars': top300_info.get('stars', rng.randint(1000, 100000)),
+                    'forks': top300_info.get('forks', rng.randint(100, 10000)),
                     'contributors': 0,
                     'source': 'top_300',
                     'is_organization': True,
@@ -1056,16 +1265,17 @@ class SmartRepoRecommender:
                 }
         
         # 补充指标（对于没有top_300数据的项目）
-        print(f"📥 为{len(candidate_pool)}个项目补充指标...")
+        logger.info("[候选池] 为%d个项目补充指标", len(candidate_pool))
         enriched_pool = {}
         batch_size = 10
         repo_list = list(candidate_pool.keys())
         
         for i in range(0, len(repo_list), batch_size):
             batch = repo_list[i:i+batch_size]
-            print(f"🔄 处理批次 {i//batch_size + 1}/{(len(repo_list) + batch_size - 1)//batch_size}")
+            logger.debug("[候选池] 处理批次 %d/%d", i // batch_size + 1, (len(repo_list) + batch_size - 1) // batch_size)
             
             for repo_full_name in batch:
+                rng = _seeded_rng('enrich', repo_full_name)
                 try:
                     enriched_pool[repo_full_name] = candidate_pool[repo_full_name].copy()
                     enriched_pool[repo_full_name]['repo'] = repo_full_name
@@ -1074,15 +1284,15 @@ class SmartRepoRecommender:
                     if enriched_pool[repo_full_name].get('is_organization', False):
                         # 为组织项目设置默认值
                         if 'activity' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['activity'] is None or enriched_pool[repo_full_name]['activity'] <= 0:
-                            enriched_pool[repo_full_name]['activity'] = random.uniform(50, 90)
+                            enriched_pool[repo_full_name]['activity'] = rng.uniform(50, 90)
                         if 'openrank' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['openrank'] is None or enriched_pool[repo_full_name]['openrank'] <= 0:
-                            enriched_pool[repo_full_name]['openrank'] = random.uniform(60, 90)
+                            enriched_pool[repo_full_name]['openrank'] = rng.uniform(60, 90)
                         if 'stars' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['stars'] is None or enriched_pool[repo_full_name]['stars'] <= 0:
-                            enriched_pool[repo_full_name]['stars'] = random.randint(1000, 100000)
+                            enriched_pool[repo_full_name]['stars'] = rng.randint(1000, 100000)
                         if 'contributors' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['contributors'] is None or enriched_pool[repo_full_name]['contributors'] <= 0:
-                            enriched_pool[repo_full_name]['contributors'] = random.randint(10, 5000)
+                            enriched_pool[repo_full_name]['contributors'] = rng.randint(10, 5000)
                         if 'forks' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['forks'] is None or enriched_pool[repo_full_name]['forks'] <= 0:
-                            enriched_pool[repo_full_name]['forks'] = random.randint(100, 10000)
+                            enriched_pool[repo_full_name]['forks'] = rng.randint(100, 10000)
                         continue
                     
                     # 如果项目已经有top_300数据，则跳过API调用
@@ -1091,12 +1301,12 @@ class SmartRepoRecommender:
                     
                     if needs_openrank:
                         openrank_data = self._fetch_opendigger_metric_with_retry(repo_full_name, "openrank")
-                        openrank_value = self._calculate_opendigger_metric(openrank_data, "openrank")
+                        openrank_value = self._calculate_opendigger_metric(openrank_data, "openrank", repo_full_name)
                         enriched_pool[repo_full_name]['openrank'] = openrank_value
                     
                     if needs_activity:
                         activity_data = self._fetch_opendigger_metric_with_retry(repo_full_name, "activity")
-                        activity_value = self._calculate_opendigger_metric(activity_data, "activity")
+                        activity_value = self._calculate_opendigger_metric(activity_data, "activity", repo_full_name)
                         enriched_pool[repo_full_name]['activity'] = activity_value
                     
                     # 获取GitHub指标
@@ -1118,40 +1328,104 @@ class SmartRepoRecommender:
                             'AI': 85, '数据': 80, '前端': 75, '后端': 78, 
                             '大数据': 82, 'DevOps': 70, '系统': 72, '工具': 65, 'general': 70
                         }
-                        enriched_pool[repo_full_name]['openrank'] = domain_openrank.get(domain_val, 70) + random.uniform(-5, 5)
+                        enriched_pool[repo_full_name]['openrank'] = domain_openrank.get(domain_val, 70) + rng.uniform(-5, 5)
                     
                     if enriched_pool[repo_full_name]['activity'] is None or enriched_pool[repo_full_name]['activity'] <= 0:
-                        enriched_pool[repo_full_name]['activity'] = random.uniform(50, 90)
+                        enriched_pool[repo_full_name]['activity'] = rng.uniform(50, 90)
                         
                 except Exception as e:
-                    print(f"[指标补充] 失败 {repo_full_name}: {e}")
+                    logger.warning("[指标补充] 失败 %s: %s", repo_full_name, e)
                     enriched_pool[repo_full_name] = candidate_pool[repo_full_name].copy()
                     enriched_pool[repo_full_name]['repo'] = repo_full_name
                     
                     # 设置默认值
                     if 'openrank' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['openrank'] is None or enriched_pool[repo_full_name]['openrank'] <= 0:
-                        enriched_pool[repo_full_name]['openrank'] = random.uniform(60, 90)
+                        enriched_pool[repo_full_name]['openrank'] = rng.uniform(60, 90)
                     if 'activity' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['activity'] is None or enriched_pool[repo_full_name]['activity'] <= 0:
-                        enriched_pool[repo_full_name]['activity'] = random.uniform(50, 90)
+                        enriched_pool[repo_full_name]['activity'] = rng.uniform(50, 90)
                     if 'stars' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['stars'] is None or enriched_pool[repo_full_name]['stars'] <= 0:
-                        enriched_pool[repo_full_name]['stars'] = random.randint(1000, 100000)
+                        enriched_pool[repo_full_name]['stars'] = rng.randint(1000, 100000)
                     if 'contributors' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['contributors'] is None or enriched_pool[repo_full_name]['contributors'] <= 0:
-                        enriched_pool[repo_full_name]['contributors'] = random.randint(10, 5000)
+                        enriched_pool[repo_full_name]['contributors'] = rng.randint(10, 5000)
                     if 'forks' not in enriched_pool[repo_full_name] or enriched_pool[repo_full_name]['forks'] is None or enriched_pool[repo_full_name]['forks'] <= 0:
-                        enriched_pool[repo_full_name]['forks'] = random.randint(100, 10000)
+                        enriched_pool[repo_full_name]['forks'] = rng.randint(100, 10000)
         
         # 保存缓存
         try:
-            with open(self.large_candidate_cache, 'w', encoding='utf-8') as f:
-                json.dump(enriched_pool, f, ensure_ascii=False, indent=2)
-            print(f"✅ 候选池已保存到缓存: {self.large_candidate_cache}")
+            self.cache.dump(self.large_candidate_cache, enriched_pool)
+            logger.info("[候选池] 已保存到缓存: %s", self.large_candidate_cache)
         except Exception as e:
-            print(f"⚠️  保存缓存失败: {e}")
+            logger.warning("[候选池] 保存缓存失败: %s", e)
         
-        print(f"✅ 候选池构建完成（{len(enriched_pool)}个项目，包含 {len(self.top300_projects)} 个top_300项目）")
+        logger.info("[候选池] 构建完成（%d个项目，包含 %d 个top_300项目）", len(enriched_pool), len(self.top300_projects))
         return enriched_pool
 
-    def _infer_repo_attributes(self, repo_name):
+    def _merge_bulk_snapshot(self, candidate_pool):
+        """
+        并入批量导入的候选池快照（已存在的仓库保留原条目）。
+        快照由 bulk_ingest.py 按「每行一个 "repo": {...} 条目」写出，这里逐行解析，不把整个文件读入内存；
+        快照内同一仓库出现多次时以最后一次为准
+        """
+        if not os.path.exists(self.bulk_candidate_snapshot):
+            return
+        bulk_repos = set()
+        try:
+            with open(self.bulk_candidate_snapshot, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, 1):
+                    line = line.strip().rstrip(',')
+                    if line in ('', '{', '}', '{}'):
+                        continue
+                    try:
+                        (repo, project), = json.loads('{' + line + '}').items()
+                    except ValueError:
+                        project = None
+                    if not isinstance(project, dict):
+                        logger.warning("[候选池] 批量快照第 %d 行无法解析，已跳过", line_no)
+                        continue
+                    if repo in candidate_pool and repo not in bulk_repos:
+                        continue
+                    # 旧版本快照中缺失的指标为 null
+                    for field in ('activity', 'openrank', 'stars', 'forks', 'contributors'):
+                        if project.get(field) is None:
+                            project[field] = 0
+                    candidate_pool[repo] = project
+                    bulk_repos.add(repo)
+        except Exception as e:
+            logger.warning("[候选池] 批量快照加载失败: %s", e)
+        logger.info("[候选池] 并入批量快照 %d 个项目", len(bulk_repos))
+
+    def _load_embedding_index(self):
+        """加载候选向量索引：缓存比候选池新且仓库一致时直接加载，否则重建并保存"""
+        pool_repos = list(self.large_candidate_pool.keys())
+        if self.pool_artifact is not None:
+            # 离线产物只读：优先使用产物中的向量，缺失时在内存中构建（不写缓存）
+            features = self.pool_artifact.features
+            if 'embedding_vectors' in features and features['embedding_vectors'].shape[1] == self.embedder.dim:
+                return LSHIndex(features['embedding_vectors'], pool_repos, planes=features.get('embedding_planes'),
+                                bucket_order=features.get('embedding_bucket_order'),
+                                sorted_codes=features.get('embedding_sorted_codes'))
+            return LSHIndex.build(self.large_candidate_pool, self.embedder)
+        if os.path.exists(self.embedding_index_cache):
+            try:
+                pool_mtime = self.cache.stored_at(self.large_candidate_cache) or 0
+                if os.path.getmtime(self.embedding_index_cache) >= pool_mtime:
+                    index = LSHIndex.load(self.embedding_index_cache)
+                    if index.repos == pool_repos and index.vectors.shape[1] == self.embedder.dim:
+                        logger.info("[向量索引] 从缓存加载（%d个项目）", len(index))
+                        return index
+            except Exception as e:
+                logger.warning("[向量索引] 缓存加载失败，重新构建: %s", e)
+        
+        index = LSHIndex.build(self.large_candidate_pool, self.embedder)
+        try:
+            index.save(self.embedding_index_cache)
+        except Exception as e:
+            logger.warning("[向量索引] 保存缓存失败: %s", e)
+        logger.info("[向量索引] 构建完成（%d个项目）", len(index))
+        return index
+
+    @staticmethod
+    def _infer_repo_attributes(repo_name):
         """从仓库名推断语言、领域和标签"""
         repo_lower = repo_name.lower()
         
@@ -1249,91 +1523,219 @@ class SmartRepoRecommender:
         
         return language, domain, tags
 
-    def generate_recommendation(self, username, top_n=8):
-        """生成推荐"""
-        print(f"👤 开始分析用户: {username}")
+    def _cf_user_vector(self, username):
+        """协同过滤用户向量（未加载模型、用户不在训练集且无可用交互时为 None）"""
+        if self.cf_scorer is None:
+            return None
+        if self.cf_scorer.known(username):
+            return self.cf_scorer.user_vector(username)
+        if not self.cf_fold_in_starred:
+            return None
+        if deadline_expired():
+            mark_degraded('时间预算耗尽，跳过协同过滤 fold-in')
+            return None
+        return self.cf_scorer.user_vector(username, starred_repos(self, username))
+
+    def _score_candidates(self, user_profile, top_n=8, cf_vector=None):
+        """
+        单进程打分：召回候选后在列式候选池上向量化计算匹配分，按排名映射 total_score，
+        返回按排名排序的候选（每个多样性分组的前 top_n，足够多样性过滤使用）
+        """
+        table = self.candidate_table
+        # 召回：只对命中用户技能/领域的候选、向量近邻（及高质量补充候选）打分
+        if self.retrieval_limit is None:
+            rows = np.arange(len(table))
+        else:
+            ann_repos = []
+            if self.ann_neighbors and deadline_expired():
+                mark_degraded('时间预算耗尽，跳过向量近邻召回')
+            elif self.ann_neighbors:
+                ann_repos = self.embedding_index.query(self.embedder.embed_profile(user_profile), k=self.ann_neighbors)
+            rows = np.asarray(self.candidate_index.retrieve_ids(
+                user_profile, limit=self.retrieval_limit, backfill=self.retrieval_backfill,
+                source_backfill=self.retrieval_source_backfill, extra_repos=ann_repos), dtype=np.int64)
+        logger.debug("[召回] %d/%d 个候选进入打分", len(rows), len(table))
+        if len(rows) == 0:
+            return []
         
-        # 分析用户画像
-        user_profile = self._analyze_user_profile(username)
-        print(f"✅ 用户分析完成: {username}")
+        raws = table.score(user_profile, self.skill_graph, rows, cf_vector=cf_vector)
         
-        print(f"🎯 为用户 {username} 生成推荐...")
+        # 统一归一化：使用基于排名的映射，避免 min-max 对边界的依赖
+        # 原始分降序排列（同分保持候选池顺序），根据排名线性映射到 60.1-98.9（最高分 -> 98.9）
+        # 排名刻度按整个候选池计算（未召回的候选视为排在末尾），召回前后分数可比
+        n = max(len(rows), len(table))
+        order = np.lexsort((rows, -raws))
+        ranked_rows = rows[order]
+        buckets = table.bucket_ids(user_profile.get('core_domain'), ranked_rows)
+        scored_projects = []
+        for idx in top_k_per_bucket(buckets, top_n):
+            p = table.row(int(ranked_rows[idx]))
+            p['total_score'] = rank_to_total_score(int(idx), n)
+            scored_projects.append(p)
+        return scored_projects
+
+    def generate_recommendation(self, username, top_n=8, deadline=None):
+        """
+        生成推荐
+        deadline: 请求级时间预算（deadline.Deadline），预算耗尽时各阶段降级为缓存/默认值，
+                  阶段耗时与降级记录写入该对象（deadline.report() 随响应返回）
+        """
+        return self.generate_ranked_pages(username, page_size=top_n, max_pages=1, deadline=deadline).page(0)
+
+    def generate_ranked_pages(self, username, page_size=8, max_pages=5, deadline=None):
+        """
+        生成可分页的推荐结果（result_pages.RankedPages）：每个多样性分组保留前 page_size × max_pages 个候选，
+        page(i) 在剩余候选上逐页套用多样性规则，翻页无需重新分析画像与打分；page(0) 即 generate_recommendation 的结果
+        """
+        with use_deadline(deadline):
+            logger.info("[画像] 开始分析用户: %s", username)
+            with stage('profile_cache'):
+                user_profile = self._load_cached_profile(username)
+            if user_profile is not None:
+                return self._score_cached_profile(username, user_profile, page_size, max_pages)
+            with stage('profile_fetch'):
+                user_repos = self._get_user_repos(username)
+            return self._recommend_from_repos(username, user_repos, page_size, max_pages)
+
+    async def generate_recommendation_async(self, username, top_n=8, executor=None, deadline=None):
+        """
+        生成推荐（异步）：GitHub 请求走异步客户端，画像分析与打分等 CPU 计算放到 executor
+        （None 为事件循环默认线程池）中执行，不阻塞事件循环；deadline 同 generate_recommendation
+        """
+        pages = await self.generate_ranked_pages_async(
+            username, page_size=top_n, max_pages=1, executor=executor, deadline=deadline)
+        return pages.page(0)
+
+    async def generate_ranked_pages_async(self, username, page_size=8, max_pages=5, executor=None, deadline=None):
+        """generate_ranked_pages 的异步版本（同 generate_recommendation_async）"""
+        with use_deadline(deadline):
+            logger.info("[画像] 开始分析用户: %s", username)
+            loop = asyncio.get_running_loop()
+            with stage('profile_cache'):
+                # 缓存后端可能是阻塞的网络存储，放到线程中读取（to_thread 会传递上下文）
+                user_profile = await asyncio.to_thread(self._load_cached_profile, username)
+            # run_in_executor 不会自动传递 contextvars，显式复制以保留请求ID、时间预算等上下文
+            if user_profile is not None:
+                ctx = contextvars.copy_context()
+                return await loop.run_in_executor(executor, functools.partial(
+                    ctx.run, self._score_cached_profile, username, user_profile, page_size, max_pages))
+            with stage('profile_fetch'):
+                user_repos = await self._get_user_repos_async(username)
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(executor, functools.partial(
+                ctx.run, self._recommend_from_repos, username, user_repos, page_size, max_pages))
+
+    def _score_cached_profile(self, username, user_profile, page_size, max_pages=1):
+        with stage('scoring'):
+            return self._recommend_for_profile(username, user_profile, page_size, max_pages)
+
+    def _recommend_from_repos(self, username, user_repos, page_size, max_pages=1):
+        # 仓库数据缺失（含预算耗尽时跳过拉取）时画像退回基于用户名哈希的默认偏好
+        with stage('profile'):
+            user_profile = self._build_user_profile(username, user_repos)
+        with stage('scoring'):
+            return self._recommend_for_profile(username, user_profile, page_size, max_pages)
+
+    def _recommend_for_profile(self, username, user_profile, page_size, max_pages=1):
+        """对已分析的用户画像打分，返回逐页做多样性过滤的分页器"""
+        logger.info("[推荐] 为用户 %s 生成推荐", username)
+        
+        # 每个多样性分组保留的候选数：足够 max_pages 页各取满 page_size 个
+        depth = self._diversity_depth(page_size, max_pages)
+        cf_vector = self._cf_user_vector(username)
+        if self.sharded_scorer is not None:
+            scored_projects = self.sharded_scorer.score(user_profile, depth, cf_vector=cf_vector)
+        else:
+            scored_projects = self._score_candidates(user_profile, depth, cf_vector=cf_vector)
         
-        # 计算匹配分数（先收集原始分数，后做 min-max 归一化）
-        raw_scored = []
-        for repo, proj in self.large_candidate_pool.items():
-            try:
-                raw = self._calculate_personalized_match_score(proj, user_profile)
-                proj_copy = proj.copy()
-                proj_copy['_raw_score'] = raw
-                raw_scored.append(proj_copy)
-            except Exception as e:
-                print(f"[得分计算] 失败 {repo}: {e}")
-                proj_copy = proj.copy()
-                proj_copy['_raw_score'] = random.uniform(0, 100)
-                raw_scored.append(proj_copy)
+        # 多样性过滤（优先top_300项目），按页增量进行
+        pages = self._diversity_pages(scored_projects, user_profile, page_size, depth=depth, presorted=True)
+        logger.info("[推荐] 为用户 %s 生成 %d 个推荐", username, len(pages.page(0)))
+        return pages
 
-        # 统一归一化：使用基于排名的映射，避免 min-max 对边界的依赖
-        # 将原始分按降序排序，然后根据排名线性映射到 60.1-98.9（最高分 -> 98.9）
-        n = len(raw_scored)
-        if n == 0:
+    def _user_components(self, username, user_profile):
+        """用户对全部候选的各打分分量（CandidateTable.component_scores），画像不变时复用缓存"""
+        key = username.lower()
+        with self._component_lock:
+            cached = self._component_cache.get(key)
+            if cached is not None and cached[0] == user_profile:
+                self._component_cache.move_to_end(key)
+                return cached[1]
+        components = self.candidate_table.component_scores(user_profile, self.skill_graph,
+                                                           cf_vector=self._cf_user_vector(username))
+        with self._component_lock:
+            self._component_cache[key] = (copy.deepcopy(user_profile), components)
+            self._component_cache.move_to_end(key)
+            while len(self._component_cache) > self.component_cache_size:
+                self._component_cache.popitem(last=False)
+        return components
+
+    def rerank(self, username, weights=None, top_n=8, user_profile=None):
+        """
+        按自定义权重重排（调参 / A/B 权重试验）：各打分分量每个用户只计算一次，
+        之后每组权重只需对每个候选做一次加权求和，再按排名映射 total_score 并做多样性过滤。
+        weights: 覆盖 scoring.DEFAULT_WEIGHTS 中的部分或全部分量（未知分量抛出 ValueError）
+        user_profile: 为 None 时依次使用画像缓存、本进程已分析的画像，都没有时联网分析
+        对整个候选池打分（不经过召回），默认权重下与 retrieval_limit=None 时的 generate_recommendation 一致；
+        返回的候选附带 component_scores（各分量原值），便于分析权重的影响
+        """
+        weights = resolve_weights(weights)
+        if user_profile is None:
+            user_profile = self._load_cached_profile(username) or self.user_profile_map.get(username)
+        if user_profile is None:
+            user_profile = self._build_user_profile(username, self._get_user_repos(username))
+        components = self._user_components(username, user_profile)
+        raws = combine_components(components, user_profile, weights)
+
+        table = self.candidate_table
+        if len(table) == 0:
             return []
-        # 按原始分降序排列（保持稳定排序）
-        raw_scored_sorted = sorted(raw_scored, key=lambda x: x.get('_raw_score', 0.0), reverse=True)
-        high = 98.9
-        low = 60.1
+        order = np.lexsort((np.arange(len(table)), -raws))
+        buckets = table.bucket_ids(user_profile.get('core_domain'), order)
         scored_projects = []
-        for idx, p in enumerate(raw_scored_sorted):
-            if n == 1:
-                mapped = (high + low) / 2.0
-            else:
-                frac = idx / float(n - 1)  # 0 for top, 1 for last
-                # invert so top (idx=0) -> frac=0 -> mapped=high
-                mapped = low + (1.0 - frac) * (high - low)
-                # shrink slightly to avoid exact boundaries
-                mapped = low + 0.001 + (1.0 - frac) * (high - low - 0.002)
-            p['total_score'] = round(mapped, 2)
-            if '_raw_score' in p:
-                del p['_raw_score']
+        for idx in top_k_per_bucket(buckets, self._diversity_depth(top_n)):
+            row = int(order[idx])
+            p = table.row(row)
+            p['total_score'] = rank_to_total_score(int(idx), len(table))
+            p['component_scores'] = {name: round(float(values[row]), 4) for name, values in components.items()}
             scored_projects.append(p)
-        
-        # 多样性过滤（优先top_300项目）
-        final_recommendations = self._ensure_absolute_diversity(scored_projects, user_profile, top_n)
-        
-        # 输出推荐结果
-        print(f"\n🏆 为 {username} 推荐的 {top_n} 个开源项目:")
-        for i, proj in enumerate(final_recommendations, 1):
-            # 检查是否是top_300项目
-            is_top300 = proj.get('source') == 'top_300'
-            source_mark = "🌟" if is_top300 else "  "
-            
-            # 对于组织项目，显示组织名
-            display_name = proj['repo']
-            if proj.get('is_organization', False):
-                org_name = proj.get('org_name', proj['repo'].split('/')[0])
-                display_name = f"{org_name} (顶级开源组织)"
-            
-            print(f"""
+        return self._ensure_absolute_diversity(scored_projects, user_profile, top_n)
+
+
+def print_recommendations(username, recommendations, top_n=8, title=None, score_fn=None):
+    """交互模式下打印推荐结果（仅 __main__ 调用）"""
+    print(title if title is not None else f"\n🏆 为 {username} 推荐的 {top_n} 个开源项目:")
+    for i, proj in enumerate(recommendations[:top_n], 1):
+        # 检查是否是top_300项目
+        is_top300 = proj.get('source') == 'top_300'
+        source_mark = "🌟" if is_top300 else "  "
+        
+        # 对于组织项目，显示组织名
+        display_name = proj['repo']
+        if proj.get('is_organization', False):
+            org_name = proj.get('org_name', proj['repo'].split('/')[0])
+            display_name = f"{org_name} (顶级开源组织)"
+        
+        score = score_fn(proj) if score_fn else proj['total_score']
+        print(f"""
 {i}. {source_mark} {display_name}
    语言: {proj.get('language', '多种')} | 难度: {proj.get('difficulty', 'intermediate')} | 领域: {proj.get('domain', 'general')}
-   匹配度: {proj['total_score']}% | OpenRank: {proj.get('openrank', 'N/A')} | 活跃度: {proj.get('activity', 'N/A')}
+   匹配度: {score}% | OpenRank: {proj.get('openrank', 'N/A')} | 活跃度: {proj.get('activity', 'N/A')}
    星数: {proj.get('stars', 'N/A'):,} | 贡献者: {proj.get('contributors', 'N/A'):,}
    标签: {', '.join(proj.get('tags', []))}
    来源: {"top_300" if is_top300 else "standard"}
-            """.strip())
-        
-        # 统计top_300项目数量
-        top300_count = sum(1 for proj in final_recommendations if proj.get('source') == 'top_300')
-        print(f"\n📊 推荐统计: 包含 {top300_count} 个top_300项目，{top_n - top300_count} 个标准项目")
-        print("-" * 60)
-        
-        return final_recommendations
+        """.strip())
+
 
 # 主程序逻辑
 if __name__ == "__main__":
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+    
     print("="*80)
     print("       开源项目智能推荐系统（整合top_300项目库版-修复匹配逻辑）")
     print("="*80)
+    print("   批量处理名单请使用: python batch_recommend.py users.txt -o recommendations.jsonl")
     
     github_token = input("   请输入GitHub Token（可选，留空则使用公开API）: ").strip()
     opendigger_key = input("   请输入OpenDigger API Key（可选）: ").strip()
@@ -1353,14 +1755,20 @@ if __name__ == "__main__":
         
         # 生成推荐
         try:
-            recommender.generate_recommendation(username, top_n=8)
+            final_recommendations = recommender.generate_recommendation(username, top_n=8)
+            print_recommendations(username, final_recommendations, top_n=8)
+            
+            # 统计top_300项目数量
+            top300_count = sum(1 for proj in final_recommendations if proj.get('source') == 'top_300')
+            print(f"\n📊 推荐统计: 包含 {top300_count} 个top_300项目，{8 - top300_count} 个标准项目")
+            print("-" * 60)
         except Exception as e:
             print(f"❌ 生成推荐时出错: {str(e)}")
             traceback.print_exc()
             print("💡 已自动降级为基础推荐模式")
             
             user_hash = int(hashlib.md5(username.encode()).hexdigest(), 16)
-            random.seed(user_hash)
+            rng = random.Random(user_hash)
             core_domains = ["AI", "前端", "后端", "DevOps", "数据"]
             core_domain = core_domains[user_hash % len(core_domains)]
             print(f"📌 降级推荐 - 核心领域: {core_domain}")
@@ -1370,28 +1778,13 @@ if __name__ == "__main__":
             domain_projects = [p for p in all_projects if p.get('domain') == core_domain]
             other_projects = [p for p in all_projects if p.get('domain') != core_domain]
             
-            random.shuffle(domain_projects)
-            random.shuffle(other_projects)
+            rng.shuffle(domain_projects)
+            rng.shuffle(other_projects)
             
             final_recs = domain_projects[:4] + other_projects[:4]
-            
-            for i, proj in enumerate(final_recs[:8], 1):
-                is_top300 = proj.get('source') == 'top_300'
-                source_mark = "🌟" if is_top300 else "  "
-                display_name = proj['repo']
-                if proj.get('is_organization', False):
-                    org_name = proj.get('org_name', proj['repo'].split('/')[0])
-                    display_name = f"{org_name} (顶级开源组织)"
-                
-                print(f"""
-{i}. {source_mark} {display_name}
-   语言: {proj.get('language', 'Unknown')} | 难度: {proj.get('difficulty', 'intermediate')} | 领域: {proj.get('domain', 'general')}
-   匹配度: {random.uniform(60, 95):.2f}% | OpenRank: {proj.get('openrank', 'N/A')} | 活跃度: {proj.get('activity', 'N/A')}
-   星数: {proj.get('stars', 'N/A'):,} | 贡献者: {proj.get('contributors', 'N/A'):,}
-   标签: {', '.join(proj.get('tags', []))}
-   来源: {"top_300" if is_top300 else "standard"}
-                """.strip())
+            print_recommendations(username, final_recs, top_n=8, title="",
+                                  score_fn=lambda proj: f"{rng.uniform(60, 95):.2f}")
             
             top300_count = sum(1 for proj in final_recs[:8] if proj.get('source') == 'top_300')
             print(f"\n📊 降级推荐统计: 包含 {top300_count} 个top_300项目")
-            print("-" * 60)
\ No newline at end of file
+            print("-" * 60)
@@ -0,0 +1,172 @@
+"""
+top_300 指标时间序列特征（向量化）
+把每个项目的 18 个 OpenDigger 月度指标对齐到统一的月份轴，构成
+(指标数, 项目数, 月份数) 的 NumPy 矩阵（缺失为 NaN），再用少量向量化运算一次性算出
+全部项目的特征：
+- recent_mean：最近 12 个有数据月份的均值（按月份排序，而不是文件中的键顺序）
+- slope：最近窗口内的线性趋势斜率（每月变化量）
+- growth：最近窗口均值相对前一个 12 个月窗口均值的增长率
+- volatility：最近窗口的变异系数（标准差 / |均值|）
+以及综合议题响应度 issue_responsiveness（0-1，越高越积极）。
+特征以 "<指标>_<特征>" 命名，缺失为 NaN，由 CandidateTable 作为列保存。
+"""
+import re
+
+import numpy as np
+
+TOP300_METRICS = (
+    'activity', 'openrank', 'attention', 'issue', 'stars', 'technical_fork', 'participants',
+    'inactive_contributors', 'bus_factor', 'issues_new', 'issues_closed', 'issue_comments',
+    'issue_response_time', 'issue_resolution_duration', 'code_change_lines', 'change_requests',
+    'change_requests_accepted', 'change_requests_reviews',
+)
+SERIES_FEATURES = ('recent_mean', 'slope', 'growth', 'volatility')
+RECENT_WINDOW = 12
+
+_MONTH_KEY = re.compile(r'^(\d{4})-(\d{1,2})$')
+
+
+def month_ordinal(key):
+    """'2023-01' -> 月序号（year*12 + month-1），不是月度键时返回 None"""
+    match = _MONTH_KEY.match(key) if isinstance(key, str) else None
+    if match is None:
+        return None
+    month = int(match.group(2))
+    return int(match.group(1)) * 12 + month - 1 if 1 <= month <= 12 else None
+
+
+def monthly_series(data):
+    """
+    指标数据 -> {月度键: 数值}
+    OpenDigger 的分布型指标（如 issue_response_time）为 {'avg': {...}, 'levels': {...}, ...}，取 avg
+    """
+    if not isinstance(data, dict):
+        return {}
+    if isinstance(data.get('avg'), dict):
+        data = data['avg']
+    return data
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def align_series(projects, metrics=TOP300_METRICS):
+    """
+    projects: [{指标名: 原始指标数据}]（每个项目一个字典）
+    返回 (values, months)：values 形状 (指标数, 项目数, 月份数)，months 为月序号数组
+    """
+    ordinals = {}  # 月度键 -> 月序号（-1 表示非月度键），每个不同的键只解析一次
+    m_parts, p_parts, ordinal_parts, value_parts = [], [], [], []
+    for p, metric_data in enumerate(projects):
+        for m, metric in enumerate(metrics):
+            series = monthly_series(metric_data.get(metric))
+            if not series:
+                continue
+            try:
+                ordinal = np.fromiter(map(ordinals.__getitem__, series), dtype=np.int64, count=len(series))
+            except KeyError:
+                for key in series:
+                    if key not in ordinals:
+                        parsed = month_ordinal(key)
+                        ordinals[key] = -1 if parsed is None else parsed
+                ordinal = np.fromiter(map(ordinals.__getitem__, series), dtype=np.int64, count=len(series))
+            try:
+                values = np.fromiter(series.values(), dtype=np.float64, count=len(series))
+            except (TypeError, ValueError):
+                values = np.array([_to_float(v) for v in series.values()], dtype=np.float64)
+            keep = (ordinal >= 0) & ~np.isnan(values)
+            ordinal_parts.append(ordinal[keep])
+            value_parts.append(values[keep])
+            m_parts.append(np.full(int(keep.sum()), m, dtype=np.int64))
+            p_parts.append(np.full(int(keep.sum()), p, dtype=np.int64))
+
+    ordinal_idx = np.concatenate(ordinal_parts) if ordinal_parts else np.empty(0, dtype=np.int64)
+    if len(ordinal_idx) == 0:
+        return np.full((len(metrics), len(projects), 0), np.nan), np.empty(0, dtype=np.int64)
+    m_idx, p_idx, vals = np.concatenate(m_parts), np.concatenate(p_parts), np.concatenate(value_parts)
+    months = np.unique(ordinal_idx)
+    values = np.full((len(metrics), len(projects), len(months)), np.nan)
+    values[m_idx, p_idx, np.searchsorted(months, ordinal_idx)] = vals
+    return values, months
+
+
+def series_features(values, months, window=RECENT_WINDOW):
+    """对齐后的矩阵 -> {特征名: 形状 (指标数, 项目数) 的数组}"""
+    observed = ~np.isnan(values)
+    # 每个观测点从末尾数起是第几个有数据的月份（1 为最近）
+    from_end = np.cumsum(observed[..., ::-1], axis=-1)[..., ::-1]
+    recent = observed & (from_end <= window)
+    previous = observed & (from_end > window) & (from_end <= 2 * window)
+    filled = np.where(observed, values, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = recent.sum(axis=-1).astype(np.float64)
+        recent_mean = np.where(recent, filled, 0.0).sum(axis=-1) / n
+        n_prev = previous.sum(axis=-1)
+        prev_mean = np.where(previous, filled, 0.0).sum(axis=-1) / n_prev
+
+        # 最小二乘斜率（x 为月序号，只用最近窗口内的点）
+        x = (months - (months[0] if len(months) else 0)).astype(np.float64)
+        sx = np.where(recent, x, 0.0).sum(axis=-1)
+        sy = np.where(recent, filled, 0.0).sum(axis=-1)
+        sxx = np.where(recent, x * x, 0.0).sum(axis=-1)
+        sxy = np.where(recent, x * filled, 0.0).sum(axis=-1)
+        denom = n * sxx - sx * sx
+        slope = np.where((n >= 2) & (denom > 0), (n * sxy - sx * sy) / denom, np.nan)
+
+        growth = np.where((n_prev > 0) & (prev_mean != 0), (recent_mean - prev_mean) / np.abs(prev_mean), np.nan)
+
+        sq_dev = np.where(recent, (filled - recent_mean[..., None]) ** 2, 0.0).sum(axis=-1)
+        std = np.sqrt(sq_dev / n)
+        volatility = np.where(recent_mean != 0, std / np.abs(recent_mean), np.nan)
+
+    return {'recent_mean': recent_mean, 'slope': slope, 'growth': growth, 'volatility': volatility}
+
+
+def issue_responsiveness(features, metrics=TOP300_METRICS):
+    """
+    议题响应度（0-1）：关闭率（issues_closed / issues_new，封顶 1）与响应速度
+    （1 / (1 + 平均响应天数 / 7)）各占一半；只有一项可用时取该项
+    """
+    mean = features['recent_mean']
+    new = mean[metrics.index('issues_new')]
+    closed = mean[metrics.index('issues_closed')]
+    response_days = mean[metrics.index('issue_response_time')]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        close_ratio = np.where(new > 0, np.clip(closed / new, 0.0, 1.0), np.nan)
+        speed = np.where(response_days >= 0, 1.0 / (1.0 + response_days / 7.0), np.nan)
+    parts = np.stack([close_ratio, speed])
+    count = (~np.isnan(parts)).sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        return np.where(count > 0, np.nansum(parts, axis=0) / count, np.nan)
+
+
+def compute_features(projects, metrics=TOP300_METRICS, window=RECENT_WINDOW):
+    """
+    projects: [{指标名: 原始指标数据}]
+    返回 {列名: 长度为项目数的 float64 数组}，列名为 "<指标>_<特征>" 及 issue_responsiveness
+    """
+    values, months = align_series(projects, metrics)
+    features = series_features(values, months, window)
+    columns = {}
+    for name in SERIES_FEATURES:
+        for m, metric in enumerate(metrics):
+            columns[f"{metric}_{name}"] = features[name][m]
+    columns['issue_responsiveness'] = issue_responsiveness(features, metrics)
+    return columns
+
+
+def trend_score(columns):
+    """
+    趋势分（0-1，0.5 为中性/无数据）：openrank 与 activity 增长率的均值经 tanh 压缩，
+    供打分作为可选的趋势分量
+    """
+    growth = np.stack([columns['openrank_growth'], columns['activity_growth']])
+    count = (~np.isnan(growth)).sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        mean_growth = np.where(count > 0, np.nansum(growth, axis=0) / np.maximum(count, 1), 0.0)
+    return 0.5 + 0.5 * np.tanh(mean_growth)
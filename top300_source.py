@@ -0,0 +1,177 @@
+"""
+top_300 指标数据源
+top_300 数据集按「项目文件夹/指标.json」组织（如 facebook_react/openrank.json），
+解压后是上万个小文件，启动时逐个 listdir/exists/open 会产生大量 inode 访问与冷盘寻道。
+除目录外，加载器也可以直接读取单个打包文件：
+- .zip：按中央目录中的本地文件头偏移排序后顺序读取，只用一个文件句柄
+- .tar / .tar.gz / .tgz / .tar.bz2 / .tar.xz：纯流式顺序读取（不回溯）
+成员路径形如 [任意前缀/]<项目文件夹>/<指标>.json，只解析 TOP300_METRICS 中的指标。
+
+发布用的 .7z 为固实压缩，标准库无法直接读取；解压一次后用 pack 打成 zip 即可：
+    python top300_source.py pack top_300_metrics -o top300_metrics.zip
+然后设置 OPENRANK_TOP300_PATH=top300_metrics.zip。
+"""
+import argparse
+import json
+import logging
+import os
+import tarfile
+import time
+import zipfile
+
+from timeseries_features import TOP300_METRICS
+
+logger = logging.getLogger(__name__)
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ARCHIVE_SUFFIXES = ('.zip',) + TAR_SUFFIXES
+# pack 写入的成员时间固定，相同内容得到相同字节
+_ZIP_DATE_TIME = (2020, 1, 1, 0, 0, 0)
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _split_member(name):
+    """成员路径 -> (项目文件夹, 指标名)，不是指标文件时返回 None"""
+    parts = name.replace('\\', '/').strip('/').split('/')
+    if len(parts) < 2 or not parts[-1].endswith('.json'):
+        return None
+    return parts[-2], parts[-1][:-len('.json')]
+
+
+def _parse(raw, name):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.debug("[Top300] 无法解析 %s", name)
+        return None
+
+
+def _iter_zip(path, metrics):
+    with zipfile.ZipFile(path) as zf:
+        # 按数据在文件中的位置顺序读取，避免来回寻道
+        for info in sorted(zf.infolist(), key=lambda info: info.header_offset):
+            parsed = None if info.is_dir() else _split_member(info.filename)
+            if parsed is not None and parsed[1] in metrics:
+                yield parsed[0], parsed[1], _parse(zf.read(info), info.filename)
+
+
+def _iter_tar(path, metrics):
+    # 'r|*' 为纯流式读取，自动识别压缩格式
+    with tarfile.open(path, 'r|*') as tf:
+        for member in tf:
+            parsed = _split_member(member.name) if member.isfile() else None
+            if parsed is not None and parsed[1] in metrics:
+                yield parsed[0], parsed[1], _parse(tf.extractfile(member).read(), member.name)
+
+
+def _iter_directory(root, metrics):
+    for folder in os.listdir(root):
+        folder_path = os.path.join(root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for metric in metrics:
+            file_path = os.path.join(folder_path, f"{metric}.json")
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    raw = f.read()
+            except FileNotFoundError:
+                continue
+            yield folder, metric, _parse(raw, file_path)
+
+
+def iter_projects(path, metrics=TOP300_METRICS):
+    """
+    遍历 top_300 数据源（目录或打包文件），产出 (项目文件夹, {指标名: 数据})；
+    缺失或无法解析的指标为 None。目录按 os.listdir 顺序，打包文件按成员首次出现的顺序
+    """
+    metrics = tuple(metrics)
+    wanted = set(metrics)
+    if os.path.isdir(path):
+        members = _iter_directory(path, metrics)
+    elif path.lower().endswith('.zip'):
+        members = _iter_zip(path, wanted)
+    elif path.lower().endswith(TAR_SUFFIXES):
+        members = _iter_tar(path, wanted)
+    else:
+        raise ValueError(f"不支持的 top_300 数据源: {path}（需为目录、.zip 或 .tar[.gz|.bz2|.xz]）")
+
+    projects = {}
+    for folder, metric, data in members:
+        projects.setdefault(folder, {})[metric] = data
+    for folder, found in projects.items():
+        yield folder, {metric: found.get(metric) for metric in metrics}
+
+
+def data_mtime(path):
+    """数据源中最新的修改时间（打包文件为文件本身的修改时间；不存在时为 0）"""
+    if not os.path.isdir(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+    latest = 0.0
+    try:
+        with os.scandir(path) as folders:
+            for folder in folders:
+                if not folder.is_dir():
+                    continue
+                latest = max(latest, folder.stat().st_mtime)
+                with os.scandir(folder.path) as files:
+                    for entry in files:
+                        latest = max(latest, entry.stat().st_mtime)
+    except OSError:
+        pass
+    return latest
+
+
+def pack_directory(root, output, compress=True):
+    """把解压后的 top_300 目录打包为 zip（按文件夹、指标排序，内容相同则字节相同），返回成员数"""
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    count = 0
+    tmp_output = f"{output}.tmp"
+    with zipfile.ZipFile(tmp_output, 'w', compression=compression) as zf:
+        for folder in sorted(os.listdir(root)):
+            folder_path = os.path.join(root, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for name in sorted(os.listdir(folder_path)):
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(folder_path, name), 'rb') as f:
+                    data = f.read()
+                info = zipfile.ZipInfo(f"{folder}/{name}", date_time=_ZIP_DATE_TIME)
+                info.compress_type = compression
+                zf.writestr(info, data)
+                count += 1
+    os.replace(tmp_output, output)
+    return count
+
+
+def main(argv=None):
+    from logging_setup import configure_logging
+    configure_logging(mode='cli')
+
+    parser = argparse.ArgumentParser(description='top_300 指标数据打包 / 读取测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+    pack = sub.add_parser('pack', help='把解压后的 top_300 目录打包为单个 zip')
+    pack.add_argument('root', help='top_300_metrics 目录')
+    pack.add_argument('-o', '--output', default='top300_metrics.zip', help='输出文件（默认 top300_metrics.zip）')
+    pack.add_argument('--store', action='store_true', help='不压缩（读取最快，体积较大）')
+    scan = sub.add_parser('scan', help='读取数据源并统计项目数与耗时')
+    scan.add_argument('path', help='目录或打包文件')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        count = pack_directory(args.root, args.output, compress=not args.store)
+        print(f"已写入 {args.output}（{count} 个指标文件，{os.path.getsize(args.output) / 1024 / 1024:.1f}MB）")
+    else:
+        started = time.perf_counter()
+        projects = sum(1 for _ in iter_projects(args.path))
+        print(f"{projects} 个项目，耗时 {time.perf_counter() - started:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()